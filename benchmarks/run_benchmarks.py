@@ -0,0 +1,302 @@
+# Benchmarks - RoboJar Automation
+# State transitions, log_state_change, API latency and fullTest, no Pi needed
+#
+#   python benchmarks/run_benchmarks.py                       # everything, results in benchmark_results.json
+#   python benchmarks/run_benchmarks.py --quick --only transitions,api
+#   python benchmarks/run_benchmarks.py --baseline old.json --threshold 0.2   # exit 1 on a regression
+
+import argparse
+import asyncio
+import csv
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+SRC_DIR = Path(__file__).resolve().parent.parent / "src"
+
+SUITES = ("transitions", "logging", "api", "fulltest")
+LOG_SIZES = (1_000, 10_000, 100_000, 1_000_000)
+QUICK_LOG_SIZES = (1_000, 10_000)
+CONCURRENCY = (1, 8, 32)
+ROUNDS = 5            # transition runs, the fastest one counts
+SERVO_TRAVEL = 0.01   # seconds, so /valve measures the stack rather than a real servo
+
+
+def summarize(samples: list, elapsed: float = None) -> dict:
+    """Latency percentiles in microseconds from per-operation seconds"""
+    ordered = sorted(samples)
+    n = len(ordered)
+
+    def pct(p):
+        return ordered[min(n - 1, int(p * n))] * 1e6
+
+    result = {
+        "count": n,
+        "mean_us": statistics.fmean(ordered) * 1e6,
+        "p50_us": pct(0.50),
+        "p95_us": pct(0.95),
+        "p99_us": pct(0.99),
+        "max_us": ordered[-1] * 1e6,
+    }
+    if elapsed:
+        result["per_s"] = n / elapsed
+    return result
+
+
+# Benchmarks
+
+def bench_transitions(quick: bool) -> dict:
+    """Events per second through the real machines, log hooks included. Best of ROUNDS"""
+    from controls.Valve_State_Machine import CreateValveStateMachine, ValveState
+    from controls.Pump_State_Machine import CreatePumpStateMachine, PumpState
+    from controls.Logging_System import flush_logs
+
+    n = 10_000 if quick else 50_000
+    cycles = {
+        "valve": (CreateValveStateMachine("Bench Valve"),
+                  (ValveState.OPENING, ValveState.OPEN, ValveState.CLOSING, ValveState.CLOSED)),
+        "pump": (CreatePumpStateMachine("Bench Pump"),
+                 (PumpState.PRIMING, PumpState.RUNNING, PumpState.IDLE)),
+    }
+    results = {}
+    for name, (machine, events) in cycles.items():
+        events = [events[i % len(events)] for i in range(n)]
+        on_event = machine.on_event
+        elapsed = float("inf")
+        for _ in range(ROUNDS):
+            start = time.perf_counter()
+            for event in events:
+                on_event(event)
+            elapsed = min(elapsed, time.perf_counter() - start)
+            flush_logs()   # each round starts with an empty log queue
+        results[f"transitions.{name}"] = {"count": n, "per_s": n / elapsed, "mean_us": elapsed / n * 1e6}
+    return results
+
+
+def write_log(path: Path, rows: int) -> None:
+    with path.open("w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Time", "Name", "Status", "Notes"])
+        stamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        for i in range(rows):
+            writer.writerow([stamp, f"Device {i % 50}", "OPEN" if i % 2 else "CLOSED", ""])
+
+
+def bench_logging(quick: bool) -> dict:
+    """log_state_change on logs of 1k..1M rows: first call (index build) and steady state"""
+    from controls.Logging_System import log_state_change, flush_logs
+
+    calls = 2_000 if quick else 10_000
+    results = {}
+    for rows in QUICK_LOG_SIZES if quick else LOG_SIZES:
+        path = Path("Logs") / f"Bench_{rows}.csv"
+        write_log(path, rows)
+
+        start = time.perf_counter()
+        log_state_change(str(path), "Device 0", "OPEN")
+        first = time.perf_counter() - start
+
+        samples = []
+        for i in range(calls):
+            status = "OPEN" if i % 2 else "CLOSED"   # always a change, so every call appends
+            t0 = time.perf_counter()
+            log_state_change(str(path), f"Device {i % 50}", status)
+            samples.append(time.perf_counter() - t0)
+        flush_logs()
+
+        result = summarize(samples)
+        result["first_call_us"] = first * 1e6
+        results[f"log_state_change.{rows}"] = result
+        path.unlink()
+    return results
+
+
+async def run_clients(client, concurrency: int, requests: int, send) -> dict:
+    """`concurrency` clients each awaiting send(client, i) `requests` times"""
+    samples = []
+
+    async def worker(w):
+        for i in range(requests):
+            t0 = time.perf_counter()
+            response = await send(client, w * requests + i)
+            samples.append(time.perf_counter() - t0)
+            response.raise_for_status()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(w) for w in range(concurrency)))
+    return summarize(samples, time.perf_counter() - start)
+
+
+async def bench_api(app_module, client, quick: bool) -> dict:
+    """/status and /valve latency with 1..32 clients at once"""
+    requests = 50 if quick else 300
+    results = {}
+
+    async def status(client, i):
+        return await client.get("/status")
+
+    async def valve(client, i):
+        return await client.post(f"/valve/{i % 3 + 1}/{'Open' if (i // 3) % 2 else 'Close'}")
+
+    for concurrency in CONCURRENCY:
+        results[f"api.status.c{concurrency}"] = await run_clients(client, concurrency, requests, status)
+    for concurrency in CONCURRENCY:
+        results[f"api.valve.c{concurrency}"] = await run_clients(
+            client, concurrency, max(5, requests // 10), valve)
+    return results
+
+
+async def bench_fulltest(app_module, client, quick: bool) -> dict:
+    """POST /runTest until the job reports completed"""
+    runs = 5 if quick else 20
+    samples = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        job_id = (await client.post("/runTest")).json()["job_id"]
+        while True:
+            job = (await client.get(f"/runTest/{job_id}")).json()
+            if job["status"] not in ("pending", "running"):
+                break
+            await asyncio.sleep(0.001)
+        samples.append(time.perf_counter() - t0)
+        if job["status"] != "completed":
+            raise RuntimeError(f"fullTest {job['status']}: {job.get('error')}")
+    return {"fulltest": summarize(samples)}
+
+
+async def bench_app(suites: list, quick: bool) -> dict:
+    import httpx
+    import app as app_module
+
+    await app_module.startup()
+    results = {}
+    try:
+        transport = httpx.ASGITransport(app=app_module.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            if "api" in suites:
+                results.update(await bench_api(app_module, client, quick))
+            if "fulltest" in suites:
+                results.update(await bench_fulltest(app_module, client, quick))
+    finally:
+        await app_module.shutdown()
+    return results
+
+
+# Baseline comparison
+
+def compared(metric: str):
+    """+1 if higher is better, -1 if lower is better, None if not compared"""
+    if metric == "per_s":
+        return 1
+    if metric in ("mean_us", "p50_us"):
+        return -1
+    return None
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """(benchmark, metric, baseline, current, change) for every metric worse than `threshold`"""
+    regressions = []
+    for name, metrics in results.items():
+        old = baseline.get(name)
+        if old is None:
+            continue
+        for metric, value in metrics.items():
+            direction = compared(metric)
+            if direction is None or not old.get(metric):
+                continue
+            change = (value - old[metric]) / old[metric]
+            if direction * change < -threshold:
+                regressions.append((name, metric, old[metric], value, change))
+    return regressions
+
+
+# Running
+
+def prepare(workdir: Path) -> None:
+    """Scratch directory laid out like src/, so the relative Logs/templates/protocols paths resolve"""
+    (workdir / "Logs").mkdir()
+    for folder in ("templates", "protocols"):
+        shutil.copytree(SRC_DIR / folder, workdir / folder)
+    os.chdir(workdir)
+    os.environ.setdefault("ROBOJAR_MODBUS_PORT", "0")        # no Modbus server
+    os.environ.setdefault("ROBOJAR_HARDWARE", "sim")
+    os.environ.setdefault("ROBOJAR_SERVO_TRAVEL", str(SERVO_TRAVEL))
+    os.environ["ROBOJAR_MODBUS_DEVICES"] = str(workdir / "modbus_devices.json")   # no field devices
+    sys.path.insert(0, str(SRC_DIR))
+
+    from controls.Devices import DeviceRegistry, SimBackend, set_registry
+    set_registry(DeviceRegistry(SimBackend(servo_delay=0, relay_delay=0)))
+
+
+def print_results(results: dict) -> None:
+    for name, metrics in results.items():
+        shown = ", ".join(f"{k}={v:,.1f}" for k, v in metrics.items() if k != "count")
+        print(f"{name:28} {shown}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="RoboJar benchmarks")
+    parser.add_argument("--only", default=",".join(SUITES), help=f"comma separated, from {', '.join(SUITES)}")
+    parser.add_argument("--quick", action="store_true", help="fewer iterations and logs up to 10k rows")
+    parser.add_argument("--output", default="benchmark_results.json", help="where the JSON results go")
+    parser.add_argument("--baseline", help="results JSON of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="allowed slowdown against the baseline, 0.25 = 25%%")
+    args = parser.parse_args(argv)
+
+    suites = [s.strip() for s in args.only.split(",") if s.strip()]
+    unknown = set(suites) - set(SUITES)
+    if unknown:
+        parser.error(f"unknown suite: {', '.join(sorted(unknown))}")
+    output = Path(args.output).resolve()
+    baseline = json.loads(Path(args.baseline).read_text())["results"] if args.baseline else None
+
+    cwd = os.getcwd()
+    workdir = Path(tempfile.mkdtemp(prefix="robojar-bench-"))
+    try:
+        prepare(workdir)
+        results = {}
+        if "transitions" in suites:
+            results.update(bench_transitions(args.quick))
+        if "logging" in suites:
+            results.update(bench_logging(args.quick))
+        if "api" in suites or "fulltest" in suites:
+            results.update(asyncio.run(bench_app(suites, args.quick)))
+    finally:
+        os.chdir(cwd)
+        from controls.Logging_System import shutdown_logging
+        shutdown_logging()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print_results(results)
+    output.write_text(json.dumps({
+        "meta": {
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "quick": args.quick,
+            "suites": suites,
+        },
+        "results": results,
+    }, indent=2))
+    print(f"Results written to {output}")
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold)
+        for name, metric, old, new, change in regressions:
+            print(f"REGRESSION {name} {metric}: {old:,.1f} -> {new:,.1f} ({change:+.0%})")
+        if regressions:
+            return 1
+        print(f"No regressions beyond {args.threshold:.0%} of {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,13 +1,30 @@
-from fastapi import FastAPI, Request
-from fastapi.responses import HTMLResponse
+import asyncio
+import json
+import time
+
+from fastapi import FastAPI, Request, Query
+from fastapi.responses import HTMLResponse, StreamingResponse, Response, PlainTextResponse
 from fastapi import HTTPException
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from pathlib import Path
+from typing import List, Optional
+from pydantic import BaseModel
 
 import controls.Controller as SystemController
-from controls.Valve_State_Machine import ValveStateMachine, CreateValveStateMachine, ValveState
-from controls.Pump_State_Machine import PumpState, PumpStateMachine, CreatePumpStateMachine
+from controls.Pump_State_Machine import PumpState
+from controls.Logging_System import shutdown_logging, query_history, log_paths, log_batch
+from controls.Test_Runner import TestRunner, load_protocol, ProtocolError
+from controls.Modbus_Bridge import ModbusBridge
+from controls.Modbus_Poller import ModbusPoller, load_devices
+from controls.Devices import close_devices
+from controls.Motion import Motion
+from controls.Metrics import HTTP_LATENCY, monitor_loop_lag, render as render_metrics
+from controls.Tracing import tracer
+from reports.Report_Parser import report_cache
+from reports.Downsample import chart_cache
+from reports.Report_Catalog import catalog
+from reports.Analytics import analytics
 
 
 system = SystemController.SystemController(num_valves=3)
@@ -23,10 +40,54 @@ app.mount("/static", StaticFiles(directory=str(BASE_DIR / "static")), name="stat
 # Set up templates directory
 templates = Jinja2Templates(directory="templates")
 
+loop_lag_task = None
+
+@app.middleware("http")
+async def record_latency(request: Request, call_next):
+    # labelled by route template (/valve/{valve_number}/{action}), not the raw path
+    start = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    HTTP_LATENCY.observe(time.perf_counter() - start,
+                         (request.method, route.path if route is not None else "unmatched", str(response.status_code)))
+    return response
+
+@app.on_event("startup")
+async def startup():
+    global loop_lag_task
+    loop_lag_task = asyncio.get_running_loop().create_task(monitor_loop_lag())
+    await system.start_scheduler()
+    await modbus_bridge.start()
+    await field_poller.start()
+    # water level, simulated unless ROBOJAR_HARDWARE=gpio
+    system.start_level_sampler()
+
+@app.on_event("shutdown")
+async def shutdown():
+    if loop_lag_task is not None:
+        loop_lag_task.cancel()
+    await field_poller.stop()
+    await modbus_bridge.stop()
+    await system.stop_scheduler()
+    system.stop_level_sampler()
+    system.shutdown()
+    # detach servos and release pins (ROBOJAR_HARDWARE=gpio on the Pi)
+    close_devices()
+    # write out any log rows still queued in the background writer
+    shutdown_logging()
+
 def send_command(cmd):
     print("in send_command")
     print(cmd)
 
+test_runner = TestRunner(system, send_command)
+
+# SCADA reads and commands the same controller over Modbus TCP (ROBOJAR_MODBUS_PORT, 0 = off)
+modbus_bridge = ModbusBridge(system, notify=send_command)
+
+# Field devices we read over Modbus TCP, listed in modbus_devices.json (ROBOJAR_MODBUS_DEVICES)
+field_poller = ModbusPoller(system.update_field, load_devices())
+
 
 @app.get("/", response_class=HTMLResponse)
 async def home(request: Request):
@@ -36,6 +97,56 @@ async def home(request: Request):
 async def general(request: Request):
     return templates.TemplateResponse("general.html", {"request": request, "window": "Interface Window"})
 
+# Device commands. These block (logging, hardware) so they run on the
+# device's command worker, never directly on the event loop.
+
+def pump_action(action: str, notify: bool = True) -> dict:
+    if action == "On":
+        system.get_pump().on_event(PumpState.RUNNING)
+        message = "Pump turned on (RUNNING)"
+    else:
+        system.get_pump().on_event(PumpState.IDLE)
+        message = "Pump turned off (IDLE)"
+    if notify:
+        send_command(f"pump{action}")
+    return {"message": message, "state": system.get_pump().state.name}
+
+def sensor_action(action: str, notify: bool = True) -> dict:
+    system.sensor_active = (action == "On")
+
+    if notify:
+        send_command(f"sensor{action}")
+
+    return {"message": f"Sensor turned {action.lower()}", "state": "ON" if system.sensor_active else "OFF"}
+
+def valve_action(valve_number: int, action: str, notify: bool = True) -> Motion:
+    # OPENING/CLOSING and the servo command; OPEN/CLOSED comes from
+    # system.motion.finish() once the servo's travel time has passed
+    motion = system.motion.start(valve_number, action == "Open")
+    
+    if notify:
+        send_command(f"valve{valve_number}{action.capitalize()}")
+    
+    return motion
+
+def valve_result(motion: Motion) -> dict:
+    message = f"Valve {motion.valve_number} {'opened' if motion.opening else 'closed'}"
+    return {"message": message, "state": motion.state, "valve_number": motion.valve_number}
+
+# two segment POST routes go before /{control}/{action}, which matches them too
+@app.post("/mode/{mode}")
+async def set_mode(mode: str):
+    """'fill' opens the diverter, inlet and drain valves together, 'start' closes them"""
+    if mode not in ["fill", "start"]:
+        raise HTTPException(status_code=400, detail="Invalid mode")
+    send_command(f"{mode}Mode")
+    states = await system.motion.set_mode(mode)
+    return {"message": f"{mode.capitalize()} mode set", "valves": states, "motion": system.motion.stats()}
+
+@app.post("/reports/rescan")
+def rescan_reports():
+    return {"counts": catalog.rescan(force=True), "failed": catalog.failed()}
+
 @app.post("/{control}/{action}")
 async def control(action: str, control: str):
     if control not in ["Pump", "Sensor"]:
@@ -45,22 +156,9 @@ async def control(action: str, control: str):
         raise HTTPException(status_code=400, detail="Invalid sensor action")
     
     if control == "Pump":
-        if action == "On":
-            system.get_pump().on_event(PumpState.RUNNING)
-            message = "Pump turned on (RUNNING)"
-        else:
-            system.get_pump().on_event(PumpState.IDLE)
-            message = "Pump turned off (IDLE)"
-        command = f"pump{action}"
-        send_command(command)
-        return {"message": message, "state": system.get_pump().state.name}
+        return await system.run_command("pump", pump_action, action)
     elif control == "Sensor":
-        system.sensor_active = (action == "On")
-
-        command = f"sensor{action}"
-        send_command(command)
-
-        return {"message": f"Sensor turned {action.lower()}", "state": "ON" if system.sensor_active else "OFF"}
+        return await system.run_command("sensor", sensor_action, action)
 
 
 @app.post("/valve/{valve_number}/{action}")
@@ -77,83 +175,306 @@ async def valve(valve_number: int, action: str):
     if not valve_sm:
         raise HTTPException(status_code= 404, detail =f"Valve {valve_number} not found")
 
-    if action == "Open":
-        valve_sm.on_event(ValveState.OPENING)
-        valve_sm.on_event(ValveState.OPEN)
-        message = f"Valve {valve_number} opened"
+    motion = await system.run_command(f"valve{valve_number}", valve_action, valve_number, action)
+    await system.motion.finish(motion)
+    return valve_result(motion)
+
+class DeviceCommand(BaseModel):
+    device: str                        # "valve", "pump" or "sensor"
+    action: str                        # "Open"/"Close" for valves, "On"/"Off" for the pump and sensor
+    valve_number: Optional[int] = None
+
+def check_command(cmd: DeviceCommand) -> Optional[str]:
+    """Why `cmd` can't be applied, or None if it can"""
+    if cmd.device == "valve":
+        if cmd.action not in ["Open", "Close"]:
+            return "Invalid action"
+        if cmd.valve_number is None or not system.get_valve(cmd.valve_number):
+            return "Invalid Valve Number"
+    elif cmd.device in ["pump", "sensor"]:
+        if cmd.action not in ["On", "Off"]:
+            return "Invalid action"
     else:
-        valve_sm.on_event(ValveState.CLOSING)
-        valve_sm.on_event(ValveState.CLOSED)
-        message = f"Valve {valve_number} closed"
-    
-    command = f"valve{valve_number}{action.capitalize()}"
-    send_command(command)
-    
-    return {"message": message, "state": valve_sm.state.name, "valve_number": valve_number}
+        return "Invalid control object"
+    return None
 
-@app.post("/runTest")
-async def fullTest():
-    #this function should first reset all controls then run all controls.
-    reset_result = system.reset_all()
-    test_results ={"reset": reset_result, "test_sequence": []}
-    
-    for valve_num in range(1,4):
-        valve_sm = system.get_valve(valve_num)
-        valve_sm.on_event(ValveState.OPENING)
-        test_results["test_sequence"].append({"action": f"Valve {valve_num} OPENING", "state": valve_sm.state.name})
+def command_name(cmd: DeviceCommand) -> str:
+    if cmd.device == "valve":
+        return f"valve{cmd.valve_number}{cmd.action.capitalize()}"
+    return f"{cmd.device}{cmd.action}"
 
-        send_command(f"valve{valve_num}Opening")
+def run_batch(commands: List[DeviceCommand]) -> list:
+    # every device lock and one log write for the whole list, so it applies as a unit
+    results = []
+    with system.all_devices_locked(), log_batch():
+        for cmd in commands:
+            if cmd.device == "valve":
+                results.append(valve_action(cmd.valve_number, cmd.action, notify=False))
+            elif cmd.device == "pump":
+                results.append(pump_action(cmd.action, notify=False))
+            else:
+                results.append(sensor_action(cmd.action, notify=False))
+    send_command(",".join(command_name(cmd) for cmd in commands))
+    return results
 
-        valve_sm.on_event(ValveState.OPEN)
-        test_results["test_sequence"].append({"action": f"Valve {valve_num} OPEN", "state": valve_sm.state.name})
-        send_command(f"valve{valve_num}Open")
+@app.post("/batch")
+async def batch(commands: List[DeviceCommand]):
+    if not commands:
+        raise HTTPException(status_code=400, detail="No commands")
 
-    system.get_pump().on_event(PumpState.PRIMING)
-    test_results["test_sequence"].append({"action": "Pump PRIMING", "state": system.get_pump().state.name})
-    send_command("pumpPriming")
+    # validate everything before touching any device
+    errors = []
+    for i, cmd in enumerate(commands):
+        error = check_command(cmd)
+        if error:
+            errors.append({"index": i, "detail": error})
+    if errors:
+        raise HTTPException(status_code=400, detail=errors)
 
-    system.get_pump().on_event(PumpState.RUNNING)
-    test_results["test_sequence"].append({"action": "Pump RUNNING", "state": system.get_pump().state.name})
-    send_command("pumpRunning")
-    
-    system.sensor_active = True
-    test_results["test_sequence"].append({"action": "Sensor ON", "state": "ON"})
-    send_command("sensorOn")
-
-    for valve_num in range(1,4):
-        valve_sm = system.get_valve(valve_num)
-        valve_sm.on_event(ValveState.CLOSING)
-        test_results["test_sequence"].append({"action": f"Valve {valve_num} CLOSING", "state": valve_sm.state.name})
-        send_command(f"valve{valve_num}Closing")
-
-        valve_sm.on_event(ValveState.CLOSED)
-        test_results["test_sequence"].append({"action": f"Valve {valve_num} CLOSED", "state": valve_sm.state.name})
-        send_command(f"valve{valve_num}Closed")
-    
-    system.get_pump().on_event(PumpState.IDLE)
-    test_results["test_sequence"].append({"action": "Pump IDLE", "state": system.get_pump().state.name})
-    send_command("pumpIdle")
+    results = await system.run_command("batch", run_batch, commands)
+    # every valve in the batch travels at once, then they all arrive in one locked step too
+    motions = [r for r in results if isinstance(r, Motion)]
+    if motions:
+        await system.motion.finish_all(motions)
+    results = [valve_result(r) if isinstance(r, Motion) else r for r in results]
+    return {"message": f"{len(commands)} commands applied", "results": results, "status": system.get_system_status()}
+
+@app.post("/runTest")
+async def fullTest(protocol: str = "full_test"):
+    # Starts the protocol in the background, follow it on /runTest/{job_id}(/stream)
+    try:
+        job = test_runner.start(load_protocol(protocol))
+    except ProtocolError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"message": f"{job.name} started", "job_id": job.id, "status": job.status}
 
-    system.sensor_active = False
-    test_results["test_sequence"].append({"action": "Sensor OFF", "state": "OFF"})
-    send_command("sensorOff")
+@app.get("/runTest/{job_id}")
+async def test_status(job_id: str):
+    job = test_runner.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"Test job {job_id} not found")
+    return job.to_dict()
 
-    return {"message": "Full test sequence completed", "results": test_results}
+@app.get("/runTest/{job_id}/stream")
+async def test_stream(job_id: str):
+    """Server-sent events with per step progress until the job finishes"""
+    job = test_runner.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"Test job {job_id} not found")
+    queue = job.listen()
+
+    async def stream():
+        try:
+            while True:
+                event = await queue.get()
+                if event is None:
+                    break
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            job.unlisten(queue)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
 
 @app.get("/metrics")
 async def metrics():
-    # Does nothing here to make sure no errors happen
-    return{"message": "CS checking script"}
+    # Prometheus text format
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
 
 @app.post("/reset")
 async def reset_system():
-    result = system.reset_all()
+    result = await system.reset_all_async()
     send_command("resetAll")
     return {"message": "System reset completed", "results": result}
 
+@app.get("/history")
+def history(log: str = "SystemLog", device: str = None, start: str = None, end: str = None,
+            limit: int = 100, offset: int = 0):
+    # plain def so FastAPI runs the query in its threadpool, off the event loop
+    if log not in log_paths():
+        raise HTTPException(status_code=400, detail="Invalid log")
+    if limit < 1 or limit > 1000:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 1000")
+    if offset < 0:
+        raise HTTPException(status_code=400, detail="Invalid offset")
+
+    events = query_history(log, device, start, end, limit, offset)
+    next_offset = offset + len(events) if len(events) == limit else None
+    return {"log": log, "events": events, "limit": limit, "offset": offset, "next_offset": next_offset}
+
 @app.get("/status")
-async def get_status():
-    return system.get_system_status()
+async def get_status(request: Request):
+    # cached body, only rebuilt after something changes; pollers get 304s in between
+    version, body = system.get_status_snapshot()
+    etag = system.get_status_etag(version)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        if etag in tags or f"W/{etag}" in tags or "*" in tags:
+            return Response(status_code=304, headers=headers)
+
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@app.get("/events")
+async def status_events(request: Request):
+    """Server-sent events: a full snapshot first, then one event per device change"""
+    queue = system.subscribe()
+
+    async def stream():
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keepalive\n\n"
+                    continue
+                kind = "snapshot" if event["device"] == "system" else "delta"
+                yield f"event: {kind}\nid: {event['version']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            system.unsubscribe(queue)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.get("/reports")
+def list_reports(chemistry: Optional[str] = None, min_coagulant: Optional[float] = None,
+                 max_coagulant: Optional[float] = None, min_polymer: Optional[float] = None,
+                 max_polymer: Optional[float] = None, date_from: Optional[str] = None,
+                 date_to: Optional[str] = None, search: Optional[str] = None, limit: int = 100, offset: int = 0):
+    """Search the report catalog, e.g. /reports?chemistry=Alum/PolyDADMAC&min_coagulant=20"""
+    if limit < 1 or limit > 1000:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 1000")
+    if offset < 0:
+        raise HTTPException(status_code=400, detail="Invalid offset")
+    # only files whose mtime or size changed get parsed
+    catalog.rescan()
+    results = catalog.query(chemistry, min_coagulant, max_coagulant, min_polymer, max_polymer,
+                            date_from, date_to, search, limit, offset)
+    return {"reports": results, "limit": limit, "offset": offset}
+
+@app.get("/reports/{report_id}")
+def get_report(report_id: str):
+    # parsed once per file version, the body is serialized once too
+    try:
+        report = report_cache.get(report_id)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if report is None:
+        raise HTTPException(status_code=404, detail=f"Report {report_id} not found")
+    return Response(content=report.json(), media_type="application/json")
+
+@app.get("/reports/{report_id}/chart")
+def report_chart(report_id: str, column: str = "vol_concentration", points: int = 1000, method: str = "lttb",
+                 start: Optional[float] = None, end: Optional[float] = None):
+    """`column` against elapsed time cut down to `points`, optionally only the [start, end] window"""
+    try:
+        report = report_cache.get(report_id)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if report is None:
+        raise HTTPException(status_code=404, detail=f"Report {report_id} not found")
+    if column not in report.columns:
+        raise HTTPException(status_code=400, detail=f"Invalid column, pick one of {sorted(report.columns)}")
+    if points < 3:
+        raise HTTPException(status_code=400, detail="points must be at least 3")
+    try:
+        return chart_cache.series(report, column, points, method, start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def load_reports(ids: Optional[List[str]], chemistry: Optional[str] = None) -> list:
+    """Reports by id, or every catalogued report (of one chemistry) when no ids are given"""
+    if not ids:
+        catalog.rescan()
+        ids = [entry["id"] for entry in catalog.query(chemistry=chemistry, limit=1000)]
+    reports = []
+    for report_id in ids:
+        try:
+            report = report_cache.get(report_id)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=f"{report_id}: {e}")
+        if report is None:
+            raise HTTPException(status_code=404, detail=f"Report {report_id} not found")
+        reports.append(report)
+    return reports
+
+@app.get("/analytics/summary")
+def analytics_summary(ids: Optional[List[str]] = Query(None), chemistry: Optional[str] = None):
+    """Per-run metrics, e.g. /analytics/summary?ids=run1&ids=run2 or /analytics/summary?chemistry=Alum"""
+    return {"runs": analytics.summaries(load_reports(ids, chemistry))}
+
+@app.get("/analytics/overlay")
+def analytics_overlay(ids: Optional[List[str]] = Query(None), chemistry: Optional[str] = None,
+                      column: str = "vol_concentration", step: Optional[float] = None,
+                      start: Optional[float] = None, end: Optional[float] = None):
+    """`column` of every run resampled onto one elapsed-time grid"""
+    if step is not None and step <= 0:
+        raise HTTPException(status_code=400, detail="step must be positive")
+    try:
+        return analytics.overlay(load_reports(ids, chemistry), column, step, start, end)
+    except KeyError:
+        raise HTTPException(status_code=400, detail=f"Invalid column: {column}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/motion")
+async def motion_status():
+    return system.motion.stats()
+
+@app.get("/series")
+def series_channels():
+    """Every recorded channel with its sample count and how far back each resolution reaches"""
+    return {"channels": system.series.info()}
+
+@app.get("/series/{name}")
+def series_range(name: str, start: Optional[float] = None, end: Optional[float] = None,
+                 last: Optional[float] = None, resolution: str = "auto", max_points: int = 2000):
+    """History of one channel, e.g. /series/flow1.flow?last=3600 (times in epoch seconds)"""
+    if last is not None:
+        if last <= 0:
+            raise HTTPException(status_code=400, detail="last must be positive")
+        end = None
+        start = time.time() - last
+    if max_points < 1 or max_points > 20000:
+        raise HTTPException(status_code=400, detail="max_points must be between 1 and 20000")
+    if resolution not in ("auto", "raw"):
+        try:
+            resolution = int(resolution)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid resolution")
+    try:
+        return system.series.query(name, start, end, resolution, max_points)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Channel {name} not found")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/trace")
+async def get_trace():
+    """Recorded spans as Chrome trace JSON, open it in ui.perfetto.dev or chrome://tracing"""
+    return tracer.chrome_trace()
+
+@app.post("/trace")
+async def set_trace(enabled: bool, clear: bool = False):
+    """Turn tracing on or off (ROBOJAR_TRACE=1 turns it on at startup)"""
+    if enabled:
+        tracer.enable(clear)
+    else:
+        tracer.disable()
+        if clear:
+            tracer.buffer.clear()
+    return tracer.status()
+
+@app.get("/scheduler")
+async def scheduler_status():
+    return system.get_scheduler_status()
+
+@app.get("/field")
+async def field_status():
+    """Latest readings and connection stats of every polled field device"""
+    return {"readings": system.field, "devices": field_poller.stats()}
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
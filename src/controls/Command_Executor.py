@@ -0,0 +1,46 @@
+# Command Executor Module - RoboJar Automation
+# Runs device commands off the event loop, in order per device
+
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class CommandExecutor:
+    """One single-thread worker per device.
+
+    Commands for the same device run strictly in the order they were
+    submitted, commands for different devices run side by side, and the
+    event loop only awaits the result.
+    """
+
+    def __init__(self):
+        self._workers = {}
+        self._lock = threading.Lock()
+
+    def _worker(self, device: str) -> ThreadPoolExecutor:
+        worker = self._workers.get(device)
+        if worker is None:
+            with self._lock:
+                worker = self._workers.get(device)
+                if worker is None:
+                    worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"cmd-{device}")
+                    self._workers[device] = worker
+        return worker
+
+    async def run(self, device: str, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) on `device`'s worker and await its result"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._worker(device), functools.partial(fn, *args, **kwargs))
+
+    def submit(self, device: str, fn, *args, **kwargs):
+        """Same as run() for callers outside the event loop, returns a Future"""
+        return self._worker(device).submit(fn, *args, **kwargs)
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self._lock:
+            workers = list(self._workers.values())
+            self._workers.clear()
+        for worker in workers:
+            worker.shutdown(wait=wait)
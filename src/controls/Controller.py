@@ -1,13 +1,41 @@
+import asyncio
+import json
+import threading
+import time
+from contextlib import contextmanager, ExitStack
 from typing import Dict
 
-from .Valve_State_Machine import ValveStateMachine, CreateValveStateMachine, ValveState
-from .Pump_State_Machine import PumpStateMachine, CreatePumpStateMachine, PumpState
+from .Valve_State_Machine import ValveStateMachine, CreateValveStateMachine, ValveState, VALVE_SPEC
+from .Pump_State_Machine import PumpStateMachine, CreatePumpStateMachine, PumpState, PUMP_SPEC
+from .Sensor_State_Machine import CreateSensorStateMachine, SENSOR_SPEC
+from .Metrics import instrument_spec
+from .Scheduler import TickScheduler
+from .Command_Executor import CommandExecutor
+from .Motion import MotionCoordinator
+from .Time_Series import TimeSeriesStore
+from .Devices import get_registry
+from .Level_Sensor import LevelSampler, TRIG_PIN, ECHO_PIN
 
 
 class SystemController:
     """Controller to manage all state machines in the system"""
     
-    def __init__(self, num_valves: int = 3):
+    def __init__(self, num_valves: int = 3, tick_period: float = 1.0):
+        # Change notifications, see subscribe(). The version goes up on every
+        # change and keys the cached status body, see get_status_snapshot()
+        self.instance_id = format(int(time.time() * 1000), 'x')
+        self.version = 0
+        self._status_cache = None
+        self._subscribers = set()
+        self._publish_lock = threading.Lock()
+        self._sensor_active = False
+        self.field = {}  # field device name -> latest readings, see update_field()
+        self.series = TimeSeriesStore()  # history of every reading, "<device>.<point>" channels
+
+        # Transition counts and time in state for /metrics, before any machine exists
+        for spec in (VALVE_SPEC, PUMP_SPEC, SENSOR_SPEC):
+            instrument_spec(spec)
+
         # Create valve state machines
         self.valves: Dict[int, ValveStateMachine] = {}
         for i in range(1, num_valves + 1):
@@ -15,9 +43,197 @@ class SystemController:
         
         # Create pump state machine
         self.pump = CreatePumpStateMachine("Main Pump")
-        
-        # Sensor state (simple boolean for now)
-        self.sensor_active = False
+
+        # Water level sensor, ACTIVE while readings come in, see start_level_sampler()
+        self.sensor = CreateSensorStateMachine("Level Sensor")
+        self.level_sampler = None
+
+        for valve in self.valves.values():
+            valve.add_listener(self._on_transition)
+        self.pump.add_listener(self._on_transition)
+        self.sensor.add_listener(self._on_transition)
+
+        # Control loop, every machine ticks on its own period, on its device's command worker
+        self.scheduler = TickScheduler(default_period=tick_period, run=self.run_command)
+        for num, valve in self.valves.items():
+            self.scheduler.register(valve, device=f"valve{num}")
+        self.scheduler.register(self.pump, device="pump")
+        self.scheduler.register(self.sensor, device="sensor")
+
+        # Device commands run on one worker per device, off the event loop.
+        # A command holds its own device's lock; multi-device operations (batch,
+        # mode) take the global lock and then every device lock, see all_devices_locked()
+        self.commands = CommandExecutor()
+        self.lock = threading.RLock()
+        self._device_locks = {}
+        self._device_locks_lock = threading.Lock()
+
+        # Valve servos, OPEN/CLOSED only once the servo had time to get there
+        self.motion = MotionCoordinator(self)
+
+    @property
+    def sensor_active(self) -> bool:
+        """Sensor state (simple boolean for now)"""
+        return self._sensor_active
+
+    @sensor_active.setter
+    def sensor_active(self, active: bool) -> None:
+        if active == self._sensor_active:
+            return
+        self._sensor_active = active
+        self._publish({"device": "sensor", "status": self.get_sensor_status()})
+
+    def update_field(self, device: str, values: dict) -> None:
+        """Latest readings of a polled field device, published only when they change"""
+        self.series.record_many({f"{device}.{name}": value for name, value in values.items()})
+        if self.field.get(device) == values:
+            return
+        self.field[device] = values
+        self._publish({"device": "field", "name": device, "status": values})
+
+    def set_level(self, height: float) -> None:
+        """New water height (meters) from the level sampler, published when it moves a millimeter"""
+        with self.device_lock("sensor"):
+            previous = self.sensor.level
+            self.sensor.set_level(height)
+        self.series.record("level", height)
+        if previous is None or round(previous, 3) != round(height, 3):
+            self._publish({"device": "sensor", "status": self.get_sensor_status()})
+
+    def clear_level(self) -> None:
+        """The level sampler lost the echo"""
+        with self.device_lock("sensor"):
+            self.sensor.clear_level()
+
+    def start_level_sampler(self, registry=None, **options):
+        """Sample the water level on its own thread, through the device registry's level sensor.
+
+        `options` go to LevelSampler (period, window, ...). Returns the sampler,
+        or None if the GPIO library is missing or the pins can't be opened
+        (not a Pi, RPi.GPIO on a Pi 5, pin busy), so the app still starts.
+        """
+        if self.level_sampler is None:
+            try:
+                gpio = (registry or get_registry()).level_sensor(TRIG_PIN, ECHO_PIN)
+                sampler = LevelSampler(gpio, self, **options)   # opens the pins
+            except ImportError as e:
+                print(f"Level sensor disabled, GPIO library missing: {e}")
+                return None
+            except Exception as e:   # RuntimeError/OSError from the pins, gpiozero's own pin errors
+                print(f"Level sensor disabled, could not open pins {TRIG_PIN}/{ECHO_PIN}: {e!r}")
+                return None
+            self.level_sampler = sampler
+            self.level_sampler.start()
+        return self.level_sampler
+
+    def stop_level_sampler(self) -> None:
+        if self.level_sampler is not None:
+            self.level_sampler.stop()
+            self.level_sampler = None
+
+    def _on_transition(self, machine, state) -> None:
+        if machine is self.pump:
+            self._publish({"device": "pump", "status": self.get_pump_status()})
+            return
+        if machine is self.sensor:
+            self._publish({"device": "sensor", "status": self.get_sensor_status()})
+            return
+        for num, valve in self.valves.items():
+            if valve is machine:
+                self._publish({"device": "valve", "valve_number": num, "status": self.get_valve_status(num)})
+                return
+
+    def _publish(self, delta: dict) -> None:
+        """Bump the state version and hand the change to every subscriber"""
+        with self._publish_lock:
+            self.version += 1
+            delta["version"] = self.version
+            subscribers = list(self._subscribers)
+        for loop, queue in subscribers:
+            # transitions happen on the device workers, queues belong to the loop
+            try:
+                loop.call_soon_threadsafe(self._deliver, queue, delta)
+            except RuntimeError:
+                self._subscribers.discard((loop, queue))  # loop is closed
+
+    def _deliver(self, queue: asyncio.Queue, delta: dict) -> None:
+        try:
+            queue.put_nowait(delta)
+        except asyncio.QueueFull:
+            # slow client, drop its backlog and send a fresh snapshot instead
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(self.get_snapshot_event())
+
+    def get_snapshot_event(self) -> dict:
+        return {"device": "system", "version": self.version, "status": self.get_system_status()}
+
+    def subscribe(self, max_backlog: int = 100) -> asyncio.Queue:
+        """Queue of change events for the calling event loop.
+
+        The first item is a full snapshot, later ones are per device deltas.
+        """
+        queue = asyncio.Queue(maxsize=max_backlog)
+        with self._publish_lock:
+            queue.put_nowait(self.get_snapshot_event())
+            self._subscribers.add((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        with self._publish_lock:
+            self._subscribers = {entry for entry in self._subscribers if entry[1] is not queue}
+
+    async def run_command(self, device: str, fn, *args):
+        """Run a blocking command for `device` ("valve1", "pump", "sensor") in order, without blocking the loop"""
+        return await self.commands.run(device, self._locked, device, fn, *args)
+
+    def submit_command(self, device: str, fn, *args):
+        """run_command() for callers that can't await, returns a concurrent Future"""
+        return self.commands.submit(device, self._locked, device, fn, *args)
+
+    def _locked(self, device: str, fn, *args):
+        with self.device_lock(device):
+            return fn(*args)
+
+    def device_lock(self, device: str) -> threading.RLock:
+        lock = self._device_locks.get(device)
+        if lock is None:
+            with self._device_locks_lock:
+                lock = self._device_locks.setdefault(device, threading.RLock())
+        return lock
+
+    def device_names(self) -> list:
+        return [f"valve{num}" for num in self.valves] + ["pump", "sensor"]
+
+    @contextmanager
+    def all_devices_locked(self):
+        """Hold every device's lock, so a multi-device operation applies with nothing in between.
+
+        The global lock is taken first, so two of these never deadlock on the
+        device locks, and single device commands only ever hold their own.
+        """
+        with self.lock, ExitStack() as stack:
+            for device in self.device_names():
+                stack.enter_context(self.device_lock(device))
+            yield
+
+    async def start_scheduler(self) -> None:
+        """Start ticking all machines on the running event loop"""
+        await self.scheduler.start()
+
+    async def stop_scheduler(self) -> None:
+        await self.scheduler.stop()
+
+    def set_tick_period(self, name: str, period: float) -> None:
+        """Change how often one machine (by name) is ticked"""
+        entry = self.scheduler.entries.get(name)
+        if entry is None:
+            raise KeyError(name)
+        self.scheduler.register(entry.machine, period, entry.device)
+
+    def get_scheduler_status(self) -> dict:
+        """Tick counts and missed deadlines per machine"""
+        return self.scheduler.stats()
     
     def get_valve(self, valve_number: int) -> ValveStateMachine:
         """Get a valve state machine by number"""
@@ -46,10 +262,12 @@ class SystemController:
         }
     
     def get_sensor_status(self) -> dict:
-        """Get current sensor status"""
+        """Get current sensor status: switched on or off, and what the level sampler reads"""
         return {
             "active": self.sensor_active,
-            "state": "ON" if self.sensor_active else "OFF"
+            "state": "ON" if self.sensor_active else "OFF",
+            "reading": self.sensor.state.name,  # ACTIVE while level readings come in
+            "level": self.sensor.level
         }
     
     def get_system_status(self) -> dict:
@@ -57,30 +275,76 @@ class SystemController:
         return {
             "pump": self.get_pump_status(),
             "valves": {num: self.get_valve_status(num) for num in self.valves.keys()},
-            "sensor": self.get_sensor_status()
+            "sensor": self.get_sensor_status(),
+            "field": dict(self.field)
         }
     
+    def get_status_snapshot(self) -> tuple:
+        """(version, serialized get_system_status()), rebuilt only after a change"""
+        cached = self._status_cache
+        version = self.version
+        if cached is None or cached[0] != version:
+            # read the version first, a change during the build just means a rebuild next call
+            body = json.dumps(self.get_system_status(), separators=(',', ':')).encode('utf-8')
+            cached = (version, body)
+            self._status_cache = cached
+        return cached
+
+    def get_status_etag(self, version: int) -> str:
+        return f'"{self.instance_id}-{version}"'
+
+    def reset_valve(self, valve_number: int) -> dict:
+        """Reset one valve to IDLE"""
+        valve = self.valves[valve_number]
+        valve.on_event(ValveState.IDLE)
+        return {
+            "name": valve.name,
+            "state": valve.state.name
+        }
+
+    def reset_pump(self) -> dict:
+        """Reset the pump to IDLE"""
+        self.pump.on_event(PumpState.IDLE)
+        return {
+            "name": self.pump.name,
+            "state": self.pump.state.name
+        }
+
+    def reset_sensor(self) -> dict:
+        """Turn off the sensor"""
+        self.sensor_active = False
+        return {"active": False}
+
     def reset_all(self) -> dict:
         """Reset all components to idle state"""
         results = {"valves": {}, "pump": {}, "sensor": {}}
         
         # Reset all valves to IDLE
-        for valve_num, valve in self.valves.items():
-            valve.on_event(ValveState.IDLE)
-            results["valves"][valve_num] = {
-                "name": valve.name,
-                "state": valve.state.name
-            }
+        for valve_num in self.valves.keys():
+            results["valves"][valve_num] = self.reset_valve(valve_num)
         
         # Reset pump to IDLE
-        self.pump.on_event(PumpState.IDLE)
-        results["pump"] = {
-            "name": self.pump.name,
-            "state": self.pump.state.name
-        }
+        results["pump"] = self.reset_pump()
         
         # Turn off sensor
-        self.sensor_active = False
-        results["sensor"] = {"active": False}
+        results["sensor"] = self.reset_sensor()
         
         return results
+
+    async def reset_all_async(self) -> dict:
+        """reset_all() through the device workers, all devices at once"""
+        valve_nums = list(self.valves.keys())
+        valve_results = await asyncio.gather(
+            *(self.run_command(f"valve{num}", self.reset_valve, num) for num in valve_nums))
+        pump_result, sensor_result = await asyncio.gather(
+            self.run_command("pump", self.reset_pump),
+            self.run_command("sensor", self.reset_sensor))
+        return {
+            "valves": dict(zip(valve_nums, valve_results)),
+            "pump": pump_result,
+            "sensor": sensor_result
+        }
+
+    def shutdown(self) -> None:
+        """Let queued device commands finish"""
+        self.commands.shutdown(wait=True)
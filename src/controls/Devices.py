@@ -0,0 +1,231 @@
+# Devices Module - RoboJar Automation
+# One registry of servo, relay and level sensor handles, opened on first use
+
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+
+from .Level_Sensor import GpiozeroGpioBackend, FakeGpioBackend
+
+HARDWARE = os.environ.get('ROBOJAR_HARDWARE', 'sim')   # 'gpio' on the Pi, 'sim' anywhere else
+
+DIVERTER_VALVE_PIN = 18
+INLET_VALVE_PIN = 24
+DRAIN_VALVE_PIN = 22
+VALVE_PINS = {1: DIVERTER_VALVE_PIN, 2: INLET_VALVE_PIN, 3: DRAIN_VALVE_PIN}
+
+MIN_PULSE_WIDTH = 0.5 / 1000  # 0 DEG
+MAX_PULSE_WIDTH = 1.5 / 1000  # 90 DEG
+
+# simulated actuation times in seconds
+SIM_SERVO_DELAY = float(os.environ.get('ROBOJAR_SIM_SERVO_DELAY', '0'))
+SIM_RELAY_DELAY = float(os.environ.get('ROBOJAR_SIM_RELAY_DELAY', '0'))
+
+
+class DeviceBackend(ABC):
+    """Creates device handles. Handles behave like the gpiozero devices we use"""
+
+    @abstractmethod
+    def servo(self, pin: int):
+        """Handle with min(), max(), detach() and value"""
+
+    @abstractmethod
+    def relay(self, pin: int, active_high: bool = True):
+        """Handle with on(), off(), close() and is_active"""
+
+    @abstractmethod
+    def level_sensor(self, trig: int, echo: int):
+        """Level_Sensor.GpioBackend for an ultrasonic sensor"""
+
+
+class GpiozeroBackend(DeviceBackend):
+    """The real pins. gpiozero is only imported when the first device is opened"""
+
+    def servo(self, pin: int):
+        from gpiozero import Servo
+        return Servo(pin, min_pulse_width=MIN_PULSE_WIDTH, max_pulse_width=MAX_PULSE_WIDTH)
+
+    def relay(self, pin: int, active_high: bool = True):
+        from gpiozero import OutputDevice
+        return OutputDevice(pin, active_high=active_high, initial_value=False)
+
+    def level_sensor(self, trig: int, echo: int):
+        return GpiozeroGpioBackend()
+
+
+class SimServo:
+    """Servo without hardware. value reaches its target `delay` seconds after a move"""
+
+    def __init__(self, pin: int, delay: float = 0.0):
+        self.pin = pin
+        self.delay = delay
+        self.target = None
+        self.moves = 0
+        self._start_value = None
+        self._done_at = 0.0
+
+    def _move(self, target: float) -> None:
+        self._start_value = self.value
+        self.target = target
+        self.moves += 1
+        self._done_at = time.monotonic() + self.delay
+
+    def min(self) -> None:
+        self._move(-1.0)
+
+    def max(self) -> None:
+        self._move(1.0)
+
+    def mid(self) -> None:
+        self._move(0.0)
+
+    def detach(self) -> None:
+        self.target = None
+
+    def close(self) -> None:
+        self.detach()
+
+    @property
+    def moving(self) -> bool:
+        return self.target is not None and time.monotonic() < self._done_at
+
+    @property
+    def value(self):
+        """Where the servo is, None while detached like gpiozero"""
+        return self._start_value if self.moving else self.target
+
+
+class SimRelay:
+    """Relay without hardware, switches `delay` seconds after on()/off()"""
+
+    def __init__(self, pin: int, active_high: bool = True, delay: float = 0.0):
+        self.pin = pin
+        self.active_high = active_high
+        self.delay = delay
+        self.switches = 0
+        self._state = False
+
+    def _set(self, state: bool) -> None:
+        if self.delay:
+            time.sleep(self.delay)
+        self._state = state
+        self.switches += 1
+
+    def on(self) -> None:
+        self._set(True)
+
+    def off(self) -> None:
+        self._set(False)
+
+    def close(self) -> None:
+        self._state = False
+
+    @property
+    def is_active(self) -> bool:
+        return self._state
+
+
+class SimBackend(DeviceBackend):
+    """In-process devices with configurable actuation delays, for development and benchmarks"""
+
+    def __init__(self, servo_delay: float = SIM_SERVO_DELAY, relay_delay: float = SIM_RELAY_DELAY,
+                 distances=(0.10,)):
+        self.servo_delay = servo_delay
+        self.relay_delay = relay_delay
+        self.distances = distances
+
+    def servo(self, pin: int):
+        return SimServo(pin, self.servo_delay)
+
+    def relay(self, pin: int, active_high: bool = True):
+        return SimRelay(pin, active_high, self.relay_delay)
+
+    def level_sensor(self, trig: int, echo: int):
+        return FakeGpioBackend(self.distances)
+
+
+class DeviceRegistry:
+    """Pooled device handles: each pin is opened once, on first use, and reused after"""
+
+    def __init__(self, backend: DeviceBackend):
+        self.backend = backend
+        self._devices = {}
+        self._lock = threading.Lock()
+
+    def _get(self, key: tuple, create):
+        device = self._devices.get(key)
+        if device is None:
+            with self._lock:
+                device = self._devices.get(key)
+                if device is None:
+                    device = create()
+                    self._devices[key] = device
+        return device
+
+    def servo(self, pin: int):
+        return self._get(('servo', pin), lambda: self.backend.servo(pin))
+
+    def valve(self, valve_number: int):
+        """Servo of valve 1 (diverter), 2 (inlet) or 3 (drain)"""
+        return self.servo(VALVE_PINS[valve_number])
+
+    def relay(self, pin: int, active_high: bool = True):
+        return self._get(('relay', pin), lambda: self.backend.relay(pin, active_high))
+
+    def level_sensor(self, trig: int, echo: int):
+        return self._get(('level', trig, echo), lambda: self.backend.level_sensor(trig, echo))
+
+    def opened(self) -> list:
+        return [f"{key[0]}:{key[1]}" for key in self._devices]
+
+    def close(self) -> None:
+        """Detach servos and release every pin"""
+        with self._lock:
+            devices = list(self._devices.items())
+            self._devices.clear()
+        for (kind, *_), device in devices:
+            try:
+                if kind == 'servo':
+                    device.detach()
+                device.close()
+            except Exception as e:
+                print(f"Error closing {kind}: {e}")
+
+
+def create_backend(name: str = HARDWARE) -> DeviceBackend:
+    if name == 'gpio':
+        return GpiozeroBackend()
+    if name == 'sim':
+        return SimBackend()
+    raise ValueError(f"Unknown hardware backend: {name}")
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> DeviceRegistry:
+    """The process wide registry for ROBOJAR_HARDWARE ('sim' unless set to 'gpio')"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = DeviceRegistry(create_backend())
+    return _registry
+
+
+def set_registry(registry: DeviceRegistry) -> None:
+    """Swap the registry, e.g. for a SimBackend with delays in benchmarks"""
+    global _registry
+    with _registry_lock:
+        old, _registry = _registry, registry
+    if old is not None and old is not registry:
+        old.close()
+
+
+def close_devices() -> None:
+    with _registry_lock:
+        registry = _registry
+    if registry is not None:
+        registry.close()
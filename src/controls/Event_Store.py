@@ -0,0 +1,182 @@
+# Event Store Module - RoboJar Automation
+# SQLite (WAL) storage backend for the logging system
+
+import queue
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from .Metrics import LOG_WRITE_SECONDS, LOG_ROWS
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id      INTEGER PRIMARY KEY,
+    log     TEXT NOT NULL,
+    time    TEXT NOT NULL,
+    device  TEXT NOT NULL,
+    status  TEXT,
+    notes   TEXT
+);
+CREATE INDEX IF NOT EXISTS events_device_time ON events(device, time);
+CREATE INDEX IF NOT EXISTS events_log_time ON events(log, time);
+"""
+
+FLUSH_INTERVAL = 0.5  # longest a row waits for others to share its transaction
+MAX_BATCH = 500       # rows per transaction
+FLUSH_TIMEOUT = 5.0   # seconds readers wait for queued rows before going ahead without them
+
+
+def _connect(db_path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path, timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class SqliteStatusIndex:
+    """Last status per device for one log, loaded from the database once per name"""
+
+    def __init__(self, store: 'SqliteEventStore', log: str):
+        self.store = store
+        self.log = log
+        self.last_status = {}
+
+    def get(self, name: str):
+        if name not in self.last_status:
+            self.last_status[name] = self.store.last_status(self.log, name)
+        return self.last_status[name]
+
+    def update(self, name: str, status) -> None:
+        self.last_status[name] = status
+
+
+class SqliteEventStore:
+    """Event log kept in one SQLite database in WAL mode.
+
+    Rows are queued and inserted by a writer thread in batched transactions,
+    queries use their own short lived connections so they never wait on it.
+    """
+
+    def __init__(self, db_path: str = 'Logs//events.db', flush_interval: float = FLUSH_INTERVAL, max_batch: int = MAX_BATCH):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        conn = _connect(db_path)
+        conn.executescript(SCHEMA)
+        conn.close()
+        self._queue = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='EventStore', daemon=True)
+        self._thread.start()
+
+    def append(self, log: str, row: dict) -> None:
+        """Queue one event row (csv style keys: Time, Name, Status, Notes)"""
+        self._queue.put((log, row.get('Time', ''), row.get('Name', ''), row.get('Status'), row.get('Notes', '')))
+
+    def append_many(self, rows: list) -> None:
+        """Queue several (log, row) events to go in the same transaction"""
+        self._queue.put([(log, row.get('Time', ''), row.get('Name', ''), row.get('Status'), row.get('Notes', ''))
+                         for log, row in rows])
+
+    def flush(self, timeout: float = None) -> bool:
+        """Block until every row queued so far is inserted. Returns False on timeout"""
+        if self._closed or not self._thread.is_alive():
+            return self._closed and not self._thread.is_alive()
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout: float = 5.0) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _run(self) -> None:
+        conn = _connect(self.db_path)
+        running = True
+        while running:
+            item = self._queue.get()
+            # rows wait up to flush_interval for company, a flush request or close ends the wait early
+            deadline = time.monotonic() + self.flush_interval
+            batch = []
+            waiters = []
+            while True:
+                if item is None:
+                    running = False
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                elif isinstance(item, list):
+                    batch.extend(item)
+                else:
+                    batch.append(item)
+                if waiters or len(batch) >= self.max_batch or not running:
+                    break
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+            if batch:
+                started = time.perf_counter()
+                try:
+                    with conn:
+                        conn.executemany(
+                            "INSERT INTO events (log, time, device, status, notes) VALUES (?, ?, ?, ?, ?)", batch)
+                except sqlite3.Error as e:
+                    print(f"Event store insert failed: {e}")
+                LOG_WRITE_SECONDS.observe(time.perf_counter() - started, ('sqlite',))
+                LOG_ROWS.inc(('sqlite',), len(batch))
+            for waiter in waiters:
+                waiter.set()
+        conn.close()
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def last_status(self, log: str, device: str):
+        conn = _connect(self.db_path)
+        try:
+            row = conn.execute(
+                "SELECT status FROM events WHERE device = ? AND log = ? ORDER BY time DESC, id DESC LIMIT 1",
+                (device, log)).fetchone()
+        finally:
+            conn.close()
+        return row[0] if row else None
+
+    def status_index(self, log: str) -> SqliteStatusIndex:
+        self.flush(FLUSH_TIMEOUT)
+        return SqliteStatusIndex(self, log)
+
+    def query(self, log: str = None, device: str = None, start: str = None, end: str = None,
+              limit: int = 100, offset: int = 0) -> list:
+        """Events matching the filters, oldest first, one page at a time"""
+        # rows still queued would be missing from the page
+        self.flush(FLUSH_TIMEOUT)
+        clauses = []
+        params = []
+        if log is not None:
+            clauses.append("log = ?")
+            params.append(log)
+        if device is not None:
+            clauses.append("device = ?")
+            params.append(device)
+        if start is not None:
+            clauses.append("time >= ?")
+            params.append(start)
+        if end is not None:
+            clauses.append("time <= ?")
+            params.append(end)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        params.extend([limit, offset])
+
+        conn = _connect(self.db_path)
+        try:
+            rows = conn.execute(
+                f"SELECT time, device, status, notes FROM events {where} ORDER BY time, id LIMIT ? OFFSET ?",
+                params).fetchall()
+        finally:
+            conn.close()
+        return [{'Time': t, 'Name': d, 'Status': s, 'Notes': n} for t, d, s, n in rows]
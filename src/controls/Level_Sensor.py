@@ -0,0 +1,255 @@
+# Level Sensor Module - RoboJar Automation
+# Ultrasonic water level sampling on echo edge callbacks instead of busy-wait loops
+
+import statistics
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+
+# Pin definitions (BCM), same wiring as old/ultrasonic.py
+TRIG_PIN = 9
+ECHO_PIN = 10
+
+SENSOR_TO_BOTTOM = 0.18   # Distance from sensor to bottom in meters
+SPEED_OF_SOUND = 343.0    # m/s
+ECHO_TIMEOUT = 0.03       # seconds, echoes from further than ~5 m never come back
+SAMPLE_PERIOD = 0.5       # seconds between readings
+WINDOW = 9                # readings in the median filter
+OUTLIER_TOLERANCE = 0.01  # meters, smallest deviation from the median ever thrown out
+MAX_MISSES = 5            # timeouts in a row before the sensor goes back to IDLE
+
+
+class GpioBackend(ABC):
+    """Trigger output plus echo edge callbacks, callback(monotonic ns, level)"""
+
+    @abstractmethod
+    def setup(self, trig: int, echo: int, callback) -> None:
+        pass
+
+    @abstractmethod
+    def pulse(self, trig: int) -> None:
+        """10 us trigger pulse"""
+
+    def close(self) -> None:
+        pass
+
+
+class GpiozeroGpioBackend(GpioBackend):
+    """gpiozero pins, like the servos and relays (so it works on a Pi 5 too). Edges come in on its event thread"""
+
+    def __init__(self):
+        self.trig = None
+        self.echo = None
+        self.callback = None
+
+    def setup(self, trig: int, echo: int, callback) -> None:
+        self.callback = callback
+        if self.echo is not None:
+            return  # pooled by the device registry, a new sampler only swaps the callback
+        from gpiozero import DigitalInputDevice, DigitalOutputDevice
+        self.trig = DigitalOutputDevice(trig, initial_value=False)
+        try:
+            self.echo = DigitalInputDevice(echo)
+        except Exception:
+            self.trig.close()
+            self.trig = None
+            raise
+        # timestamp first, before anything else in the callback can delay it
+        self.echo.when_activated = lambda: self.callback(time.monotonic_ns(), 1)
+        self.echo.when_deactivated = lambda: self.callback(time.monotonic_ns(), 0)
+
+    def pulse(self, trig: int) -> None:
+        self.trig.on()
+        time.sleep(0.00001)
+        self.trig.off()
+
+    def close(self) -> None:
+        """Release the trigger and echo pins only"""
+        for device in (self.echo, self.trig):
+            if device is not None:
+                device.close()
+        self.echo = self.trig = None
+
+
+class RpiGpioBackend(GpioBackend):
+    """RPi.GPIO, edges come in on its event thread. Not on a Pi 5, use GpiozeroGpioBackend there"""
+
+    def __init__(self):
+        import RPi.GPIO as GPIO
+        self.GPIO = GPIO
+        self.trig = None
+        self.echo = None
+
+    def setup(self, trig: int, echo: int, callback) -> None:
+        GPIO = self.GPIO
+        GPIO.setmode(GPIO.BCM)
+        GPIO.setup(trig, GPIO.OUT)
+        GPIO.setup(echo, GPIO.IN)
+        GPIO.output(trig, GPIO.LOW)
+        # timestamp first, before anything else in the callback can delay it
+        GPIO.add_event_detect(echo, GPIO.BOTH,
+                              callback=lambda ch: callback(time.monotonic_ns(), GPIO.input(ch)))
+        self.trig = trig
+        self.echo = echo
+
+    def pulse(self, trig: int) -> None:
+        self.GPIO.output(trig, True)
+        time.sleep(0.00001)
+        self.GPIO.output(trig, False)
+
+    def close(self) -> None:
+        if self.echo is not None:
+            self.GPIO.remove_event_detect(self.echo)
+            # only our pins, a bare cleanup() would reset the servo and relay pins too
+            self.GPIO.cleanup((self.trig, self.echo))
+            self.echo = None
+
+
+class FakeGpioBackend(GpioBackend):
+    """Echoes for a scripted list of distances (meters, None = no echo) without any hardware.
+
+    Edges are delivered straight from pulse() with timestamps matching the
+    distance, so readings are exact and tests don't wait on real time.
+    """
+
+    def __init__(self, distances=(0.10,), repeat: bool = True):
+        self.distances = list(distances)
+        self.repeat = repeat
+        self.callback = None
+        self.pulses = 0
+
+    def setup(self, trig: int, echo: int, callback) -> None:
+        self.callback = callback
+
+    def pulse(self, trig: int) -> None:
+        if not self.distances:
+            return
+        distance = self.distances[self.pulses % len(self.distances)] if self.repeat else self.distances.pop(0)
+        self.pulses += 1
+        if distance is None:
+            return
+        start = time.monotonic_ns()
+        self.callback(start, 1)
+        self.callback(start + int(2 * distance / SPEED_OF_SOUND * 1e9), 0)
+
+
+class LevelSampler:
+    """Samples water height on its own thread and publishes it to `sensor`.
+
+    `sensor` is anything with set_level(height) and clear_level(): a
+    SensorStateMachine, or the SystemController, which also publishes the change.
+
+    Each reading waits on the echo's falling edge with a timeout, so the
+    thread sleeps instead of spinning between readings. Readings too far
+    from the median of the last `window` are thrown out unless they keep
+    coming (the level really moved), and the median is what gets published.
+    """
+
+    def __init__(self, gpio: GpioBackend, sensor, trig: int = TRIG_PIN, echo: int = ECHO_PIN,
+                 sensor_to_bottom: float = SENSOR_TO_BOTTOM, period: float = SAMPLE_PERIOD,
+                 window: int = WINDOW, timeout: float = ECHO_TIMEOUT, series=None, channel: str = "level"):
+        self.gpio = gpio
+        self.sensor = sensor
+        self.series = series          # optional Time_Series.TimeSeriesStore for the height history
+        self.channel = channel
+        self.trig = trig
+        self.echo = echo
+        self.sensor_to_bottom = sensor_to_bottom
+        self.period = period
+        self.timeout = timeout
+        self.readings = deque(maxlen=window)   # ring buffer of accepted distances
+        self.rejected = []                     # outliers in a row
+        self.misses = 0                        # timeouts in a row
+        self.height = None
+
+        self._rise = None
+        self._fall = None
+        self._echo = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        gpio.setup(trig, echo, self._on_edge)
+
+    def _on_edge(self, t_ns: int, level: int) -> None:
+        if level:
+            self._rise = t_ns
+            self._fall = None
+        elif self._rise is not None:
+            self._fall = t_ns
+            self._echo.set()
+
+    def measure(self):
+        """One distance in meters, None if no echo came back in time"""
+        self._rise = self._fall = None
+        self._echo.clear()
+        self.gpio.pulse(self.trig)
+        if not self._echo.wait(self.timeout):
+            return None
+        rise, fall = self._rise, self._fall
+        if rise is None or fall is None or fall <= rise:
+            return None
+        return (fall - rise) / 1e9 * SPEED_OF_SOUND / 2.0
+
+    def accept(self, distance: float) -> bool:
+        """Add `distance` to the ring buffer unless it is an outlier"""
+        if len(self.readings) >= 3:
+            median = statistics.median(self.readings)
+            spread = statistics.median(abs(r - median) for r in self.readings)
+            if abs(distance - median) > max(OUTLIER_TOLERANCE, 3 * spread):
+                self.rejected.append(distance)
+                if len(self.rejected) <= self.readings.maxlen // 2:
+                    return False
+                # outliers kept coming, the level really moved: start over from them
+                self.readings.clear()
+                self.readings.extend(self.rejected)
+                self.rejected = []
+                return True
+        self.rejected = []
+        self.readings.append(distance)
+        return True
+
+    def sample(self):
+        """Measure, filter and publish once. Returns the published height or None"""
+        distance = self.measure()
+        if distance is None:
+            self.misses += 1
+            if self.misses >= MAX_MISSES and self.height is not None:
+                self.height = None
+                self.readings.clear()
+                self.sensor.clear_level()
+            return None
+        self.misses = 0
+        self.accept(distance)
+        height = max(0.0, self.sensor_to_bottom - statistics.median(self.readings))
+        self.height = height
+        self.sensor.set_level(height)
+        if self.series is not None:
+            self.series.record(self.channel, height)
+        return height
+
+    def _run(self) -> None:
+        next_time = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                self.sample()
+            except Exception as e:
+                print(f"Level sensor error: {e}")
+            next_time += self.period
+            delay = next_time - time.monotonic()
+            if delay < 0:
+                next_time = time.monotonic()
+                delay = 0
+            self._stop.wait(delay)
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="level-sensor", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """Stop sampling. The pins stay open, whoever opened them (the device registry) releases them"""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,261 @@
+# Log Segments Module - RoboJar Automation
+# Rotation, compaction and time-range index for the csv logs
+
+import csv
+import gzip
+import io
+import json
+import os
+import shutil
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+OFFSET_EVERY = 256  # rows between entries in a segment's offset table
+PAST_END_ROWS = 64  # rows in a row after the window before a scan stops, rows can be a little out of order
+
+
+class RotationPolicy:
+    """When to close the active log segment and what to do with closed ones"""
+
+    def __init__(self, max_bytes: Optional[int] = 5 * 1024 * 1024, max_age: Optional[float] = None,
+                 compress: bool = True, max_segments: Optional[int] = 50):
+        self.max_bytes = max_bytes        # rotate once the active file reaches this size
+        self.max_age = max_age            # or once its first row is this many seconds old
+        self.compress = compress          # gzip segments after they are closed
+        self.max_segments = max_segments  # closed segments kept per log, oldest are deleted
+
+    def should_rotate(self, index: 'SegmentIndex', now: datetime) -> bool:
+        if index.rows == 0:
+            return False
+        if self.max_bytes is not None and index.size >= self.max_bytes:
+            return True
+        if self.max_age is not None and index.start is not None:
+            try:
+                started = datetime.strptime(index.start, TIME_FORMAT)
+            except ValueError:
+                return False
+            return (now - started).total_seconds() >= self.max_age
+        return False
+
+
+class SegmentIndex:
+    """Time range and sparse byte offsets of one segment, kept as rows are written"""
+
+    def __init__(self, fieldnames: list = None):
+        self.fieldnames = fieldnames
+        self.start = None
+        self.end = None
+        self.rows = 0
+        self.size = 0
+        self.offsets = []  # [time, byte offset] every OFFSET_EVERY rows
+
+    def add(self, time_str: str, offset: int, length: int) -> None:
+        if self.rows % OFFSET_EVERY == 0:
+            self.offsets.append([time_str, offset])
+        if self.start is None:
+            self.start = time_str
+        # rows can arrive a little out of order, keep the widest range
+        elif time_str and time_str < self.start:
+            self.start = time_str
+        if self.end is None or (time_str and time_str > self.end):
+            self.end = time_str
+        self.rows += 1
+        self.size = offset + length
+
+    def to_dict(self, file_name: str, compressed: bool) -> dict:
+        return {
+            "file": file_name,
+            "compressed": compressed,
+            "fieldnames": self.fieldnames,
+            "start": self.start,
+            "end": self.end,
+            "rows": self.rows,
+            "offsets": self.offsets,
+        }
+
+
+def scan_segment(path: Path) -> SegmentIndex:
+    """Build the index of an existing plain csv segment by reading it once"""
+    index = SegmentIndex()
+    with path.open('rb') as f:
+        header = f.readline()
+        if not header:
+            return index
+        index.fieldnames = next(csv.reader([header.decode('utf-8')]))
+        index.size = len(header)
+        offset = len(header)
+        time_col = _time_column(index.fieldnames)
+        for line in f:
+            if line.strip():
+                row = next(csv.reader([line.decode('utf-8', errors='replace')]), [])
+                time_str = row[time_col] if time_col is not None and len(row) > time_col else ''
+                index.add(time_str, offset, len(line))
+            offset += len(line)
+        index.size = offset
+    return index
+
+
+def _time_column(fieldnames) -> Optional[int]:
+    if fieldnames and 'Time' in fieldnames:
+        return fieldnames.index('Time')
+    return None
+
+
+def _sidecar(data_path: Path) -> Path:
+    name = data_path.name
+    if name.endswith('.gz'):
+        name = name[:-3]
+    return data_path.with_name(name + '.idx.json')
+
+
+def write_sidecar(data_path: Path, index: SegmentIndex, compressed: bool) -> None:
+    side = _sidecar(data_path)
+    tmp = side.with_name(side.name + '.tmp')
+    tmp.write_text(json.dumps(index.to_dict(data_path.name, compressed)), encoding='utf-8')
+    os.replace(tmp, side)
+
+
+def list_segments(path: str) -> list:
+    """Closed segments of a log, oldest first, as loaded sidecar dicts"""
+    p = Path(path)
+    segments = []
+    if not p.parent.exists():
+        return segments
+    for side in sorted(p.parent.glob(f"{p.stem}.*.idx.json")):
+        try:
+            meta = json.loads(side.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            continue
+        meta['path'] = side.with_name(meta['file'])
+        meta['sidecar'] = side
+        segments.append(meta)
+    return segments
+
+
+def rotate(path: str, index: SegmentIndex, policy: RotationPolicy) -> Path:
+    """Close the active file at `path` into a timestamped segment.
+
+    The caller must already have closed its handle. Returns the segment path.
+    """
+    p = Path(path)
+    stamp = (index.start or datetime.now().strftime(TIME_FORMAT)).replace('-', '').replace(':', '').replace(' ', '-')
+    target = p.with_name(f"{p.stem}.{stamp}{p.suffix}")
+    n = 1
+    while target.exists() or target.with_name(target.name + '.gz').exists():
+        target = p.with_name(f"{p.stem}.{stamp}_{n}{p.suffix}")
+        n += 1
+    os.replace(p, target)
+    write_sidecar(target, index, compressed=False)
+    return target
+
+
+def compress_segment(segment: Path) -> Path:
+    """Gzip a closed segment in place, the offsets in its sidecar stay valid"""
+    gz_path = segment.with_name(segment.name + '.gz')
+    tmp = gz_path.with_name(gz_path.name + '.tmp')
+    with segment.open('rb') as src, gzip.open(tmp, 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    os.replace(tmp, gz_path)
+
+    side = _sidecar(segment)
+    meta = json.loads(side.read_text(encoding='utf-8'))
+    meta['file'] = gz_path.name
+    meta['compressed'] = True
+    tmp_side = side.with_name(side.name + '.tmp')
+    tmp_side.write_text(json.dumps(meta), encoding='utf-8')
+    os.replace(tmp_side, side)
+    segment.unlink()
+    return gz_path
+
+
+def prune_segments(path: str, max_segments: Optional[int]) -> None:
+    """Delete the oldest closed segments beyond `max_segments`"""
+    if max_segments is None:
+        return
+    segments = list_segments(path)
+    for meta in segments[:max(0, len(segments) - max_segments)]:
+        for f in (meta['path'], meta['sidecar']):
+            try:
+                f.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def _overlaps(seg_start, seg_end, start, end) -> bool:
+    if seg_start is None:
+        return False
+    if start is not None and seg_end is not None and seg_end < start:
+        return False
+    if end is not None and seg_start > end:
+        return False
+    return True
+
+
+def _seek_offset(offsets: list, start) -> int:
+    """Largest indexed offset whose time is still before `start`"""
+    best = 0
+    if start is None:
+        return best
+    for time_str, offset in offsets:
+        if time_str < start:
+            best = offset
+        else:
+            break
+    return best
+
+
+def read_segment(data_path: Path, meta: dict, start=None, end=None):
+    """Yield the rows of one segment that fall inside [start, end]"""
+    fieldnames = meta.get('fieldnames')
+    offset = _seek_offset(meta.get('offsets', []), start)
+    opener = gzip.open if meta.get('compressed') else open
+    with opener(data_path, 'rb') as raw:
+        header = raw.readline()
+        if not fieldnames:
+            fieldnames = next(csv.reader([header.decode('utf-8')]))
+        if offset > raw.tell():
+            raw.seek(offset)
+        text = io.TextIOWrapper(raw, encoding='utf-8', errors='replace', newline='')
+        time_col = _time_column(fieldnames)
+        past_end = 0
+        for row in csv.reader(text):
+            if not row:
+                continue
+            time_str = row[time_col] if time_col is not None and len(row) > time_col else ''
+            if end is not None and time_str > end:
+                # a late row can still come after this one, stop only once a run of them says we are past
+                past_end += 1
+                if past_end >= PAST_END_ROWS:
+                    break
+                continue
+            past_end = 0
+            if start is not None and time_str < start:
+                continue
+            yield dict(zip(fieldnames, row))
+
+
+def query_segments(path: str, start=None, end=None, active_index: SegmentIndex = None):
+    """Yield rows of a log between `start` and `end` across all its segments.
+
+    Only segments whose time range overlaps the window are opened.
+    `start`/`end` are datetimes or "YYYY-mm-dd HH:MM:SS" strings.
+    """
+    if isinstance(start, datetime):
+        start = start.strftime(TIME_FORMAT)
+    if isinstance(end, datetime):
+        end = end.strftime(TIME_FORMAT)
+
+    for meta in list_segments(path):
+        if _overlaps(meta.get('start'), meta.get('end'), start, end):
+            yield from read_segment(meta['path'], meta, start, end)
+
+    p = Path(path)
+    if not p.exists() or p.stat().st_size == 0:
+        return
+    if active_index is None:
+        active_index = scan_segment(p)
+    if _overlaps(active_index.start, active_index.end, start, end):
+        meta = {'fieldnames': active_index.fieldnames, 'offsets': active_index.offsets, 'compressed': False}
+        yield from read_segment(p, meta, start, end)
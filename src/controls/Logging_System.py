@@ -3,10 +3,22 @@
 # Last Modified 1/13/2026
 
 import csv
+import os
+import queue
+import sys
+import threading
+import time
+import atexit
+import io
+import itertools
 from pathlib import Path
 from datetime import datetime
 from enum import Enum
 from abc import ABC, abstractmethod
+from .Log_Segments import RotationPolicy, SegmentIndex, scan_segment, rotate, compress_segment, prune_segments, query_segments, \
+    list_segments, read_segment
+from .Event_Store import SqliteEventStore
+from .Metrics import LOG_WRITE_SECONDS, LOG_ROWS, LOG_QUEUE_DEPTH
 
 # Paths
 
@@ -26,17 +38,552 @@ class LoggingPath:
 
     
 # CSV file    
+
+FLUSH_INTERVAL = 0.5      # seconds rows may sit in the writer before reaching the OS
+FSYNC_POLICY = 'batch'    # 'never', 'batch' (once per flush) or 'always' (every row)
+MAX_BATCH = 500           # rows taken off the queue per write pass
+FLUSH_TIMEOUT = 5.0       # seconds readers wait for the writer before going ahead without it
+
+
+class LogWriter:
+    """Background writer that keeps log files open and writes rows in batches.
+
+    Rows are queued by append_row_csv and written by a single daemon thread so
+    the state machines never touch the disk themselves.
+    """
+
+    def __init__(self, flush_interval: float = FLUSH_INTERVAL, fsync: str = FSYNC_POLICY, max_batch: int = MAX_BATCH,
+                 rotation: RotationPolicy = None):
+        if fsync not in ('never', 'batch', 'always'):
+            raise ValueError(f"Unknown fsync policy: {fsync}")
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.max_batch = max_batch
+        self.rotation = rotation if rotation is not None else RotationPolicy()
+        self._indexes = {}
+        self._line = io.StringIO()
+        self._queue = queue.Queue()
+        self._files = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='LogWriter', daemon=True)
+                self._thread.start()
+
+    def write(self, path: str, row: dict, fieldnames: list) -> None:
+        """Queue a row, returns immediately"""
+        if self._closed:
+            raise RuntimeError("Log writer is closed")
+        if self._thread is None:
+            self.start()
+        # absolute now, the writer thread opens it later and maybe after a chdir
+        self._queue.put((_index_key(path), row, fieldnames))
+
+    def write_many(self, items: list) -> None:
+        """Queue several (path, row, fieldnames) rows as one write"""
+        if self._closed:
+            raise RuntimeError("Log writer is closed")
+        if self._thread is None:
+            self.start()
+        self._queue.put([(_index_key(path), row, fieldnames) for path, row, fieldnames in items])
+
+    def flush(self, timeout: float = None) -> bool:
+        """Block until every row queued so far is written. Returns False on timeout"""
+        if self._thread is None:
+            return True
+        if self._closed or not self._thread.is_alive():
+            # nothing is left to pick up a flush request, everything was written on close
+            return self._closed and not self._thread.is_alive()
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Write out everything still queued and close the files"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+
+    def _run(self) -> None:
+        dirty = set()
+        last_flush = time.monotonic()
+        running = True
+        while running:
+            timeout = None
+            if dirty:
+                timeout = max(0.0, self.flush_interval - (time.monotonic() - last_flush))
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = False  # flush interval elapsed
+
+            started = time.perf_counter()
+            waiters = []
+            taken = 0
+            while item is not False:
+                if item is None:
+                    running = False
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                elif isinstance(item, list):
+                    for path, row, fieldnames in item:
+                        self._write_row(path, row, fieldnames)
+                        dirty.add(path)
+                    taken += len(item)
+                else:
+                    self._write_row(*item)
+                    dirty.add(item[0])
+                    taken += 1
+                if taken >= self.max_batch or not running:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+            if dirty and (waiters or not running or time.monotonic() - last_flush >= self.flush_interval):
+                self._flush_files(dirty)
+                dirty.clear()
+                last_flush = time.monotonic()
+            if taken:
+                LOG_WRITE_SECONDS.observe(time.perf_counter() - started, ('csv',))
+                LOG_ROWS.inc(('csv',), taken)
+            for waiter in waiters:
+                waiter.set()
+
+        self._flush_files(self._files)
+        for f, _ in self._files.values():
+            f.close()
+        self._files.clear()
+        self._indexes.clear()
+
+    def queue_depth(self) -> int:
+        """Writes queued and not yet taken by the writer thread"""
+        return self._queue.qsize()
+
+    def segment_index(self, path: str) -> SegmentIndex:
+        """Index of the active segment of `path`, if this writer has it open"""
+        return self._indexes.get(path)
+
+    def _open(self, path: str, fieldnames: list):
+        entry = self._files.get(path)
+        if entry is None:
+            p = Path(path)
+            p.parent.mkdir(parents=True, exist_ok=True)
+            index = scan_segment(p) if p.exists() and p.stat().st_size > 0 else SegmentIndex(fieldnames)
+            f = p.open('ab')
+            entry = (f, fieldnames)
+            self._files[path] = entry
+            self._indexes[path] = index
+            if f.tell() == 0:
+                f.write(self._format(fieldnames, None))
+                index.size = f.tell()
+        return entry
+
+    def _format(self, fieldnames: list, row) -> bytes:
+        buf = self._line
+        buf.seek(0)
+        buf.truncate()
+        writer = csv.DictWriter(buf, fieldnames=fieldnames)
+        if row is None:
+            writer.writeheader()
+        else:
+            writer.writerow(row)
+        return buf.getvalue().encode('utf-8')
+
+    def _write_row(self, path: str, row: dict, fieldnames: list) -> None:
+        try:
+            f, file_fields = self._open(path, fieldnames)
+            line = self._format(file_fields, row)
+            index = self._indexes[path]
+            f.write(line)
+            index.add(row.get('Time', ''), index.size, len(line))
+            if self.fsync == 'always':
+                f.flush()
+                os.fsync(f.fileno())
+            if self.rotation.should_rotate(index, datetime.now()):
+                self._rotate(path)
+        except Exception as e:
+            # a bad row (e.g. a field the file has no column for) must not stop the writer
+            print(f"Log write to {path} failed: {e!r}")
+
+    def _rotate(self, path: str) -> None:
+        """Close the active segment of `path`, the next row starts a new file"""
+        self._flush_files([path])
+        f, _ = self._files.pop(path)
+        f.close()
+        index = self._indexes.pop(path)
+        segment = rotate(path, index, self.rotation)
+        policy = self.rotation
+        # compression and pruning stay off the writer thread
+        threading.Thread(target=_compact, args=(path, segment, policy), name='LogCompact', daemon=True).start()
+
+    def _flush_files(self, paths) -> None:
+        for path in list(paths):
+            entry = self._files.get(path)
+            if entry is None:
+                continue
+            f = entry[0]
+            try:
+                f.flush()
+                if self.fsync == 'batch':
+                    os.fsync(f.fileno())
+            except OSError as e:
+                print(f"Log flush of {path} failed: {e}")
+
+
+def _compact(path: str, segment: Path, policy: RotationPolicy) -> None:
+    try:
+        if policy.compress:
+            compress_segment(segment)
+        prune_segments(path, policy.max_segments)
+    except OSError as e:
+        print(f"Log compaction of {segment} failed: {e}")
+
+
+_writer = LogWriter()
+
+
+def configure_log_writer(flush_interval: float = FLUSH_INTERVAL, fsync: str = FSYNC_POLICY, max_batch: int = MAX_BATCH,
+                         rotation: RotationPolicy = None) -> LogWriter:
+    """Replace the shared log writer, flushing whatever the old one still holds"""
+    global _writer
+    old = _writer
+    _writer = LogWriter(flush_interval, fsync, max_batch, rotation)
+    old.close()
+    return _writer
+
+
+def flush_logs(timeout: float = None) -> bool:
+    """Wait until every queued log row is on disk"""
+    return _writer.flush(timeout)
+
+
+def log_queue_depth() -> int:
+    """Writes waiting in the csv writer and, if it is in use, the SQLite store"""
+    depth = _writer.queue_depth()
+    if isinstance(_backend, SqliteBackend):
+        depth += _backend.store.queue_depth()
+    return depth
+
+
+LOG_QUEUE_DEPTH.fn = log_queue_depth
+
+
+def shutdown_logging() -> None:
+    """Flush and close the log files, called on app shutdown and at exit"""
+    if _backend is not None:
+        _backend.close()
+    _writer.close()
+
+
+atexit.register(shutdown_logging)
+
+
+def query_log(path: str, start=None, end=None):
+    """Rows of a log between `start` and `end` (datetimes or "YYYY-mm-dd HH:MM:SS"),
+    reading only the segments that overlap the window.
+    """
+    flush_logs(FLUSH_TIMEOUT)
+    return query_segments(path, start, end, _writer.segment_index(path))
+
         
 def append_row_csv(path: str, row: dict, fieldnames: list):
-    p = Path(path)
-    p.parent.mkdir(parents=True, exist_ok=True)
-    file_has_data = p.exists() and p.stat().st_size > 0
+    """Queue a row for `path`. The row's Time should be taken by the caller when the event happens"""
+    _writer.write(path, row, fieldnames)
+
+
+# Last status index
+
+TAIL_BYTES = 64 * 1024  # how much of the log tail is parsed at startup
+_MISSING = object()
+
+
+class StatusIndex:
+    """Last recorded status per device name for one log file.
+
+    Built once from the tail of the file, then kept current in memory so
+    log_state_change never has to re-read the log.
+    """
+
+    def __init__(self, path: str, tail_bytes: int = TAIL_BYTES):
+        self.path = Path(path)
+        self.last_status = {}
+        self.tail_bytes = tail_bytes
+        self._segment_status = None
+        self._load_tail()
+
+    def _load_tail(self) -> None:
+        """Seed the index from the last `tail_bytes` of the log"""
+        if not self.path.exists():
+            return
+        with self.path.open('rb') as f:
+            size = f.seek(0, 2)
+            start = max(0, size - self.tail_bytes)
+            f.seek(start)
+            data = f.read()
+        lines = data.split(b'\n')
+        if start > 0:
+            lines = lines[1:]  # first line is most likely cut in half
+        for name, status in _parse_rows(lines):
+            self.last_status[name] = status
+
+    def _scan_back(self, name: str):
+        """Look further back than the tail for a name the index has not seen.
+
+        Reads the active file backwards, then the newest rotated segment if the
+        name is not in it (the log was just rotated). Runs at most once per
+        name, the result (found or not) is cached.
+        """
+        status = _MISSING
+        if self.path.exists():
+            for line in _reverse_lines(self.path):
+                for row_name, row_status in _parse_rows([line]):
+                    if row_name == name:
+                        status = row_status
+                        break
+                else:
+                    continue
+                break
+        if status is _MISSING:
+            status = self._newest_segment().get(name)
+        self.last_status[name] = status
+        return status
+
+    def _newest_segment(self) -> dict:
+        """Last status per name in the newest rotated segment, read once"""
+        if self._segment_status is None:
+            self._segment_status = {}
+            segments = list_segments(str(self.path))
+            if segments:
+                newest = segments[-1]
+                try:
+                    for row in read_segment(newest['path'], newest):
+                        if 'Name' in row:
+                            self._segment_status[row['Name']] = row.get('Status')
+                except OSError as e:
+                    print(f"Reading log segment {newest['path']} failed: {e}")
+        return self._segment_status
+
+    def get(self, name: str):
+        status = self.last_status.get(name, _MISSING)
+        if status is _MISSING:
+            status = self._scan_back(name)
+        return status
+
+    def update(self, name: str, status) -> None:
+        self.last_status[name] = status
 
-    with p.open('a', newline='', encoding='utf-8') as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        if not file_has_data:
-            writer.writeheader()
-        writer.writerow(row)
+
+def _parse_rows(lines):
+    """Yield (Name, Status) from raw csv lines, skipping the header"""
+    text = [line.decode('utf-8', errors='replace').rstrip('\r') for line in lines if line.strip()]
+    for row in csv.reader(text):
+        if len(row) < 3 or row[1] == 'Name':
+            continue
+        yield row[1], row[2]
+
+
+def _reverse_lines(path: Path, block_size: int = TAIL_BYTES):
+    """Yield the lines of a file from last to first, one block at a time"""
+    with path.open('rb') as f:
+        pos = f.seek(0, 2)
+        remainder = b''
+        while pos > 0:
+            read_size = min(block_size, pos)
+            pos -= read_size
+            f.seek(pos)
+            chunk = f.read(read_size) + remainder
+            lines = chunk.split(b'\n')
+            remainder = lines[0]
+            for line in reversed(lines[1:]):
+                yield line
+        if remainder:
+            yield remainder
+
+
+_status_indexes = {}
+
+
+_index_keys = {}   # path as given -> resolved path, emptied on every chdir
+
+
+def _forget_index_keys(event: str, args) -> None:
+    # relative paths move with the working directory. Watching for the chdir keeps
+    # getcwd() (a syscall that hands the GIL to the writer thread) out of every log call
+    if event == 'os.chdir':
+        _index_keys.clear()
+
+
+sys.addaudithook(_forget_index_keys)
+
+
+def _index_key(path: str) -> str:
+    """Resolved path of a log, the key of its status index and of the writer's open file"""
+    key = _index_keys.get(path)
+    if key is None:
+        key = str(Path(path).resolve())
+        _index_keys[path] = key
+    return key
+
+
+def get_status_index(path: str) -> StatusIndex:
+    """Get (building it on first use) the last status index for a log file"""
+    key = _index_key(path)
+    index = _status_indexes.get(key)
+    if index is None:
+        index = get_log_backend().status_index(path)
+        _status_indexes[key] = index
+    return index
+
+
+# Storage backends
+
+LOG_BACKEND = os.environ.get('ROBOJAR_LOG_BACKEND', 'csv')   # 'csv' or 'sqlite'
+LOG_DB_PATH = os.environ.get('ROBOJAR_LOG_DB', 'Logs//events.db')
+
+
+def log_paths() -> dict:
+    """Log name -> csv path, the names are what the backends store and query by"""
+    return {Path(path).stem: path for path in (LoggingPath.SystemPath(), LoggingPath.ValvePath(), LoggingPath.PumpPath())}
+
+
+class CsvBackend:
+    """Rows go to the csv files named by LoggingPath"""
+    name = 'csv'
+
+    def append(self, path: str, row: dict, fieldnames: list) -> None:
+        append_row_csv(path, row, fieldnames)
+
+    def append_many(self, items: list) -> None:
+        _writer.write_many(items)
+
+    def status_index(self, path: str) -> StatusIndex:
+        # rows still waiting in the writer would be missed by the tail read
+        flush_logs(FLUSH_TIMEOUT)
+        return StatusIndex(path)
+
+    def query(self, log: str, device: str = None, start: str = None, end: str = None,
+              limit: int = 100, offset: int = 0) -> list:
+        rows = query_log(log_paths()[log], start, end)
+        if device is not None:
+            rows = (row for row in rows if row.get('Name') == device)
+        return list(itertools.islice(rows, offset, offset + limit))
+
+    def flush(self, timeout: float = None) -> bool:
+        return flush_logs(timeout)
+
+    def close(self) -> None:
+        # the writer is shared and may be needed again after a backend switch, shutdown_logging closes it
+        flush_logs(FLUSH_TIMEOUT)
+
+
+class SqliteBackend:
+    """Rows go to one SQLite event store, the csv path only names the log"""
+    name = 'sqlite'
+
+    def __init__(self, db_path: str = LOG_DB_PATH):
+        self.store = SqliteEventStore(db_path)
+
+    def append(self, path: str, row: dict, fieldnames: list) -> None:
+        self.store.append(Path(path).stem, row)
+
+    def append_many(self, items: list) -> None:
+        self.store.append_many([(Path(path).stem, row) for path, row, _ in items])
+
+    def status_index(self, path: str):
+        return self.store.status_index(Path(path).stem)
+
+    def query(self, log: str, device: str = None, start: str = None, end: str = None,
+              limit: int = 100, offset: int = 0) -> list:
+        return self.store.query(log, device, start, end, limit, offset)
+
+    def flush(self, timeout: float = None) -> bool:
+        return self.store.flush(timeout)
+
+    def close(self) -> None:
+        self.store.close()
+
+
+_backends = {'csv': CsvBackend, 'sqlite': SqliteBackend}
+_backend = None
+
+
+def get_log_backend():
+    """The configured storage backend, created from ROBOJAR_LOG_BACKEND on first use"""
+    global _backend
+    if _backend is None:
+        if LOG_BACKEND not in _backends:
+            raise ValueError(f"Unknown log backend: {LOG_BACKEND}")
+        _backend = _backends[LOG_BACKEND]()
+    return _backend
+
+
+def set_log_backend(backend) -> None:
+    """Switch storage backends, e.g. set_log_backend(SqliteBackend('runs.db'))"""
+    global _backend
+    old = _backend
+    _backend = backend
+    _status_indexes.clear()
+    if old is not None and old is not backend:
+        old.close()
+
+
+_batches = threading.local()
+
+
+class log_batch:
+    """Collect the rows logged by this thread and hand them to the backend as one write.
+
+        with log_batch():
+            valve.on_event(ValveState.OPEN)
+            pump.on_event(PumpState.RUNNING)
+    """
+
+    def __enter__(self):
+        self.outer = getattr(_batches, 'rows', None)
+        if self.outer is None:
+            _batches.rows = []
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.outer is not None:
+            return False  # nested, the outermost batch writes
+        rows = _batches.rows
+        _batches.rows = None
+        if rows:
+            get_log_backend().append_many(rows)
+        return False
+
+
+def log_event(path: str, row: dict, fieldnames: list) -> None:
+    """Record a row in the log named by `path` through the configured backend"""
+    # resolved once here, everything below gets the absolute path
+    path = _index_key(path)
+    batch = getattr(_batches, 'rows', None)
+    if batch is not None:
+        batch.append((path, row, fieldnames))
+    else:
+        get_log_backend().append(path, row, fieldnames)
+
+    index = _status_indexes.get(path)
+    if index is not None and 'Name' in row:
+        index.update(row['Name'], row.get('Status'))
+
+
+def query_history(log: str = 'SystemLog', device: str = None, start: str = None, end: str = None,
+                  limit: int = 100, offset: int = 0) -> list:
+    """Page of logged events filtered by device and time window"""
+    if log not in log_paths():
+        raise ValueError(f"Unknown log: {log}")
+    return get_log_backend().query(log, device, start, end, limit, offset)
 
 
 def log_state_change(path: str, name: str, status: str, notes: str = '', fieldnames = None) -> bool:
@@ -47,24 +594,14 @@ def log_state_change(path: str, name: str, status: str, notes: str = '', fieldna
     if fieldnames is None:
         fieldnames = ['Time', 'Name', 'Status', 'Notes']
 
-    p = Path(path)
     time_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-    last_status = None
-    if p.exists() and p.stat().st_size > 0:
-        with p.open('r', newline='', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            rows = list(reader)
-            # find last entry for this name
-            for row in reversed(rows):
-                if row.get('Name') == name:
-                    last_status = row.get('Status')
-                    break
-
-    if last_status == status:
+    path = _index_key(path)
+    index = get_status_index(path)
+    if index.get(name) == status:
         return False
 
-    append_row_csv(path, {'Time': time_str, 'Name': name, 'Status': status, 'Notes': notes}, fieldnames)
+    log_event(path, {'Time': time_str, 'Name': name, 'Status': status, 'Notes': notes}, fieldnames)
     return True
 
 # Modes
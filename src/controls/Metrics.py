@@ -0,0 +1,208 @@
+# Metrics Module - RoboJar Automation
+# Counters, gauges and histograms served in the Prometheus text format on /metrics
+
+import asyncio
+import bisect
+import threading
+import time
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LOOP_LAG_INTERVAL = 0.5  # seconds between event loop lag probes
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names: tuple, values: tuple, extra: str = '') -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self._lock = threading.Lock()
+
+    def header(self) -> list:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> list:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        super().__init__(name, help, labels)
+        self._values = {}
+
+    def inc(self, labels: tuple = (), amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, labels: tuple = ()) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self) -> list:
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [f"{self.name}{_labels(self.labelnames, k)} {_number(v)}" for k, v in items]
+
+
+class Gauge(Metric):
+    """Set directly, or read from `fn` at scrape time"""
+    kind = 'gauge'
+
+    def __init__(self, name: str, help: str, labels: tuple = (), fn=None):
+        super().__init__(name, help, labels)
+        self.fn = fn
+        self._values = {}
+
+    def set(self, value: float, labels: tuple = ()) -> None:
+        self._values[labels] = value
+
+    def render(self) -> list:
+        if self.fn is not None:
+            try:
+                items = [((), self.fn())]
+            except Exception:
+                items = []
+        else:
+            items = list(self._values.items())
+        return self.header() + [f"{self.name}{_labels(self.labelnames, k)} {_number(v)}" for k, v in items]
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        self._series = {}   # labels -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, labels: tuple = ()) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 3)
+            series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list:
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._series.items()]
+        lines = self.header()
+        for labels, series in items:
+            running = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series):
+                running += count
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {running}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(series[-2])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {series[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+HTTP_LATENCY = REGISTRY.register(Histogram(
+    'robojar_http_request_duration_seconds', 'Time to answer an HTTP request, by route template',
+    ('method', 'route', 'status')))
+TRANSITIONS = REGISTRY.register(Counter(
+    'robojar_state_transitions_total', 'State machine transitions', ('kind', 'device', 'from', 'to')))
+LOG_WRITE_SECONDS = REGISTRY.register(Histogram(
+    'robojar_log_write_seconds', 'Time to write (and flush) one batch of log rows', ('backend',)))
+LOG_ROWS = REGISTRY.register(Counter(
+    'robojar_log_rows_total', 'Log rows written', ('backend',)))
+LOG_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    'robojar_log_queue_depth', 'Log writes queued and not yet picked up by a writer thread'))
+LOOP_LAG = REGISTRY.register(Histogram(
+    'robojar_event_loop_lag_seconds', 'How late the event loop woke a sleeping task'))
+
+
+class StateTimes(Metric):
+    """Transition counts and seconds spent per state, fed by a MachineSpec enter hook"""
+    kind = 'counter'
+
+    def __init__(self):
+        super().__init__('robojar_state_seconds_total', 'Seconds each device has spent in each state',
+                         ('kind', 'device', 'state'))
+        self._entered = {}   # (kind, device) -> (state, monotonic time)
+        self._seconds = {}   # (kind, device, state) -> seconds in finished visits
+
+    def enter(self, machine, state) -> None:
+        now = time.monotonic()
+        key = (machine.spec.kind, machine.name)
+        with self._lock:
+            previous = self._entered.get(key)
+            self._entered[key] = (state.name, now)
+            if previous is not None:
+                seconds_key = key + (previous[0],)
+                self._seconds[seconds_key] = self._seconds.get(seconds_key, 0.0) + now - previous[1]
+        if previous is not None:
+            TRANSITIONS.inc((key[0], key[1], previous[0], state.name))
+
+    def render(self) -> list:
+        now = time.monotonic()
+        with self._lock:
+            seconds = dict(self._seconds)
+            for (kind, device), (state, since) in self._entered.items():
+                key = (kind, device, state)
+                seconds[key] = seconds.get(key, 0.0) + now - since  # the visit still going on
+        return self.header() + [f"{self.name}{_labels(self.labelnames, k)} {_number(v)}"
+                                for k, v in sorted(seconds.items())]
+
+
+STATE_TIMES = REGISTRY.register(StateTimes())
+_instrumented = set()
+
+
+def instrument_spec(spec) -> None:
+    """Count transitions and time in state for every machine of `spec`. Call before creating machines"""
+    if id(spec) not in _instrumented:
+        _instrumented.add(id(spec))
+        spec.on_enter(STATE_TIMES.enter)
+
+
+async def monitor_loop_lag(interval: float = LOOP_LAG_INTERVAL) -> None:
+    """Sleep `interval` over and over, recording how much later than asked each wake-up came"""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        LOOP_LAG.observe(max(0.0, loop.time() - start - interval))
+
+
+def render() -> str:
+    return REGISTRY.render()
@@ -0,0 +1,254 @@
+# Modbus Bridge Module - RoboJar Automation
+# Modbus TCP server inside the app, registers map straight onto SystemController
+
+import asyncio
+import os
+
+try:
+    from pymodbus.datastore import ModbusSlaveContext
+    from pymodbus.datastore.store import BaseModbusDataBlock
+except ImportError:  # optional, the bridge just doesn't start without it
+    BaseModbusDataBlock = ModbusSlaveContext = object
+
+from .Valve_State_Machine import ValveState
+from .Pump_State_Machine import PumpState
+from .Motion import Motion
+
+# local only by default, the bridge can move valves and the pump; set ROBOJAR_MODBUS_HOST=0.0.0.0 for a SCADA on the network
+MODBUS_HOST = os.environ.get('ROBOJAR_MODBUS_HOST', '127.0.0.1')
+MODBUS_PORT = int(os.environ.get('ROBOJAR_MODBUS_PORT', '1502'))  # 0 turns the bridge off
+MODBUS_UNIT = 1
+
+# Register map, zero based, the same addresses in every table:
+#
+#   address     coils / discrete inputs     holding / input registers
+#   0 - 7       valve n+1 open (1) / closed  valve n+1 state code
+#   8           pump on                      pump state code
+#   9           sensor on                    sensor state code (0 off, 1 on)
+#   10 - 11     -                            state version, high word first (input registers only)
+#
+# Writing a coil is the same command as the web buttons (valve Open/Close
+# moves the servo, pump and sensor On/Off). Writing a holding register sends the state's event
+# to the machine, which ignores it if the current state doesn't accept it. Valve codes are the
+# exception: OPENING/OPEN and CLOSING/CLOSED move the servo like the coil, only IDLE is an event.
+# Writes to valves the controller doesn't have get an illegal address exception.
+VALVE_BASE = 0
+MAX_VALVES = 8
+PUMP_ADDRESS = 8
+SENSOR_ADDRESS = 9
+VERSION_ADDRESS = 10
+TABLE_SIZES = {'co': 10, 'di': 10, 'hr': 10, 'ir': 12}
+WRITE_FUNCTIONS = (5, 6, 15, 16, 23)   # write coil(s), write register(s), read/write registers
+
+VALVE_CODES = list(ValveState)   # IDLE 0, CLOSING 1, OPENING 2, OPEN 3, CLOSED 4
+PUMP_CODES = list(PumpState)     # IDLE 0, PRIMING 1, RUNNING 2
+OPEN_STATES = ('OPEN', 'OPENING')
+CLOSED_STATES = ('CLOSED', 'CLOSING')
+PUMP_ON_STATES = ('RUNNING', 'PRIMING')
+
+
+def build_image(system) -> dict:
+    """Every table's values for one state version of `system`"""
+    valves = [0] * MAX_VALVES
+    valve_codes = [0] * MAX_VALVES
+    for num, valve in system.valves.items():
+        if num <= MAX_VALVES:
+            valves[num - 1] = int(valve.state.name in OPEN_STATES)
+            valve_codes[num - 1] = VALVE_CODES.index(ValveState[valve.state.name])
+    pump_state = system.pump.state.name
+    sensor = int(system.sensor_active)
+    version = system.version & 0xFFFFFFFF
+
+    bits = valves + [int(pump_state in PUMP_ON_STATES), sensor]
+    registers = valve_codes + [PUMP_CODES.index(PumpState[pump_state]), sensor]
+    return {
+        'co': bits,
+        'di': bits,
+        'hr': registers,
+        'ir': registers + [version >> 16, version & 0xFFFF],
+    }
+
+
+class ModbusBridge:
+    """Serves SystemController over Modbus TCP on the app's event loop.
+
+    Reads come from a register image rebuilt only when the controller's state
+    version changes, so one request never mixes two states. Writes run on the
+    device's command worker like the HTTP routes and are answered once applied.
+    """
+
+    def __init__(self, system, host: str = MODBUS_HOST, port: int = MODBUS_PORT, unit: int = MODBUS_UNIT,
+                 notify=None):
+        self.system = system
+        self.host = host
+        self.port = port
+        self.unit = unit
+        self.notify = notify          # notify(command) after a coil write, e.g. app.send_command
+        self.server = None
+        self._task = None
+        self._image = None
+        self._loop = None
+        self._moves = set()           # valve moves still travelling after a coil write
+
+    def image(self) -> dict:
+        cached = self._image
+        version = self.system.version
+        if cached is None or cached[0] != version:
+            cached = (version, build_image(self.system))
+            self._image = cached
+        return cached[1]
+
+    def read(self, table: str, address: int, count: int) -> list:
+        return self.image()[table][address:address + count]
+
+    def commands(self, table: str, address: int, values: list) -> list:
+        """(device, fn, args, command name) for each written value"""
+        out = (self._command(table, address + offset, int(value)) for offset, value in enumerate(values))
+        return [command for command in out if command is not None]
+
+    def _command(self, table: str, address: int, value: int):
+        if VALVE_BASE <= address < VALVE_BASE + MAX_VALVES:
+            num = address - VALVE_BASE + 1
+            if num not in self.system.valves:
+                return None
+            if table == 'co':
+                action = "Open" if value else "Close"
+                return f"valve{num}", self.system.motion.start, (num, bool(value)), f"valve{num}{action}"
+            if value < len(VALVE_CODES):
+                state = VALVE_CODES[value]
+                if state.name in OPEN_STATES or state.name in CLOSED_STATES:
+                    # the motion coordinator sets OPEN/CLOSED once the servo got there
+                    return f"valve{num}", self.system.motion.start, (num, state.name in OPEN_STATES), None
+                return f"valve{num}", self._valve_event, (num, state), None
+        elif address == PUMP_ADDRESS:
+            if table == 'co':
+                return "pump", self._pump_event, (PumpState.RUNNING if value else PumpState.IDLE,), \
+                    f"pump{'On' if value else 'Off'}"
+            if value < len(PUMP_CODES):
+                return "pump", self._pump_event, (PUMP_CODES[value],), None
+        elif address == SENSOR_ADDRESS and value in (0, 1):
+            return "sensor", self._set_sensor, (bool(value),), \
+                f"sensor{'On' if value else 'Off'}" if table == 'co' else None
+        return None
+
+    def _valve_event(self, num: int, event: ValveState) -> None:
+        self.system.get_valve(num).on_event(event)
+
+    def _pump_event(self, event: PumpState) -> None:
+        self.system.get_pump().on_event(event)
+
+    def _set_sensor(self, active: bool) -> None:
+        self.system.sensor_active = active
+
+    async def write(self, table: str, address: int, values: list) -> None:
+        """Apply a write. Valves are answered once their move started, OPEN/CLOSED follows after the travel time"""
+        for device, fn, args, name in self.commands(table, address, values):
+            self._travel(await self.system.run_command(device, fn, *args))
+            if name and self.notify:
+                self.notify(name)
+
+    def write_nowait(self, table: str, address: int, values: list) -> None:
+        """write() for pymodbus versions that only call the blocking setValues"""
+        for device, fn, args, name in self.commands(table, address, values):
+            future = self.system.submit_command(device, fn, *args)
+            if self._loop is not None:
+                future.add_done_callback(self._travel_later)
+            if name and self.notify:
+                self.notify(name)
+
+    def _travel_later(self, future) -> None:
+        # on the device worker, the rest of the move belongs to the loop
+        if not future.cancelled() and future.exception() is None:
+            self._loop.call_soon_threadsafe(self._travel, future.result())
+
+    def _travel(self, result) -> None:
+        """Finish a valve move in the background, on the bridge's loop"""
+        if isinstance(result, Motion):
+            task = self._loop.create_task(self.system.motion.finish(result))
+            self._moves.add(task)
+            task.add_done_callback(self._moves.discard)
+
+    def writable(self, address: int, count: int) -> bool:
+        """False if the range covers a valve the controller doesn't have"""
+        valves = range(max(address, VALVE_BASE), min(address + count, VALVE_BASE + MAX_VALVES))
+        return all(a - VALVE_BASE + 1 in self.system.valves for a in valves)
+
+    def context(self):
+        from pymodbus.datastore import ModbusServerContext
+
+        store = ControllerContext(
+            di=ControllerBlock(self, 'di'),
+            co=ControllerBlock(self, 'co'),
+            hr=ControllerBlock(self, 'hr'),
+            ir=ControllerBlock(self, 'ir'),
+            zero_mode=True)
+        return ModbusServerContext(slaves={self.unit: store}, single=False)
+
+    async def start(self) -> bool:
+        """Start serving on the running loop. False if turned off or pymodbus is missing"""
+        if not self.port or self._task is not None:
+            return False
+        if BaseModbusDataBlock is object:
+            print("pymodbus not installed, Modbus bridge disabled (pip install pymodbus)")
+            return False
+        from pymodbus.server import ModbusTcpServer
+
+        self._loop = asyncio.get_running_loop()
+        self.server = ModbusTcpServer(self.context(), address=(self.host, self.port))
+        self._task = asyncio.get_running_loop().create_task(self.server.serve_forever())
+        return True
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        await self.server.shutdown()
+        for move in list(self._moves):
+            move.cancel()
+        self._task.cancel()
+        try:
+            await self._task
+        except (asyncio.CancelledError, Exception):
+            pass
+        self._task = None
+        self.server = None
+
+
+class ControllerContext(ModbusSlaveContext):
+    """Slave context that also checks writes against the controller's valves"""
+
+    def validate(self, fc_as_hex, address, count=1):
+        if not super().validate(fc_as_hex, address, count):
+            return False
+        if fc_as_hex in WRITE_FUNCTIONS:
+            return self.store[self.decode(fc_as_hex)].bridge.writable(address, count)
+        return True
+
+
+class ControllerBlock(BaseModbusDataBlock):
+    """One Modbus table ('co', 'di', 'hr' or 'ir') backed by the bridge"""
+
+    def __init__(self, bridge: ModbusBridge, table: str):
+        self.bridge = bridge
+        self.table = table
+        self.address = 0
+        self.default_value = 0
+        self.values = []
+
+    def validate(self, address: int, count: int = 1) -> bool:
+        return count > 0 and address >= 0 and address + count <= TABLE_SIZES[self.table]
+
+    def getValues(self, address: int, count: int = 1) -> list:
+        return self.bridge.read(self.table, address, count)
+
+    async def async_getValues(self, address: int, count: int = 1) -> list:
+        return self.getValues(address, count)
+
+    def setValues(self, address: int, values) -> None:
+        if not isinstance(values, list):
+            values = [values]
+        self.bridge.write_nowait(self.table, address, values)
+
+    async def async_setValues(self, address: int, values) -> None:
+        if not isinstance(values, list):
+            values = [values]
+        await self.bridge.write(self.table, address, values)
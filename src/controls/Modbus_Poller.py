@@ -0,0 +1,284 @@
+# Modbus Poller Module - RoboJar Automation
+# Polls field devices (flow meters, turbidimeters, other rigs) over Modbus TCP
+
+import asyncio
+import json
+import os
+import time
+from pathlib import Path
+
+DEVICES_FILE = os.environ.get('ROBOJAR_MODBUS_DEVICES', 'modbus_devices.json')
+MAX_REGISTERS = 125   # per read request, Modbus limit
+MAX_BITS = 2000
+RECONNECT_MIN = 0.5   # seconds, doubles after each failed attempt
+RECONNECT_MAX = 30.0
+
+# table -> client read method
+READS = {
+    'co': 'read_coils',
+    'di': 'read_discrete_inputs',
+    'hr': 'read_holding_registers',
+    'ir': 'read_input_registers',
+}
+
+
+class Point:
+    """One named value on a device, e.g. Point("flow", "ir", 4, count=2, scale=0.01)"""
+    __slots__ = ('name', 'table', 'address', 'count', 'scale', 'signed')
+
+    def __init__(self, name: str, table: str, address: int, count: int = 1, scale: float = 1.0,
+                 signed: bool = False):
+        if table not in READS:
+            raise ValueError(f"Unknown table {table}, pick one of {sorted(READS)}")
+        if table in ('co', 'di') and count != 1:
+            raise ValueError("Bit points are one coil or input")
+        if count not in (1, 2):
+            raise ValueError("Register points are 1 or 2 registers (16 or 32 bit)")
+        self.name = name
+        self.table = table
+        self.address = address
+        self.count = count
+        self.scale = scale
+        self.signed = signed
+
+    @property
+    def end(self) -> int:
+        return self.address + self.count
+
+    def decode(self, values: list, offset: int):
+        raw = values[offset:offset + self.count]
+        if self.table in ('co', 'di'):
+            return bool(raw[0])
+        value = 0
+        for word in raw:  # high word first
+            value = (value << 16) | (word & 0xFFFF)
+        bits = 16 * self.count
+        if self.signed and value >= 1 << (bits - 1):
+            value -= 1 << bits
+        return value * self.scale if self.scale != 1.0 else value
+
+
+class Block:
+    """One contiguous read covering several points"""
+    __slots__ = ('table', 'address', 'count', 'points')
+
+    def __init__(self, table: str, address: int, count: int, points: list):
+        self.table = table
+        self.address = address
+        self.count = count
+        self.points = points
+
+    def __repr__(self) -> str:
+        return f"Block({self.table}, {self.address}, {self.count})"
+
+
+def coalesce(points: list, max_gap: int = 0) -> list:
+    """Fewest contiguous reads covering every point.
+
+    Points in the same table merge when the gap between them is at most
+    `max_gap` unused addresses and the read stays within the Modbus size limit.
+    """
+    blocks = []
+    by_table = {}
+    for point in points:
+        by_table.setdefault(point.table, []).append(point)
+    for table, table_points in by_table.items():
+        limit = MAX_BITS if table in ('co', 'di') else MAX_REGISTERS
+        block = None
+        for point in sorted(table_points, key=lambda p: p.address):
+            if block is not None and point.address <= block.address + block.count + max_gap \
+                    and max(point.end, block.address + block.count) - block.address <= limit:
+                block.count = max(point.end, block.address + block.count) - block.address
+                block.points.append(point)
+                continue
+            block = Block(table, point.address, point.count, [point])
+            blocks.append(block)
+    return blocks
+
+
+class FieldDevice:
+    """Where a device is, what to read from it and how often"""
+
+    def __init__(self, name: str, host: str, points: list, port: int = 502, unit: int = 1,
+                 period: float = 1.0, timeout: float = 1.0, max_gap: int = 0):
+        if period <= 0:
+            raise ValueError("period must be positive")
+        self.name = name
+        self.host = host
+        self.port = port
+        self.unit = unit
+        self.period = period
+        self.timeout = timeout
+        self.points = points
+        self.blocks = coalesce(points, max_gap)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'FieldDevice':
+        points = [Point(**p) for p in data.get('points', [])]
+        options = {k: data[k] for k in ('port', 'unit', 'period', 'timeout', 'max_gap') if k in data}
+        return cls(data['name'], data['host'], points, **options)
+
+
+def load_devices(path: str = DEVICES_FILE) -> list:
+    """Devices from a json list like
+    [{"name": "flow1", "host": "10.0.0.5", "period": 0.5,
+      "points": [{"name": "flow", "table": "ir", "address": 0, "count": 2, "scale": 0.01}]}]
+    """
+    p = Path(path)
+    if not p.is_file():
+        return []
+    return [FieldDevice.from_dict(d) for d in json.loads(p.read_text(encoding='utf-8'))]
+
+
+class DevicePoller:
+    """One persistent connection to one device, polled on the device's own period"""
+
+    def __init__(self, device: FieldDevice, sink):
+        self.device = device
+        self.sink = sink              # sink(device name, {point: value}) after every good poll
+        self.client = None
+        self.connected = False
+        self.polls = 0
+        self.errors = 0               # polls lost to the connection
+        self.read_errors = 0          # blocks the device answered with a Modbus exception
+        self.reconnects = 0
+        self.last_poll = None
+        self.last_error = None
+        self.task = None
+
+    async def _connect(self) -> bool:
+        from pymodbus.client import AsyncModbusTcpClient
+
+        if self.client is None:
+            # reconnects are ours (with backoff), not the client's
+            self.client = AsyncModbusTcpClient(self.device.host, port=self.device.port,
+                                               timeout=self.device.timeout, retries=0, reconnect_delay=0)
+        self.connected = bool(await self.client.connect())
+        return self.connected
+
+    def _disconnect(self) -> None:
+        if self.client is not None:
+            self.client.close()
+            self.client = None
+        self.connected = False
+
+    async def poll(self) -> dict:
+        """Read every block once, values by point name.
+
+        A block the device rejects (e.g. an illegal address) is skipped and its
+        points left out, the connection stays up. Transport errors raise.
+        """
+        values = {}
+        for block in self.device.blocks:
+            read = getattr(self.client, READS[block.table])
+            response = await read(block.address, block.count, slave=self.device.unit)
+            if response.isError():
+                self.read_errors += 1
+                self.last_error = f"{self.device.name} {block}: {response}"
+                continue
+            data = response.bits if block.table in ('co', 'di') else response.registers
+            for point in block.points:
+                values[point.name] = point.decode(data, point.address - block.address)
+        return values
+
+    async def run(self) -> None:
+        device = self.device
+        delay = RECONNECT_MIN
+        next_time = time.monotonic()
+        while True:
+            if not self.connected:
+                try:
+                    ok = await self._connect()
+                except Exception as e:
+                    ok = False
+                    self.last_error = str(e)
+                if not ok:
+                    self._disconnect()
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, RECONNECT_MAX)
+                    continue
+                if self.polls or self.errors:
+                    self.reconnects += 1
+
+            try:
+                values = await self.poll()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # the connection is suspect: start over on a new one, but not before the
+                # next period and the backoff, a device that accepts and then fails can't spin us
+                self.errors += 1
+                self.last_error = str(e)
+                self._disconnect()
+                wait = delay
+                delay = min(delay * 2, RECONNECT_MAX)
+            else:
+                delay = RECONNECT_MIN
+                self.polls += 1
+                self.last_poll = time.time()
+                if values:
+                    self.sink(device.name, values)
+                wait = 0.0
+
+            # fixed rate, a slow poll doesn't push every later one back
+            next_time += device.period
+            now = time.monotonic()
+            if next_time < now:
+                next_time = now
+            await asyncio.sleep(max(wait, next_time - now))
+
+    def stats(self) -> dict:
+        return {
+            "host": f"{self.device.host}:{self.device.port}",
+            "connected": self.connected,
+            "period": self.device.period,
+            "reads_per_poll": len(self.device.blocks),
+            "polls": self.polls,
+            "errors": self.errors,
+            "read_errors": self.read_errors,
+            "reconnects": self.reconnects,
+            "last_poll": self.last_poll,
+            "last_error": self.last_error,
+        }
+
+
+class ModbusPoller:
+    """Keeps every field device's readings current on the running event loop"""
+
+    def __init__(self, sink, devices: list = None):
+        self.sink = sink
+        self.pollers = {}
+        for device in devices or []:
+            self.add(device)
+
+    def add(self, device: FieldDevice) -> None:
+        if device.name in self.pollers:
+            raise ValueError(f"Duplicate device {device.name}")
+        self.pollers[device.name] = DevicePoller(device, self.sink)
+
+    async def start(self) -> bool:
+        """Start polling. False if there is nothing to poll or pymodbus is missing"""
+        if not self.pollers:
+            return False
+        try:
+            import pymodbus.client  # noqa: F401
+        except ImportError:
+            print("pymodbus not installed, field device polling disabled (pip install pymodbus)")
+            return False
+        loop = asyncio.get_running_loop()
+        for poller in self.pollers.values():
+            if poller.task is None:
+                poller.task = loop.create_task(poller.run())
+        return True
+
+    async def stop(self) -> None:
+        tasks = [p.task for p in self.pollers.values() if p.task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for poller in self.pollers.values():
+            poller.task = None
+            poller._disconnect()
+
+    def stats(self) -> dict:
+        return {name: poller.stats() for name, poller in self.pollers.items()}
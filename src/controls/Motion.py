@@ -0,0 +1,157 @@
+# Motion Module - RoboJar Automation
+# Moves several valve servos at once and only reports OPEN/CLOSED once they got there
+
+import asyncio
+import os
+
+from .Devices import get_registry
+from .Logging_System import log_batch
+from .Valve_State_Machine import ValveState
+
+TRAVEL_TIME = float(os.environ.get('ROBOJAR_SERVO_TRAVEL', '0.5'))  # seconds from one end stop to the other
+DETACH_DELAY = 1.0  # seconds a servo holds its end stop before its signal is cut
+
+FILL_MODE = {1: True, 2: True, 3: True}     # diverter, inlet and drain
+START_MODE = {1: False, 2: False, 3: False}
+
+
+class Motion:
+    """One valve move in flight"""
+    __slots__ = ('valve_number', 'opening', 'token', 'travel', 'state')
+
+    def __init__(self, valve_number: int, opening: bool, token: int, travel: float):
+        self.valve_number = valve_number
+        self.opening = opening
+        self.token = token
+        self.travel = travel
+        self.state = None
+
+
+class MotionCoordinator:
+    """Servo moves for the controller's valves.
+
+    A move sends the valve OPENING/CLOSING and commands its servo, waits the
+    valve's travel time without holding any lock or worker, then sends
+    OPEN/CLOSED. Moves of different valves overlap, so a mode change takes
+    as long as the slowest valve; valves moved together (a mode, a batch)
+    start as one locked step and arrive as one. A newer move of the same valve supersedes
+    an older one still travelling. Servos are detached once they sit idle.
+    """
+
+    def __init__(self, system, registry=None, travel_times: dict = None, detach_delay: float = DETACH_DELAY):
+        self.system = system
+        self.registry = registry
+        self.travel_times = travel_times or {}
+        self.detach_delay = detach_delay
+        self.timings = {}   # valve -> seconds its last move actually took
+        self._tokens = {}
+        self._detach = {}   # valve -> pending detach handle
+        self._attached = set()
+
+    def servo(self, valve_number: int):
+        return (self.registry or get_registry()).valve(valve_number)
+
+    def travel_time(self, valve_number: int) -> float:
+        return self.travel_times.get(valve_number, TRAVEL_TIME)
+
+    def start(self, valve_number: int, opening: bool) -> Motion:
+        """First half of a move: OPENING/CLOSING and the servo command.
+
+        Blocking, run on the valve's worker or under system.all_devices_locked().
+        """
+        token = self._tokens.get(valve_number, 0) + 1
+        self._tokens[valve_number] = token
+        valve = self.system.get_valve(valve_number)
+        valve.on_event(ValveState.OPENING if opening else ValveState.CLOSING)
+        servo = self.servo(valve_number)
+        self._attached.add(valve_number)
+        if opening:
+            servo.max()
+        else:
+            servo.min()
+        motion = Motion(valve_number, opening, token, self.travel_time(valve_number))
+        motion.state = valve.state.name
+        return motion
+
+    def arrive(self, motion: Motion) -> str:
+        """Second half: OPEN/CLOSED, unless a newer move took over meanwhile"""
+        valve = self.system.get_valve(motion.valve_number)
+        if self._tokens.get(motion.valve_number) == motion.token:
+            valve.on_event(ValveState.OPEN if motion.opening else ValveState.CLOSED)
+        return valve.state.name
+
+    def _detach_idle(self, valve_number: int, token: int) -> None:
+        self._detach.pop(valve_number, None)
+        if self._tokens.get(valve_number) == token:
+            self.servo(valve_number).detach()
+            self._attached.discard(valve_number)
+
+    def arrive_all(self, motions: list) -> list:
+        """arrive() for moves started together, with nothing in between and one log write"""
+        with self.system.all_devices_locked(), log_batch():
+            return [self.arrive(motion) for motion in motions]
+
+    def _travelling(self, motion: Motion) -> None:
+        pending = self._detach.pop(motion.valve_number, None)
+        if pending is not None:
+            pending.cancel()
+
+    def _arrived(self, motion: Motion, loop, started: float) -> None:
+        self.timings[motion.valve_number] = loop.time() - started
+        if self._tokens.get(motion.valve_number) == motion.token:
+            # stop holding the end stop once nothing moves it: no jitter, less power
+            self._detach[motion.valve_number] = loop.call_later(
+                self.detach_delay, self.system.submit_command, f"valve{motion.valve_number}", self._detach_idle,
+                motion.valve_number, motion.token)
+
+    async def finish(self, motion: Motion) -> str:
+        """Wait out the travel time, then arrive on the valve's worker"""
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        self._travelling(motion)
+        await asyncio.sleep(motion.travel)
+        motion.state = await self.system.run_command(f"valve{motion.valve_number}", self.arrive, motion)
+        self._arrived(motion, loop, started)
+        return motion.state
+
+    async def finish_all(self, motions: list) -> list:
+        """finish() for moves started together: one wait for the slowest valve, then all arrive at once"""
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        for motion in motions:
+            self._travelling(motion)
+        await asyncio.sleep(max(motion.travel for motion in motions))
+        states = await self.system.run_command("motion", self.arrive_all, motions)
+        for motion, state in zip(motions, states):
+            motion.state = state
+            self._arrived(motion, loop, started)
+        return states
+
+    def start_all(self, moves: dict) -> list:
+        """start() every valve in {valve_number: open} with nothing in between"""
+        with self.system.all_devices_locked():
+            return [self.start(num, opening) for num, opening in moves.items()]
+
+    async def move(self, moves: dict) -> dict:
+        """Move every valve in {valve_number: open} at once, returns their final states"""
+        if len(moves) == 1:
+            (valve_number, opening), = moves.items()
+            motion = await self.system.run_command(f"valve{valve_number}", self.start, valve_number, opening)
+            return {valve_number: await self.finish(motion)}
+        motions = await self.system.run_command("motion", self.start_all, moves)
+        return dict(zip(moves, await self.finish_all(motions)))
+
+    async def set_mode(self, mode: str) -> dict:
+        """'fill' opens the diverter, inlet and drain, 'start' closes them"""
+        if mode == "fill":
+            return await self.move(FILL_MODE)
+        if mode == "start":
+            return await self.move(START_MODE)
+        raise ValueError(f"Unknown mode: {mode}")
+
+    def stats(self) -> dict:
+        return {
+            "travel_times": {num: self.travel_time(num) for num in self.system.valves},
+            "last_move": dict(self.timings),
+            "attached": sorted(self._attached),
+        }
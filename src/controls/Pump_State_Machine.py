@@ -2,11 +2,9 @@
 # Created By Evan Corwin
 # Last Modified 1/13/2026
 
-from abc import ABC, abstractmethod
 from enum import Enum
-import time
-from typing import Optional
-from .Logging_System import append_row_csv, log_state_change, LoggingPath
+from .Logging_System import LoggingPath
+from .State_Engine import State, MachineSpec, StateMachine
 
 
 
@@ -16,104 +14,35 @@ class PumpState(Enum):
     RUNNING = 'running'
 
 
-class State(ABC):
-    """Abstract base class for all states"""
-    
-    def __init__(self, name: str):
-        self.name = name
-        self.SystemPath = LoggingPath.SystemPath()
-        self.PumpPath = LoggingPath.PumpPath()
+# States are shared by every pump, the second name is what goes in the logs
+IdleState = State("IDLE", "IDLE")
+PrimingState = State("PRIMING", "Priming")
+RunningState = State("RUNNING", "Running")
+
+PUMP_SPEC = MachineSpec(
+    "Pump",
+    states={
+        PumpState.IDLE: IdleState,
+        PumpState.PRIMING: PrimingState,
+        PumpState.RUNNING: RunningState,
+    },
+    transitions={
+        IdleState: [PumpState.PRIMING, PumpState.RUNNING],
+        PrimingState: [PumpState.RUNNING, PumpState.IDLE],
+        RunningState: [PumpState.PRIMING, PumpState.IDLE],
+    },
+    initial=IdleState,  ## Initial state Change depending initial condition
+    device_log=LoggingPath.PumpPath(),
+)
+
+
+class PumpStateMachine(StateMachine):
+    __slots__ = ()
+    spec = PUMP_SPEC
 
-    @abstractmethod
-    def enter(self, context) -> None:
-        """Called when entering this state"""
-        pass
-    
-    @abstractmethod
-    def exit(self, context) -> None:
-        """Called when exiting this state"""
-        pass
-    
-    @abstractmethod
-    def handle_event(self, context, event: PumpState):
-        """Handle events in this state"""
-        pass
-
-class PrimingState(State):
-    def __init__(self):
-        super().__init__("PRIMING")
-    
-    def enter(self, context) -> None:
-        print("Pump is now Priming.")
-        append_row_csv(self.PumpPath, {'Time': time.strftime("%Y-%m-%d %H:%M:%S"), 'Name': context.name, 'Status': 'Priming', 'Notes': ''}, ['Time', 'Name', 'Status', 'Notes'])
-        log_state_change(self.SystemPath, context.name, 'Priming', '')
-       
-    def exit(self, context) -> None:
-        print("Exiting Priming state...")
-    
-    def handle_event(self, context, event: PumpState):
-        if event == PumpState.RUNNING:
-            context.state = RunningState()
-            context.state.enter(context)
-        elif event == PumpState.IDLE:
-            context.state = IdleState()
-            context.state.enter(context)
-class RunningState(State):
-    def __init__(self):
-        super().__init__("RUNNING")
-    
-    def enter(self, context) -> None:
-        print("Pump is now Running.")
-        append_row_csv(self.PumpPath, {'Time': time.strftime("%Y-%m-%d %H:%M:%S"), 'Name': context.name, 'Status': 'Running', 'Notes': ''}, ['Time', 'Name', 'Status', 'Notes'])
-        log_state_change(self.SystemPath, context.name, 'Running', '')
-
-    def exit(self, context) -> None:
-        print("Exiting Running state...")
-    
-    def handle_event(self, context, event: PumpState):
-        if event == PumpState.PRIMING:
-            context.state = PrimingState()
-            context.state.enter(context)
-        elif event == PumpState.IDLE:
-            context.state = IdleState()
-            context.state.enter(context)
-class IdleState(State):
-    def __init__(self):
-        super().__init__("IDLE")
-    
-    def enter(self, context) -> None:
-        print("Pump is now Idle.")
-        append_row_csv(self.PumpPath, {'Time': time.strftime("%Y-%m-%d %H:%M:%S"), 'Name': context.name, 'Status': 'IDLE', 'Notes': ''}, ['Time', 'Name', 'Status', 'Notes'])
-        log_state_change(self.SystemPath, context.name, 'IDLE', '')
-       
-    def exit(self, context) -> None:
-        print("Exiting Idle state...")
-    
-    def handle_event(self, context, event: PumpState):
-        if event == PumpState.PRIMING:
-            context.state = PrimingState()
-            context.state.enter(context)
-        elif event == PumpState.RUNNING:
-            context.state = RunningState()
-            context.state.enter(context)
-class PumpStateMachine:
     def __init__(self, name: str = "Default Pump"):
-        self.name = name
-        self.SystemPath = LoggingPath.SystemPath()
-        self.PumpPath = LoggingPath.PumpPath()
-        self.state: State = IdleState()  ## Initial state Change depending initial condition
-        self.state.enter(self)
+        super().__init__(name)
 
-    
-    def on_event(self, event: PumpState):
-        self.state.handle_event(self, event)
-    
-    def run(self):
-        print(f"Current Pump State: {self.state.name}")
-        # central log only when status changes
-        log_state_change(self.SystemPath, self.name, self.state.name, '')
-        
-        time.sleep(1)
 
 def CreatePumpStateMachine(name: str = "Default Pump") -> PumpStateMachine:
-    return PumpStateMachine(name)
\ No newline at end of file
+    return PumpStateMachine(name)
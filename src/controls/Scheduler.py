@@ -0,0 +1,121 @@
+# Scheduler Module - RoboJar Automation
+# Ticks every state machine concurrently from one asyncio event loop
+
+import asyncio
+from typing import Dict
+
+
+class TickEntry:
+    """A registered machine and its tick statistics"""
+    __slots__ = ('machine', 'period', 'device', 'ticks', 'missed', 'max_lag', 'task')
+
+    def __init__(self, machine, period: float, device: str = None):
+        self.machine = machine
+        self.period = period
+        self.device = device  # command worker the tick runs on, None ticks on the loop
+        self.ticks = 0
+        self.missed = 0      # ticks skipped because the loop fell a whole period behind
+        self.max_lag = 0.0   # worst lateness of a tick in seconds
+        self.task = None
+
+
+class TickScheduler:
+    """Calls tick() on every registered machine at its own rate.
+
+    Each machine gets its own task on the running event loop, so a slow or
+    added device never stretches the period of the others. Late ticks are
+    reported instead of being run back to back.
+
+    With `run` (e.g. SystemController.run_command), a machine registered with
+    a device name ticks through run(device, tick), in order with that
+    device's commands instead of racing them.
+    """
+
+    def __init__(self, default_period: float = 1.0, run=None):
+        self.default_period = default_period
+        self.run_tick = run
+        self.entries: Dict[str, TickEntry] = {}
+        self.running = False
+
+    def register(self, machine, period: float = None, device: str = None) -> TickEntry:
+        """Tick `machine` every `period` seconds, starting now if the scheduler runs"""
+        if period is None:
+            period = self.default_period
+        if period <= 0:
+            raise ValueError("Tick period must be positive")
+        self.unregister(machine.name)
+        entry = TickEntry(machine, period, device)
+        self.entries[machine.name] = entry
+        if self.running:
+            entry.task = asyncio.get_running_loop().create_task(self._tick_loop(entry))
+        return entry
+
+    def unregister(self, name: str) -> None:
+        entry = self.entries.pop(name, None)
+        if entry is not None and entry.task is not None:
+            entry.task.cancel()
+
+    async def start(self) -> None:
+        """Start ticking, must be awaited from inside the event loop"""
+        if self.running:
+            return
+        self.running = True
+        loop = asyncio.get_running_loop()
+        for entry in self.entries.values():
+            entry.task = loop.create_task(self._tick_loop(entry))
+
+    async def stop(self) -> None:
+        self.running = False
+        tasks = [entry.task for entry in self.entries.values() if entry.task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for entry in self.entries.values():
+            entry.task = None
+
+    async def run(self, duration: float = None) -> None:
+        """Run until cancelled, or for `duration` seconds (for scripts and demos)"""
+        await self.start()
+        try:
+            if duration is None:
+                await asyncio.Event().wait()
+            else:
+                await asyncio.sleep(duration)
+        finally:
+            await self.stop()
+
+    async def _tick_loop(self, entry: TickEntry) -> None:
+        loop = asyncio.get_running_loop()
+        period = entry.period
+        deadline = loop.time()
+        while True:
+            lag = loop.time() - deadline
+            if lag > entry.max_lag:
+                entry.max_lag = lag
+            if lag >= period:
+                # fell behind, skip the ticks we missed rather than bursting them
+                skipped = int(lag // period)
+                entry.missed += skipped
+                deadline += skipped * period
+                print(f"{entry.machine.name} missed {skipped} tick(s), {lag:.3f}s late")
+            try:
+                if entry.device is not None and self.run_tick is not None:
+                    await self.run_tick(entry.device, entry.machine.tick)
+                else:
+                    entry.machine.tick()
+            except Exception as e:
+                print(f"{entry.machine.name} tick failed: {e}")
+            entry.ticks += 1
+            deadline += period
+            await asyncio.sleep(max(0.0, deadline - loop.time()))
+
+    def stats(self) -> dict:
+        return {
+            name: {
+                "period": entry.period,
+                "ticks": entry.ticks,
+                "missed": entry.missed,
+                "max_lag": round(entry.max_lag, 6),
+            }
+            for name, entry in self.entries.items()
+        }
@@ -2,12 +2,9 @@
 # Created By Evan Corwin
 # Last Modified 2/10/2026
 
-from abc import ABC, abstractmethod
 from enum import Enum
-import time
-from typing import Optional
-from Logging_System import append_row_csv, log_state_change, LoggingPath
-import gpiozero
+from .Logging_System import LoggingPath
+from .State_Engine import State, MachineSpec, StateMachine
 
 
 
@@ -16,77 +13,44 @@ class SensorState(Enum):
     ACTIVE = 'active'
 
 
-class State(ABC):
-    """Abstract base class for all states"""
-    
-    def __init__(self, name: str):
-        self.name = name
-        self.SystemPath = LoggingPath.SystemPath()
+# States are shared by every sensor, the second name is what goes in the logs
+IdleState = State("IDLE", "IDLE")
+ActiveState = State("ACTIVE", "Active")
 
-    @abstractmethod
-    def enter(self, context) -> None:
-        """Called when entering this state"""
-        pass
-    
-    @abstractmethod
-    def exit(self, context) -> None:
-        """Called when exiting this state"""
-        pass
-    
-    @abstractmethod
-    def handle_event(self, context, event: PumpState):
-        """Handle events in this state"""
-        pass
-class IdleState(State):
-    def __init__(self):
-        super().__init__("IDLE")
-    
-    def enter(self, context) -> None:
-        print("Sensor is Idle")
-        append_row_csv(self.SystemPath, {'Time': time.strftime("%Y-%m-%d %H:%M:%S"), 'Name': context.name, 'Status': 'IDLE', 'Notes': ''}, ['Time', 'Name', 'Status', 'Notes'])
-        log_state_change(self.SystemPath, context.name, 'IDLE', '')
-    def exit(self, context) -> None:
-        print("Exiting IDLE state...")
-    
-    def handle_event(self, context, event: ValveState):
-        if event == SensorState.ACTIVE:
-            context.state = ActiveState()
-            context.state.enter(context)
+SENSOR_SPEC = MachineSpec(
+    "Sensor",
+    states={
+        SensorState.IDLE: IdleState,
+        SensorState.ACTIVE: ActiveState,
+    },
+    transitions={
+        IdleState: [SensorState.ACTIVE],
+        ActiveState: [SensorState.IDLE],
+    },
+    initial=IdleState,  ## Initial state Change depending initial condition
+    device_log=LoggingPath.SystemPath(),  # sensors only have the central log
+)
 
-class ActiveState(State):
-    def __init__(self):
-        super().__init__("ACTIVE")
-    
-    def enter(self, context) -> None:
-        print("Sensor is Active")
-        append_row_csv(self.SystemPath, {'Time': time.strftime("%Y-%m-%d %H:%M:%S"), 'Name': context.name, 'Status': 'Active', 'Notes': ''}, ['Time', 'Name', 'Status', 'Notes'])
-        log_state_change(self.SystemPath, context.name, 'Active', '')
-    def exit(self, context) -> None:
-        print("Exiting IDLE state...")
-    
-    def handle_event(self, context, event: ValveState):
-        if event == SensorState.IDLE:
-            context.state = IdleState()
-            context.state.enter(context)
 
+class SensorStateMachine(StateMachine):
+    __slots__ = ('level',)
+    spec = SENSOR_SPEC
 
-class SensorStateMachine:
     def __init__(self, name: str = "Sensor"):
-        self.name = name
-        self.SystemPath = LoggingPath.SystemPath()
-        self.state: State = IdleState()  ## Initial state Change depending initial condition
-        self.state.enter(self)
+        self.level = None  # latest water height in meters, see Level_Sensor.LevelSampler
+        super().__init__(name)
+
+    def set_level(self, height: float) -> None:
+        """New reading, the sensor is ACTIVE while readings come in"""
+        self.level = height
+        if self.state is not self.spec.states[SensorState.ACTIVE]:
+            self.on_event(SensorState.ACTIVE)
+
+    def clear_level(self) -> None:
+        """Readings stopped (no echo), back to IDLE"""
+        self.level = None
+        self.on_event(SensorState.IDLE)
 
-    
-    def on_event(self, event: PumpState):
-        self.state.handle_event(self, event)
-    
-    def run(self):
-        print(f"Current Sensor State: {self.state.name}")
-        # central log only when status changes
-        log_state_change(self.SystemPath, self.name, self.state.name, '')
-        
-        time.sleep(1)
 
 def CreateSensorStateMachine(name: str = "Sensor") -> SensorStateMachine:
-    return SensorStateMachine(name)
\ No newline at end of file
+    return SensorStateMachine(name)
@@ -0,0 +1,112 @@
+# State Engine Module - RoboJar Automation
+# Table driven state machine shared by the valve, pump and sensor machines
+
+import time
+
+from .Logging_System import log_event, log_state_change, LoggingPath
+
+FIELDNAMES = ['Time', 'Name', 'Status', 'Notes']
+
+
+class State:
+    """One state of a kind of machine, shared by every machine of that kind"""
+    __slots__ = ('name', 'status', 'index')
+
+    def __init__(self, name: str, status: str = None):
+        self.name = name                                  # reported by the controller, e.g. "OPEN"
+        self.status = status if status is not None else name  # written to the logs, e.g. "Closing"
+        self.index = -1                                   # row in its spec's transition table
+
+    def __repr__(self) -> str:
+        return f"State({self.name})"
+
+
+class MachineSpec:
+    """Everything machines of one kind share: states, transition table and hooks.
+
+    `states` maps each event to the state it leads to and `transitions` lists
+    the events each state accepts. Both are compiled once into `table`, where
+    table[state.index][event] is the next state.
+    """
+    __slots__ = ('kind', 'states', 'initial', 'table', 'device_log', 'system_log', 'enter_hooks', 'exit_hooks')
+
+    def __init__(self, kind: str, states: dict, transitions: dict, initial: State, device_log: str):
+        self.kind = kind
+        self.states = states
+        self.initial = initial
+        self.device_log = device_log
+        self.system_log = LoggingPath.SystemPath()
+        self.enter_hooks = [log_enter]
+        self.exit_hooks = []
+
+        ordered = list(dict.fromkeys(states.values()))
+        table = []
+        for i, state in enumerate(ordered):
+            if state.index != -1:
+                raise ValueError(f"{state} already belongs to another spec")
+            state.index = i
+            table.append({event: states[event] for event in transitions.get(state, ())})
+        self.table = tuple(table)
+
+    def on_enter(self, hook) -> None:
+        """Register hook(machine, state), called after every transition"""
+        self.enter_hooks.append(hook)
+
+    def on_exit(self, hook) -> None:
+        """Register hook(machine, state), called before leaving a state"""
+        self.exit_hooks.append(hook)
+
+
+def log_enter(machine: 'StateMachine', state: State) -> None:
+    """Default enter hook: device log row plus the central log when the status changes"""
+    spec = machine.spec
+    log_event(spec.device_log, {'Time': time.strftime("%Y-%m-%d %H:%M:%S"), 'Name': machine.name, 'Status': state.status, 'Notes': ''}, FIELDNAMES)
+    log_state_change(spec.system_log, machine.name, state.status, '')
+
+
+class StateMachine:
+    """A named device driven by its kind's MachineSpec"""
+    __slots__ = ('name', 'state', 'listeners')
+    spec: MachineSpec = None
+
+    def __init__(self, name: str):
+        self.name = name
+        self.listeners = ()
+        self.state: State = self.spec.initial
+        for hook in self.spec.enter_hooks:
+            hook(self, self.state)
+
+    def on_event(self, event) -> bool:
+        """Move to the state `event` leads to. Returns False if the current state ignores it"""
+        target = self.spec.table[self.state.index].get(event)
+        if target is None:
+            return False
+        self.transition(target)
+        return True
+
+    def add_listener(self, listener) -> None:
+        """Call listener(machine, state) after every transition of this machine"""
+        self.listeners = self.listeners + (listener,)
+
+    def remove_listener(self, listener) -> None:
+        self.listeners = tuple(l for l in self.listeners if l is not listener)
+
+    def transition(self, target: State) -> None:
+        spec = self.spec
+        for hook in spec.exit_hooks:
+            hook(self, self.state)
+        self.state = target
+        for hook in spec.enter_hooks:
+            hook(self, target)
+        for listener in self.listeners:
+            listener(self, target)
+
+    def tick(self) -> None:
+        """One control loop pass, never blocks. Called by the scheduler, on the device's command worker"""
+        # central log only when status changes, spelled like log_enter writes it
+        log_state_change(self.spec.system_log, self.name, self.state.status, '')
+
+    def run(self):
+        print(f"Current {self.spec.kind} State: {self.state.name}")
+        self.tick()
+        time.sleep(1)
@@ -0,0 +1,282 @@
+# Test Runner Module - RoboJar Automation
+# Runs declarative test protocols as background jobs
+
+import asyncio
+import json
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, Optional
+
+from .Valve_State_Machine import ValveState
+from .Pump_State_Machine import PumpState
+
+PROTOCOL_DIR = 'protocols'
+MAX_JOBS = 20  # finished jobs kept for /runTest/{job_id}
+
+
+class ProtocolError(ValueError):
+    """Protocol file that can't be run"""
+
+
+class Step:
+    """One device action of a protocol and how it went"""
+
+    def __init__(self, index: int, spec: dict):
+        self.index = index
+        self.device = spec.get("device")
+        self.valve_number = spec.get("valve_number")
+        self.event = spec.get("event")
+        self.wait = spec.get("wait")
+        self.status = "pending"
+        self.state = None
+        self.error = None
+        self.started = None
+        self.duration = None
+
+    @property
+    def action(self) -> str:
+        if self.wait is not None:
+            return f"Wait {self.wait}s"
+        if self.device == "valve":
+            return f"Valve {self.valve_number} {self.event}"
+        return f"{self.device.capitalize()} {self.event}"
+
+    @property
+    def command(self) -> Optional[str]:
+        if self.wait is not None:
+            return None
+        if self.device == "valve":
+            return f"valve{self.valve_number}{self.event.capitalize()}"
+        return f"{self.device}{self.event.capitalize()}"
+
+    def to_dict(self) -> dict:
+        return {
+            "index": self.index,
+            "action": self.action,
+            "status": self.status,
+            "state": self.state,
+            "error": self.error,
+            "started": self.started,
+            "duration": self.duration,
+        }
+
+
+def _compile(node, steps: list, system):
+    """Turn a protocol node into ("step", Step) / ("series"|"parallel", [children])"""
+    if not isinstance(node, dict):
+        raise ProtocolError(f"Protocol step must be an object: {node!r}")
+    for kind in ("series", "parallel"):
+        if kind in node:
+            children = node[kind]
+            if not isinstance(children, list) or not children:
+                raise ProtocolError(f"'{kind}' needs a list of steps")
+            return (kind, [_compile(child, steps, system) for child in children])
+
+    step = Step(len(steps), node)
+    if step.wait is not None:
+        if not isinstance(step.wait, (int, float)) or step.wait < 0:
+            raise ProtocolError(f"Invalid wait: {step.wait!r}")
+    elif step.device == "valve":
+        if step.event not in ValveState.__members__:
+            raise ProtocolError(f"Invalid valve event: {step.event!r}")
+        if not system.get_valve(step.valve_number):
+            raise ProtocolError(f"Valve {step.valve_number} not found")
+    elif step.device == "pump":
+        if step.event not in PumpState.__members__:
+            raise ProtocolError(f"Invalid pump event: {step.event!r}")
+    elif step.device == "sensor":
+        if step.event not in ("ON", "OFF"):
+            raise ProtocolError(f"Invalid sensor event: {step.event!r}")
+    else:
+        raise ProtocolError(f"Invalid control object: {step.device!r}")
+    steps.append(step)
+    return ("step", step)
+
+
+def load_protocol(name: str, protocol_dir: str = PROTOCOL_DIR) -> dict:
+    """Read protocols/<name>.json"""
+    if not name.replace('_', '').replace('-', '').isalnum():
+        raise ProtocolError(f"Invalid protocol name: {name!r}")
+    path = Path(protocol_dir) / f"{name}.json"
+    if not path.exists():
+        raise ProtocolError(f"Protocol {name!r} not found")
+    try:
+        return json.loads(path.read_text(encoding='utf-8'))
+    except ValueError as e:
+        raise ProtocolError(f"Protocol {name!r} is not valid JSON: {e}")
+
+
+class TestJob:
+    """One run of a protocol"""
+
+    def __init__(self, protocol: dict, system):
+        self.id = uuid.uuid4().hex[:12]
+        self.name = protocol.get("name", "Unnamed protocol")
+        self.reset = protocol.get("reset", True)
+        self.steps = []
+        self.plan = _compile({"series": protocol.get("steps", [])}, self.steps, system)
+        self.status = "pending"
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.reset_result = None
+        self.task = None
+        self.motions = {}   # valve number -> move started by an OPENING/CLOSING step, still travelling
+        self._listeners = set()
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "protocol": self.name,
+            "status": self.status,
+            "error": self.error,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "duration": round(self.finished - self.started, 6) if self.finished and self.started else None,
+            "reset": self.reset_result,
+            "steps": [step.to_dict() for step in self.steps],
+        }
+
+    def listen(self) -> asyncio.Queue:
+        """Progress events for this job, the first is the job as it stands now"""
+        queue = asyncio.Queue()
+        queue.put_nowait({"type": "job", "job": self.to_dict()})
+        if self.status in ("completed", "failed"):
+            queue.put_nowait(None)
+        else:
+            self._listeners.add(queue)
+        return queue
+
+    def unlisten(self, queue: asyncio.Queue) -> None:
+        self._listeners.discard(queue)
+
+    def _emit(self, event) -> None:
+        for queue in self._listeners:
+            queue.put_nowait(event)
+
+
+class TestRunner:
+    """Starts protocol jobs on the event loop and keeps the recent ones"""
+
+    def __init__(self, system, send_command):
+        self.system = system
+        self.send_command = send_command
+        self.jobs: Dict[str, TestJob] = {}
+
+    def start(self, protocol: dict) -> TestJob:
+        """Start `protocol` in the background, returns straight away"""
+        job = TestJob(protocol, self.system)
+        self.jobs[job.id] = job
+        while len(self.jobs) > MAX_JOBS:
+            oldest = next(iter(self.jobs))
+            if self.jobs[oldest].status not in ("completed", "failed"):
+                break
+            del self.jobs[oldest]
+        job.task = asyncio.get_running_loop().create_task(self._run(job))
+        return job
+
+    def get(self, job_id: str) -> Optional[TestJob]:
+        return self.jobs.get(job_id)
+
+    async def _run(self, job: TestJob) -> None:
+        job.status = "running"
+        job.started = time.time()
+        job._emit({"type": "status", "status": job.status})
+        try:
+            if job.reset:
+                job.reset_result = await self.system.reset_all_async()
+            await self._run_node(job, job.plan)
+            job.status = "completed"
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+        job.finished = time.time()
+        job._emit({"type": "job", "job": job.to_dict()})
+        job._emit(None)
+        job._listeners.clear()
+
+    async def _run_node(self, job: TestJob, node) -> None:
+        kind, body = node
+        if kind == "step":
+            await self._run_step(job, body)
+        elif kind == "series":
+            for child in body:
+                await self._run_node(job, child)
+        else:
+            # devices have their own workers, so parallel branches really overlap
+            results = await asyncio.gather(*(self._run_node(job, child) for child in body), return_exceptions=True)
+            for result in results:
+                if isinstance(result, Exception):
+                    raise result
+
+    async def _run_step(self, job: TestJob, step: Step) -> None:
+        step.status = "running"
+        step.started = time.time()
+        job._emit({"type": "step", "step": step.to_dict()})
+        t0 = time.perf_counter()
+        try:
+            if step.wait is not None:
+                await asyncio.sleep(step.wait)
+            elif step.device == "valve" and step.event != "IDLE":
+                step.state = await self._move_valve(job, step)
+            else:
+                device, fn, args = self._command(step)
+                step.state = await self.system.run_command(device, fn, *args)
+            step.status = "done"
+        except Exception as e:
+            step.status = "failed"
+            step.error = str(e)
+            raise
+        finally:
+            step.duration = round(time.perf_counter() - t0, 6)
+            job._emit({"type": "step", "step": step.to_dict()})
+
+    async def _move_valve(self, job: TestJob, step: Step) -> str:
+        """Valve steps drive the servo through the motion coordinator.
+
+        OPENING/CLOSING starts the move, the OPEN/CLOSED step after it waits out
+        the travel time. OPEN/CLOSED on its own is a whole move.
+        """
+        motion = self.system.motion
+        num = step.valve_number
+        opening = step.event in ("OPENING", "OPEN")
+        pending = job.motions.pop(num, None)
+        if step.event in ("OPENING", "CLOSING") or pending is None or pending.opening != opening:
+            pending = await self.system.run_command(f"valve{num}", motion.start, num, opening)
+        self.send_command(step.command)
+        if step.event in ("OPENING", "CLOSING"):
+            job.motions[num] = pending
+            return pending.state
+        return await motion.finish(pending)
+
+    def _command(self, step: Step):
+        system = self.system
+        send_command = self.send_command
+        if step.device == "valve":
+            valve_sm = system.get_valve(step.valve_number)
+            event = ValveState[step.event]
+
+            def apply():
+                valve_sm.on_event(event)
+                send_command(step.command)
+                return valve_sm.state.name
+            return f"valve{step.valve_number}", apply, ()
+        if step.device == "pump":
+            event = PumpState[step.event]
+
+            def apply():
+                system.get_pump().on_event(event)
+                send_command(step.command)
+                return system.get_pump().state.name
+            return "pump", apply, ()
+
+        active = step.event == "ON"
+
+        def apply():
+            system.sensor_active = active
+            send_command(step.command)
+            return step.event
+        return "sensor", apply, ()
@@ -0,0 +1,215 @@
+# Time Series Module - RoboJar Automation
+# Fixed-memory sensor history: NumPy ring buffers per channel with 1 s / 10 s / 1 min rollups
+
+import threading
+import time
+
+import numpy as np
+
+RAW_CAPACITY = 36000       # raw samples per channel, an hour at 10 Hz
+RESOLUTIONS = (1, 10, 60)  # rollup bucket widths in seconds
+ROLLUP_CAPACITY = {1: 21600, 10: 8640, 60: 10080}  # 6 hours, 1 day, 1 week of buckets
+MAX_POINTS = 5000
+
+
+class RingBuffer:
+    """Preallocated parallel float64 columns, oldest rows overwritten first"""
+
+    def __init__(self, capacity: int, columns: tuple):
+        self.capacity = capacity
+        self.columns = {name: np.zeros(capacity) for name in columns}
+        self.head = 0    # next row to write
+        self.count = 0
+
+    def push(self, **values) -> int:
+        i = self.head
+        for name, value in values.items():
+            self.columns[name][i] = value
+        self.head = (i + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+        return i
+
+    @property
+    def last(self) -> int:
+        """Row of the newest entry, -1 when empty"""
+        return (self.head - 1) % self.capacity if self.count else -1
+
+    def ordered(self, name: str) -> np.ndarray:
+        column = self.columns[name]
+        if self.count < self.capacity:
+            return column[:self.count]
+        return np.concatenate((column[self.head:], column[:self.head]))
+
+    def window(self, key: str, start: float = None, end: float = None) -> dict:
+        """Copies of every column, oldest first, for rows with start <= key <= end"""
+        keys = self.ordered(key)
+        lo = 0 if start is None else int(np.searchsorted(keys, start, side='left'))
+        hi = len(keys) if end is None else int(np.searchsorted(keys, end, side='right'))
+        return {name: (keys if name == key else self.ordered(name))[lo:hi].copy() for name in self.columns}
+
+    def first(self, key: str):
+        if not self.count:
+            return None
+        return float(self.columns[key][0 if self.count < self.capacity else self.head])
+
+
+class Rollup:
+    """min/max/sum/count per fixed-width time bucket, updated as samples arrive"""
+
+    def __init__(self, resolution: float, capacity: int):
+        self.resolution = resolution
+        self.buffer = RingBuffer(capacity, ('t', 'min', 'max', 'sum', 'count'))
+        self.current = None   # start of the newest bucket
+
+    def add(self, t: float, value: float) -> None:
+        bucket = t - (t % self.resolution)
+        if self.current is not None and bucket < self.current:
+            return  # late sample for a bucket already closed, only the raw buffer keeps it
+        if bucket == self.current:
+            columns = self.buffer.columns
+            i = self.buffer.last
+            if value < columns['min'][i]:
+                columns['min'][i] = value
+            if value > columns['max'][i]:
+                columns['max'][i] = value
+            columns['sum'][i] += value
+            columns['count'][i] += 1
+        else:
+            self.buffer.push(t=bucket, min=value, max=value, sum=value, count=1)
+            self.current = bucket
+
+    def window(self, start: float = None, end: float = None) -> dict:
+        rows = self.buffer.window('t', None if start is None else start - (start % self.resolution), end)
+        return {'t': rows['t'], 'min': rows['min'], 'max': rows['max'], 'mean': rows['sum'] / rows['count']}
+
+
+class Channel:
+    """Raw samples of one signal plus its rollups"""
+
+    def __init__(self, name: str, raw_capacity: int = RAW_CAPACITY, rollup_capacity: dict = None):
+        capacity = rollup_capacity or ROLLUP_CAPACITY
+        self.name = name
+        self.raw = RingBuffer(raw_capacity, ('t', 'v'))
+        self.rollups = {r: Rollup(r, capacity[r]) for r in RESOLUTIONS}
+        self.lock = threading.Lock()
+        self.last_t = None
+
+    def add(self, t: float, value: float) -> None:
+        with self.lock:
+            if self.last_t is not None and t < self.last_t:
+                t = self.last_t   # keep the raw buffer sorted, clocks do step back
+            self.raw.push(t=t, v=value)
+            self.last_t = t
+            for rollup in self.rollups.values():
+                rollup.add(t, value)
+
+    def span(self, resolution) -> float:
+        """Oldest time still held at `resolution` ('raw' or seconds)"""
+        buffer = self.raw if resolution == 'raw' else self.rollups[resolution].buffer
+        return buffer.first('t')
+
+    def info(self) -> dict:
+        with self.lock:
+            return {
+                'name': self.name,
+                'samples': self.raw.count,
+                'last': self.last_t,
+                'value': float(self.raw.columns['v'][self.raw.last]) if self.raw.count else None,
+                'oldest': {str(r): self.span(r) for r in ('raw',) + RESOLUTIONS},
+            }
+
+
+class TimeSeriesStore:
+    """Every channel's history in fixed memory.
+
+    Memory is allocated per channel up front (about 2 MB with the default
+    capacities) and never grows; the oldest samples and buckets are
+    overwritten first.
+    """
+
+    def __init__(self, raw_capacity: int = RAW_CAPACITY, rollup_capacity: dict = None):
+        self.raw_capacity = raw_capacity
+        self.rollup_capacity = rollup_capacity
+        self.channels = {}
+        self._lock = threading.Lock()
+
+    def channel(self, name: str) -> Channel:
+        channel = self.channels.get(name)
+        if channel is None:
+            with self._lock:
+                channel = self.channels.get(name)
+                if channel is None:
+                    channel = Channel(name, self.raw_capacity, self.rollup_capacity)
+                    self.channels[name] = channel
+        return channel
+
+    def record(self, name: str, value: float, t: float = None) -> None:
+        self.channel(name).add(time.time() if t is None else t, float(value))
+
+    def record_many(self, values: dict, t: float = None) -> None:
+        """Numeric values of {channel: value}, all at the same time"""
+        t = time.time() if t is None else t
+        for name, value in values.items():
+            if isinstance(value, (int, float)):
+                self.record(name, value, t)
+
+    def query(self, name: str, start: float = None, end: float = None, resolution='auto',
+              max_points: int = MAX_POINTS) -> dict:
+        """Samples of `name` between start and end (epoch seconds).
+
+        resolution is 'raw', 1, 10, 60 or 'auto': the finest level that still
+        holds `start` and fits in `max_points`.
+        """
+        channel = self.channels.get(name)
+        if channel is None:
+            raise KeyError(name)
+        if resolution not in ('auto', 'raw') + RESOLUTIONS:
+            raise ValueError(f"Invalid resolution, pick one of auto, raw, {', '.join(map(str, RESOLUTIONS))}")
+
+        with channel.lock:
+            if resolution == 'auto':
+                resolution = self._pick(channel, start, end, max_points)
+            if resolution == 'raw':
+                rows = channel.raw.window('t', start, end)
+                result = {'t': rows['t'], 'v': rows['v']}
+            else:
+                result = channel.rollups[resolution].window(start, end)
+
+        total = len(result['t'])
+        if total > max_points:
+            # keep the newest points within budget
+            result = {key: values[-max_points:] for key, values in result.items()}
+        return {
+            'name': name,
+            'resolution': resolution,
+            'start': start,
+            'end': end,
+            'total': total,
+            **{key: values.tolist() for key, values in result.items()},
+        }
+
+    @staticmethod
+    def _pick(channel: Channel, start, end, max_points: int):
+        if not channel.raw.count:
+            return 'raw'
+        last = channel.last_t
+        first = start if start is not None else channel.raw.first('t')
+        stop = end if end is not None else last
+        for resolution in ('raw',) + RESOLUTIONS:
+            oldest = channel.span(resolution)
+            if start is not None and oldest is not None and oldest > start and resolution != RESOLUTIONS[-1]:
+                continue  # already overwritten at this level
+            if resolution == 'raw':
+                keys = channel.raw.ordered('t')
+                lo = int(np.searchsorted(keys, first, side='left'))
+                hi = int(np.searchsorted(keys, stop, side='right'))
+                count = hi - lo
+            else:
+                count = (stop - first) / resolution + 1
+            if count <= max_points:
+                return resolution
+        return RESOLUTIONS[-1]
+
+    def info(self) -> list:
+        return [channel.info() for channel in list(self.channels.values())]
@@ -0,0 +1,245 @@
+# Tracing Module - RoboJar Automation
+# Nanosecond spans of state transitions and controller calls, exported as Chrome trace JSON
+
+import functools
+import inspect
+import itertools
+import os
+import threading
+import time
+
+from . import State_Engine
+from .State_Engine import StateMachine
+from .Controller import SystemController
+
+TRACE_CAPACITY = 65536   # spans kept, the oldest are overwritten
+TRACE_ON_START = os.environ.get('ROBOJAR_TRACE', '0') == '1'
+
+# SystemController methods wrapped while tracing
+CONTROLLER_METHODS = ('run_command', 'get_system_status', 'get_status_snapshot', 'update_field',
+                      'reset_valve', 'reset_pump', 'reset_sensor', 'reset_all', 'reset_all_async')
+# log calls the enter hooks make, wrapped while tracing
+LOG_FUNCTIONS = ('log_event', 'log_state_change')
+
+
+class SpanBuffer:
+    """Fixed-size ring of span tuples.
+
+    (name, category, device, from, to, start_ns, duration_ns, log_ns, thread id)
+    Slots are claimed with itertools.count, whose next() is atomic under the
+    GIL, so recording never takes a lock.
+    """
+
+    def __init__(self, capacity: int = TRACE_CAPACITY):
+        self.capacity = capacity
+        self.clear()
+
+    def clear(self) -> None:
+        self._slots = [None] * self.capacity
+        self._counter = itertools.count()
+        self.recorded = 0
+
+    def add(self, span: tuple) -> None:
+        n = next(self._counter)
+        self._slots[n % self.capacity] = span
+        self.recorded = n + 1
+
+    def spans(self) -> list:
+        """Oldest first"""
+        n = self.recorded
+        if n <= self.capacity:
+            return [s for s in self._slots[:n] if s is not None]
+        start = n % self.capacity
+        return [s for s in self._slots[start:] + self._slots[:start] if s is not None]
+
+
+class Tracer:
+    """Switches tracing on by swapping traced versions of the hot methods in.
+
+    A transition span holds one span per exit and enter hook, and the log
+    calls those hooks make nest inside them. While off, StateMachine,
+    SystemController and the spec hooks are the originals, so tracing costs
+    nothing until it is enabled.
+    """
+
+    def __init__(self, capacity: int = TRACE_CAPACITY):
+        self.buffer = SpanBuffer(capacity)
+        self.enabled = False
+        self.started_ns = None
+        self._originals = {}
+        self._log_ns = threading.local()   # time spent in log calls on this thread
+        self._lock = threading.Lock()
+
+    def record(self, name: str, category: str, device: str, start_ns: int, duration_ns: int,
+               from_state: str = '', to_state: str = '', log_ns: int = 0) -> None:
+        self.buffer.add((name, category, device, from_state, to_state, start_ns, duration_ns, log_ns,
+                         threading.get_ident()))
+
+    def enable(self, clear: bool = False) -> None:
+        with self._lock:
+            if clear:
+                self.buffer.clear()
+            if self.enabled:
+                return
+            self._patch(StateMachine, 'on_event', self._traced_on_event)
+            self._patch(StateMachine, 'transition', self._traced_transition)
+            for method in CONTROLLER_METHODS:
+                self._patch(SystemController, method, self._traced_call)
+            for function in LOG_FUNCTIONS:
+                self._patch(State_Engine, function, self._traced_log)
+            for spec in machine_specs():
+                self._wrap_hooks(spec.exit_hooks, 'exit')
+                self._wrap_hooks(spec.enter_hooks, 'enter')
+            self.enabled = True
+            self.started_ns = time.monotonic_ns()
+
+    def disable(self) -> None:
+        with self._lock:
+            if not self.enabled:
+                return
+            for (owner, name), original in self._originals.items():
+                setattr(owner, name, original)
+            self._originals.clear()
+            for spec in machine_specs():
+                # in place, so hooks registered while tracing stay
+                for hooks in (spec.exit_hooks, spec.enter_hooks):
+                    hooks[:] = [getattr(hook, '__traced__', hook) for hook in hooks]
+            self.enabled = False
+
+    def _patch(self, owner, name: str, make) -> None:
+        original = vars(owner)[name]
+        self._originals[(owner, name)] = original
+        setattr(owner, name, make(original))
+
+    def _wrap_hooks(self, hooks: list, phase: str) -> None:
+        hooks[:] = [self._traced_hook(hook, phase) for hook in hooks]
+
+    def _traced_on_event(self, original):
+        tracer = self
+
+        @functools.wraps(original)
+        def on_event(machine, event):
+            before = machine.state.name
+            start = time.monotonic_ns()
+            handled = original(machine, event)
+            tracer.record('handle_event', machine.spec.kind, machine.name, start, time.monotonic_ns() - start,
+                          before, machine.state.name if handled else before)
+            return handled
+        return on_event
+
+    def _traced_transition(self, original):
+        tracer = self
+        log_ns = self._log_ns
+
+        @functools.wraps(original)
+        def transition(machine, target):
+            source = machine.state.name
+            logged = getattr(log_ns, 'total', 0)
+            start = time.monotonic_ns()
+            try:
+                original(machine, target)
+            finally:
+                tracer.record('transition', machine.spec.kind, machine.name, start, time.monotonic_ns() - start,
+                              source, target.name, getattr(log_ns, 'total', 0) - logged)
+        return transition
+
+    def _traced_hook(self, hook, phase: str):
+        tracer = self
+        name = f"{phase} {getattr(hook, '__qualname__', type(hook).__name__)}"
+
+        def traced(machine, state):
+            start = time.monotonic_ns()
+            try:
+                hook(machine, state)
+            finally:
+                tracer.record(name, machine.spec.kind, machine.name, start, time.monotonic_ns() - start,
+                              to_state=state.name)
+        traced.__traced__ = hook
+        return traced
+
+    def _traced_log(self, original):
+        tracer = self
+        log_ns = self._log_ns
+
+        @functools.wraps(original)
+        def log(path, *args, **kwargs):
+            start = time.monotonic_ns()
+            try:
+                return original(path, *args, **kwargs)
+            finally:
+                duration = time.monotonic_ns() - start
+                log_ns.total = getattr(log_ns, 'total', 0) + duration
+                tracer.record(original.__name__, 'log', os.path.basename(path), start, duration, log_ns=duration)
+        return log
+
+    def _traced_call(self, original):
+        tracer = self
+        name = f"SystemController.{original.__name__}"
+
+        if inspect.iscoroutinefunction(original):
+            @functools.wraps(original)
+            async def call(system, *args, **kwargs):
+                start = time.monotonic_ns()
+                try:
+                    return await original(system, *args, **kwargs)
+                finally:
+                    device = str(args[0]) if original.__name__ == 'run_command' and args else ''
+                    tracer.record(name, 'controller', device, start, time.monotonic_ns() - start)
+            return call
+
+        @functools.wraps(original)
+        def call(system, *args, **kwargs):
+            start = time.monotonic_ns()
+            try:
+                return original(system, *args, **kwargs)
+            finally:
+                tracer.record(name, 'controller', str(args[0]) if args else '', start,
+                              time.monotonic_ns() - start)
+        return call
+
+    def status(self) -> dict:
+        return {"enabled": self.enabled, "recorded": self.buffer.recorded, "capacity": self.buffer.capacity}
+
+    def chrome_trace(self) -> dict:
+        """Spans in the Chrome trace event format, opens in chrome://tracing and ui.perfetto.dev"""
+        events = []
+        threads = {}
+        for name, category, device, source, target, start, duration, logged, tid in self.buffer.spans():
+            threads.setdefault(tid, len(threads) + 1)
+            args = {"device": device}
+            if source or target:
+                args["from"] = source
+                args["to"] = target
+            if logged:
+                args["log_us"] = logged / 1000
+            events.append({
+                "name": f"{name} {device}".strip(),
+                "cat": category,
+                "ph": "X",
+                "ts": start / 1000,
+                "dur": duration / 1000,
+                "pid": 1,
+                "tid": threads[tid],
+                "args": args,
+            })
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for tid, index in threads.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": index,
+                           "args": {"name": names.get(tid, f"thread-{tid}")}})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def machine_specs() -> list:
+    """The MachineSpec of every StateMachine kind defined so far"""
+    specs, pending = [], list(StateMachine.__subclasses__())
+    while pending:
+        cls = pending.pop()
+        pending.extend(cls.__subclasses__())
+        if cls.spec is not None and cls.spec not in specs:
+            specs.append(cls.spec)
+    return specs
+
+
+tracer = Tracer()
+if TRACE_ON_START:
+    tracer.enable()
@@ -1,18 +1,8 @@
-from gpiozero import Servo
+from .Devices import get_registry, VALVE_PINS
 
-DIVERTER_VALVE_PIN = 18
-INLET_VALVE_PIN = 24
-DRAIN_VALVE_PIN = 22
-
-def define_Valve(pin) -> Servo:
-
-    valve = Servo(
-    pin,
-    min_pulse_width = 0.5/1000, #0 DEG
-    max_pulse_width = 1.5/1000  #90 DEG
-    )
-
-    return valve
+def define_Valve(pin):
+    # one handle per pin, reused on every call
+    return get_registry().servo(pin)
 
 
 def open_Valve(valve):
@@ -25,5 +15,5 @@ def close_Valve(valve):
 def what_valve(command):
     test = command.split()
 
-    if test[0] == "VALVE1":
-        define_Valve()
\ No newline at end of file
+    if test[0].startswith("VALVE") and test[0][5:].isdigit():
+        return define_Valve(VALVE_PINS[int(test[0][5:])])
@@ -1,58 +1,50 @@
 #3 servo control, start mode and fill mode 
+# Run from src/ with: python -m controls.servoMKIII
 
-from gpiozero import Servo
 from time import sleep
 
-DIVERTER_VALVE_PIN = 18
-INLET_VALVE_PIN = 24
-DRAIN_VALVE_PIN = 22
+from .Devices import get_registry, DIVERTER_VALVE_PIN, INLET_VALVE_PIN, DRAIN_VALVE_PIN
 
-diverter_valve = Servo(
-    DIVERTER_VALVE_PIN,
-    min_pulse_width = 0.5/1000, #0 DEG
-    max_pulse_width = 1.5/1000  #90 DEG
-)
+# Servos come from the device registry, nothing is opened (or moved) on import
 
-inlet_valve = Servo(
-    INLET_VALVE_PIN,
-    min_pulse_width = 0.5/1000, #0 DEG
-    max_pulse_width = 1.5/1000  #90 DEG
-)
 
-drain_valve = Servo(
-    DRAIN_VALVE_PIN,
-    min_pulse_width = 0.5/1000, #0 DEG
-    max_pulse_width = 1.5/1000  #90 DEG
-)
+def diverter_valve():
+    return get_registry().servo(DIVERTER_VALVE_PIN)
+
+def inlet_valve():
+    return get_registry().servo(INLET_VALVE_PIN)
+
+def drain_valve():
+    return get_registry().servo(DRAIN_VALVE_PIN)
 
 def set_fill_mode():
-    diverter_valve.max()
-    inlet_valve.max()
-    drain_valve.max()
+    diverter_valve().max()
+    inlet_valve().max()
+    drain_valve().max()
 
 def set_start_mode():
-    diverter_valve.min()
-    inlet_valve.min()
-    drain_valve.min()
+    diverter_valve().min()
+    inlet_valve().min()
+    drain_valve().min()
     
 def simple_drain():
-    drain_valve.min()
-    
-
-
-try:
-    
-    sleep(2)
-    
-    
-    set_fill_mode()
-    
-    sleep(2) 
-    
-    set_start_mode()
-    
-    sleep(1)
-    
-finally:
-    diverter_valve.detach()
-    inlet_valve.detach()
+    drain_valve().min()
+    
+
+if __name__ == "__main__":
+    try:
+        
+        sleep(2)
+        
+        
+        set_fill_mode()
+        
+        sleep(2) 
+        
+        set_start_mode()
+        
+        sleep(1)
+        
+    finally:
+        diverter_valve().detach()
+        inlet_valve().detach()
@@ -1,9 +1,266 @@
-import pandas as pd
+import argparse
+import csv
+import hashlib
+import json
 import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
 
-#put the file you want to convert into data folder and specify your path in file
-file = "data/real.xls"
+import xlrd
 
-df = pd.read_excel(file, engine="xlrd")
+# Converts RoboJar .xls reports to csv. Point it at the data folder (or single
+# files) and it converts every report whose content changed since last time:
+#
+#   python convert.py data --format csv parquet
+#
+# The csv has the same layout pandas' read_excel(...).to_csv(...) gave us, so
+# the dashboard reads it exactly like the old data/converted.csv.
 
-df.to_csv("data/converted.csv") #put the name of the .csv into this string
\ No newline at end of file
+DATA_DIR = "data"
+MANIFEST_NAME = ".convert_manifest.json"
+FORMATS = ("csv", "parquet", "feather")
+BATCH_ROWS = 1024  # rows per record batch in columnar output
+
+
+def file_hash(path: Path) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _cell_value(cell, datemode):
+    if cell.ctype == xlrd.XL_CELL_NUMBER:
+        value = cell.value
+        return int(value) if value.is_integer() else value
+    if cell.ctype == xlrd.XL_CELL_DATE:
+        return xlrd.xldate_as_datetime(cell.value, datemode).isoformat(sep=" ")
+    if cell.ctype == xlrd.XL_CELL_BOOLEAN:
+        return bool(cell.value)
+    if cell.ctype in (xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK):
+        return ""
+    return cell.value
+
+
+def iter_rows(path: Path, contents: bytes = None):
+    """Yield the first sheet of a report one row at a time, from `contents` if the file was already read"""
+    book = xlrd.open_workbook(str(path), file_contents=contents, on_demand=True)
+    try:
+        sheet = book.sheet_by_index(0)
+        for r in range(sheet.nrows):
+            yield [_cell_value(cell, book.datemode) for cell in sheet.row(r)]
+    finally:
+        book.release_resources()
+
+
+def _is_table_header(row) -> bool:
+    return any(isinstance(v, str) and v.startswith("Elapsed Time") for v in row)
+
+
+def write_csv(rows, out_path: Path) -> int:
+    """pandas-style csv: first row is the header (blank cells become "Unnamed: n") plus an index column"""
+    count = 0
+    tmp = out_path.with_name(out_path.name + ".tmp")
+    with tmp.open("w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        header = next(rows, None)
+        if header is not None:
+            writer.writerow([""] + [v if v != "" else f"Unnamed: {i}" for i, v in enumerate(header)])
+        for row in rows:
+            writer.writerow([count] + row)
+            count += 1
+    os.replace(tmp, out_path)
+    return count
+
+
+def write_columnar(rows, out_path: Path, fmt: str) -> int:
+    """Measurement table only, numeric columns as float64, preamble kept as metadata"""
+    try:
+        import pyarrow as pa
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError(f"{fmt} output needs pyarrow (pip install pyarrow)")
+
+    preamble = []
+    columns = None
+    for row in rows:
+        if _is_table_header(row):
+            # blank header cells are dropped, data cells are still found by their position in the row
+            indexes = [i for i, v in enumerate(row) if v != ""]
+            columns = [str(row[i]) for i in indexes]
+            break
+        text = " ".join(str(v) for v in row if v != "").strip()
+        if text:
+            preamble.append(text)
+    if columns is None:
+        raise ValueError("No measurement table found")
+
+    def column_type(name):
+        return pa.string() if name in ("Date", "Time") else pa.float64()
+
+    schema = pa.schema([(name, column_type(name)) for name in columns],
+                       metadata={"preamble": "\n".join(preamble)})
+
+    def to_batch(buffer):
+        arrays = []
+        for i, field in zip(indexes, schema):
+            values = [row[i] if i < len(row) else None for row in buffer]
+            if field.type == pa.float64():
+                values = [float(v) if isinstance(v, (int, float)) else None for v in values]
+            else:
+                values = [None if v == "" else str(v) for v in values]
+            arrays.append(pa.array(values, type=field.type))
+        return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+    count = 0
+    tmp = out_path.with_name(out_path.name + ".tmp")
+    if fmt == "parquet":
+        writer = pyarrow.parquet.ParquetWriter(str(tmp), schema)
+        write = writer.write_batch
+    else:
+        # Feather v2 is the Arrow IPC file format, which can be written a batch at a time
+        writer = pyarrow.ipc.new_file(str(tmp), schema)
+        write = writer.write_batch
+    try:
+        buffer = []
+        for row in rows:
+            if not any(v != "" for v in row):
+                continue
+            buffer.append(row)
+            if len(buffer) >= BATCH_ROWS:
+                write(to_batch(buffer))
+                count += len(buffer)
+                buffer = []
+        if buffer:
+            write(to_batch(buffer))
+            count += len(buffer)
+    finally:
+        writer.close()
+    os.replace(tmp, out_path)
+    return count
+
+
+def convert_file(src: str, out_dir: str, formats: tuple) -> dict:
+    """Convert one report, runs in a worker process.
+
+    The file is read once: every format and the manifest hash come from the
+    same bytes, so the hash always matches what was converted.
+    """
+    src_path = Path(src)
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    contents = src_path.read_bytes()
+    outputs = {}
+    rows = 0
+    for fmt in formats:
+        target = out / f"{src_path.stem}.{'csv' if fmt == 'csv' else fmt}"
+        if fmt == "csv":
+            rows = write_csv(iter_rows(src_path, contents), target)
+        else:
+            write_columnar(iter_rows(src_path, contents), target, fmt)
+        outputs[fmt] = target.name
+    return {"hash": hashlib.sha256(contents).hexdigest(), "outputs": outputs, "rows": rows}
+
+
+def find_reports(inputs) -> list:
+    reports = []
+    for item in inputs:
+        p = Path(item)
+        if p.is_dir():
+            reports.extend(sorted(f for f in p.iterdir() if f.suffix.lower() == ".xls"))
+        elif p.suffix.lower() == ".xls":
+            reports.append(p)
+    return reports
+
+
+def load_manifest(out_dir: Path) -> dict:
+    try:
+        return json.loads((out_dir / MANIFEST_NAME).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(out_dir: Path, manifest: dict) -> None:
+    path = out_dir / MANIFEST_NAME
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def _unchanged(entry: dict, src: Path, stat, out_dir: Path, formats) -> bool:
+    if not entry or any(fmt not in entry.get("outputs", {}) for fmt in formats):
+        return False
+    if any(not (out_dir / name).exists() for name in entry["outputs"].values()):
+        return False
+    if entry.get("size") == stat.st_size and entry.get("mtime") == stat.st_mtime:
+        return True
+    # touched but maybe not changed, the content hash decides
+    return entry.get("hash") == file_hash(src)
+
+
+def convert_all(inputs, out_dir: str = None, formats=("csv",), workers: int = None, force: bool = False) -> dict:
+    """Convert every changed report under `inputs`, returns {report: result}"""
+    reports = find_reports(inputs)
+    results = {}
+    if not reports:
+        return results
+
+    groups = {}
+    for src in reports:
+        target_dir = Path(out_dir) if out_dir else src.parent
+        groups.setdefault(target_dir, []).append(src)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for target_dir, sources in groups.items():
+            target_dir.mkdir(parents=True, exist_ok=True)
+            manifest = load_manifest(target_dir)
+            futures = {}
+            for src in sources:
+                stat = src.stat()
+                entry = manifest.get(src.name)
+                if not force and _unchanged(entry, src, stat, target_dir, formats):
+                    results[str(src)] = {"skipped": True, **entry}
+                    continue
+                futures[pool.submit(convert_file, str(src), str(target_dir), tuple(formats))] = (src, stat)
+
+            for future in as_completed(futures):
+                src, stat = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    results[str(src)] = {"error": str(e)}
+                    print(f"Failed to convert {src}: {e}")
+                    continue
+                entry = {
+                    "size": stat.st_size,
+                    "mtime": stat.st_mtime,
+                    "converted": datetime.now().isoformat(timespec="seconds"),
+                    **result,
+                }
+                manifest[src.name] = entry
+                results[str(src)] = entry
+                print(f"Converted {src} ({result['rows']} rows)")
+            save_manifest(target_dir, manifest)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert RoboJar .xls reports to csv (and parquet/feather)")
+    parser.add_argument("inputs", nargs="*", default=[DATA_DIR], help="report files or folders (default: data)")
+    parser.add_argument("--out", help="output folder (default: next to each report)")
+    parser.add_argument("--format", nargs="+", choices=FORMATS, default=["csv"], dest="formats")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument("--force", action="store_true", help="convert even unchanged reports")
+    args = parser.parse_args()
+
+    results = convert_all(args.inputs, args.out, args.formats, args.workers, args.force)
+    skipped = sum(1 for r in results.values() if r.get("skipped"))
+    failed = sum(1 for r in results.values() if "error" in r)
+    print(f"{len(results) - skipped - failed} converted, {skipped} unchanged, {failed} failed")
+
+
+if __name__ == "__main__":
+    main()
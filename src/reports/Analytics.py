@@ -0,0 +1,147 @@
+# Analytics Module - RoboJar Automation
+# Summary metrics and overlays across many jar-test runs
+
+import hashlib
+import threading
+
+import numpy as np
+
+MAX_GRID = 10000  # points on a common elapsed-time grid
+
+
+def _content_hash(path) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _series(report, column: str):
+    """Elapsed time and `column` without NaNs, sorted by time"""
+    x = report.columns['elapsed_time']
+    y = report.columns[column]
+    keep = ~(np.isnan(x) | np.isnan(y))
+    x, y = x[keep], y[keep]
+    order = np.argsort(x, kind='stable')
+    return x[order], y[order]
+
+
+def run_metrics(report) -> dict:
+    """Peak volume concentration, time to peak, floc growth rate, final mean diameter and AUC of one run"""
+    t, conc = _series(report, 'vol_concentration')
+    metrics = {
+        'peak_vol_concentration': None,
+        'time_to_peak': None,
+        'floc_growth_rate': None,
+        'final_mean_diameter': None,
+        'auc_vol_concentration': None,
+        'samples': int(len(t)),
+    }
+    if len(t):
+        peak = int(np.argmax(conc))
+        metrics['peak_vol_concentration'] = float(conc[peak])
+        metrics['time_to_peak'] = float(t[peak] - t[0])
+        # trapezoid rule, written out since np.trapz/np.trapezoid moved between NumPy versions
+        metrics['auc_vol_concentration'] = float(np.sum((conc[1:] + conc[:-1]) * np.diff(t)) / 2)
+
+        # growth rate: least squares slope of mean diameter (um/s) up to the concentration peak
+        td, diameter = _series(report, 'mean_diameter')
+        if len(td):
+            metrics['final_mean_diameter'] = float(diameter[-1])
+            growth = td <= t[peak]
+            if np.count_nonzero(growth) >= 2:
+                metrics['floc_growth_rate'] = float(np.polyfit(td[growth], diameter[growth], 1)[0])
+    return metrics
+
+
+class Analytics:
+    """Run metrics cached by report content hash, so renamed or copied files are free too"""
+
+    def __init__(self):
+        self._hashes = {}   # (path, stamp) -> content hash
+        self._metrics = {}  # content hash -> metrics
+        self._lock = threading.Lock()
+
+    def report_hash(self, report) -> str:
+        key = (str(report.path), report.stamp)
+        digest = self._hashes.get(key)
+        if digest is None:
+            digest = _content_hash(report.path)
+            with self._lock:
+                self._hashes[key] = digest
+        return digest
+
+    def summary(self, report) -> dict:
+        digest = self.report_hash(report)
+        metrics = self._metrics.get(digest)
+        if metrics is None:
+            metrics = run_metrics(report)
+            with self._lock:
+                self._metrics[digest] = metrics
+        return {'id': report.id, 'hash': digest, **report.protocol, **metrics}
+
+    def summaries(self, reports: list) -> list:
+        return [self.summary(report) for report in reports]
+
+    def overlay(self, reports: list, column: str = 'vol_concentration', step: float = None,
+                start: float = None, end: float = None) -> dict:
+        """Resample runs onto one elapsed-time grid so their curves line up.
+
+        Outside a run's own time range its values are None. `step` defaults to
+        the finest sampling interval of the runs.
+        """
+        series = {}
+        for report in reports:
+            if column not in report.columns:
+                raise KeyError(column)
+            series[report.id] = _series(report, column)
+        present = [(x, y) for x, y in series.values() if len(x)]
+        if not present:
+            return {'column': column, 'step': step, 'grid': [], 'runs': {}, 'mean': [], 'min': [], 'max': []}
+
+        lo = min(x[0] for x, _ in present) if start is None else start
+        hi = max(x[-1] for x, _ in present) if end is None else end
+        if hi < lo:
+            raise ValueError("end must not be before start")
+        if step is None:
+            diffs = [np.diff(x) for x, _ in present if len(x) > 1]
+            diffs = np.concatenate(diffs) if diffs else np.array([])
+            diffs = diffs[diffs > 0]
+            step = float(np.min(diffs)) if len(diffs) else 1.0
+        if step <= 0:
+            raise ValueError("step must be positive")
+        if (hi - lo) / step > MAX_GRID:
+            step = (hi - lo) / MAX_GRID
+        grid = np.arange(lo, hi + step / 2, step)
+
+        # one row per run, NaN where the run has no data
+        matrix = np.full((len(series), len(grid)), np.nan)
+        for row, (x, y) in enumerate(series.values()):
+            if len(x):
+                matrix[row] = np.interp(grid, x, y, left=np.nan, right=np.nan)
+
+        # statistics across runs at each grid point, for a mean band on the chart
+        with np.errstate(all='ignore'):
+            counts = np.count_nonzero(~np.isnan(matrix), axis=0)
+            mean = np.where(counts > 0, np.nansum(matrix, axis=0) / np.maximum(counts, 1), np.nan)
+            masked = np.where(np.isnan(matrix), np.inf, matrix)
+            low = np.where(counts > 0, masked.min(axis=0), np.nan)
+            masked = np.where(np.isnan(matrix), -np.inf, matrix)
+            high = np.where(counts > 0, masked.max(axis=0), np.nan)
+
+        def to_list(values):
+            return np.where(np.isnan(values), None, values).tolist()
+
+        return {
+            'column': column,
+            'step': step,
+            'grid': grid.tolist(),
+            'runs': {report_id: to_list(matrix[row]) for row, report_id in enumerate(series)},
+            'mean': to_list(mean),
+            'min': to_list(low),
+            'max': to_list(high),
+        }
+
+
+analytics = Analytics()
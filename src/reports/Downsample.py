@@ -0,0 +1,125 @@
+# Downsample Module - RoboJar Automation
+# Cuts long report columns down to a chart's point budget (LTTB or min/max buckets)
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+METHODS = ('lttb', 'minmax')
+MAX_POINTS = 5000
+CACHE_SIZE = 256
+
+
+def _clean(x: np.ndarray, y: np.ndarray):
+    keep = ~(np.isnan(x) | np.isnan(y))
+    return x[keep], y[keep]
+
+
+def lttb(x: np.ndarray, y: np.ndarray, n: int):
+    """Largest-Triangle-Three-Buckets: keeps the points that shape the curve.
+
+    The first and last points are always kept. Each bucket picks the point
+    making the largest triangle with the point kept before it and the
+    average of the next bucket. The bucket edges and every bucket's average
+    come out of one np.add.reduceat, only the pick itself stays a loop: it
+    depends on the point kept in the bucket before.
+    """
+    size = len(x)
+    if n >= size or n < 3:
+        return x, y
+    # n - 2 buckets between the end points, n < size keeps the edges strictly increasing
+    edges = np.linspace(1, size - 1, n - 1).astype(np.int64)
+    counts = np.diff(np.append(edges, size))
+    # averages of the bucket after each one, the last bucket's next is the last point
+    next_x = (np.add.reduceat(x, edges) / counts)[1:].tolist()
+    next_y = (np.add.reduceat(y, edges) / counts)[1:].tolist()
+    bounds = edges.tolist()
+    keep = [0]
+    a = 0
+    for i in range(n - 2):
+        lo, hi = bounds[i], bounds[i + 1]
+        ax, ay = x[a], y[a]
+        area = np.abs((ax - next_x[i]) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (next_y[i] - ay))
+        a = lo + int(area.argmax())
+        keep.append(a)
+    keep.append(size - 1)
+    return x[keep], y[keep]
+
+
+def minmax(x: np.ndarray, y: np.ndarray, n: int):
+    """First and last points plus the min and max of each bucket between, in time order, so no peak is ever lost"""
+    size = len(x)
+    if n >= size or n < 2:
+        return x, y
+    buckets = (n - 2) // 2
+    if buckets == 0:
+        keep = np.array([0, size - 1])
+        return x[keep], y[keep]
+    inner = size - 2
+    width = -(-inner // buckets)  # ceil
+    padded = np.full(buckets * width, np.nan)
+    padded[:inner] = y[1:-1]
+    grid = padded.reshape(buckets, width)
+    valid = ~np.all(np.isnan(grid), axis=1)
+    grid = grid[valid]
+    base = 1 + (np.arange(buckets) * width)[valid]
+    lo = base + np.nanargmin(grid, axis=1)
+    hi = base + np.nanargmax(grid, axis=1)
+    keep = np.unique(np.concatenate([[0, size - 1], lo, hi]))
+    return x[keep], y[keep]
+
+
+class ChartCache:
+    """Downsampled series per (report version, column, budget, method, window), LRU"""
+
+    def __init__(self, size: int = CACHE_SIZE):
+        self.size = size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def series(self, report, column: str, points: int, method: str = 'lttb', start: float = None, end: float = None) -> dict:
+        if column not in report.columns:
+            raise KeyError(column)
+        if method not in METHODS:
+            raise ValueError(f"Unknown method: {method}")
+        points = max(3, min(int(points), MAX_POINTS))
+
+        key = (str(report.path), getattr(report, 'stamp', None), column, points, method, start, end)
+        with self._lock:
+            cached = self._items.get(key)
+            if cached is not None:
+                self._items.move_to_end(key)
+                return cached
+
+        x, y = _clean(report.columns['elapsed_time'], report.columns[column])
+        order = np.argsort(x, kind='stable')
+        x, y = x[order], y[order]
+        # zooming in only pays for the window, at the full point budget
+        lo = 0 if start is None else int(np.searchsorted(x, start, side='left'))
+        hi = len(x) if end is None else int(np.searchsorted(x, end, side='right'))
+        x, y = x[lo:hi], y[lo:hi]
+        total = len(x)
+        if method == 'lttb':
+            x, y = lttb(x, y, points)
+        else:
+            x, y = minmax(x, y, points)
+
+        result = {
+            'column': column,
+            'method': method,
+            'start': start,
+            'end': end,
+            'total': total,
+            'points': len(x),
+            'x': x.tolist(),
+            'y': y.tolist(),
+        }
+        with self._lock:
+            self._items[key] = result
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+        return result
+
+
+chart_cache = ChartCache()
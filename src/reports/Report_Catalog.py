@@ -0,0 +1,172 @@
+# Report Catalog Module - RoboJar Automation
+# SQLite index of every report's header info, rescanned incrementally
+
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+from .Report_Parser import parse_report, DATA_DIR, REPORT_SUFFIXES
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+    id          TEXT PRIMARY KEY,
+    file        TEXT NOT NULL,
+    mtime_ns    INTEGER NOT NULL,
+    size        INTEGER NOT NULL,
+    generated   TEXT,
+    date        TEXT,
+    duration    REAL,
+    samples     INTEGER,
+    title       TEXT,
+    chemistry   TEXT,
+    dosage      TEXT,
+    coagulant   REAL,
+    polymer     REAL,
+    comments    TEXT,
+    error       TEXT
+);
+CREATE INDEX IF NOT EXISTS reports_chemistry ON reports(chemistry COLLATE NOCASE, coagulant);
+CREATE INDEX IF NOT EXISTS reports_date ON reports(date);
+"""
+
+FIELDS = ('id', 'file', 'date', 'duration', 'samples', 'title', 'chemistry', 'dosage', 'coagulant', 'polymer',
+          'comments', 'generated', 'error')
+RESCAN_INTERVAL = 5.0  # seconds, rescans asked for sooner than this are skipped
+
+
+def _iso_date(text: str) -> str:
+    """Report dates look like 2024-Jul-29, store them sortable"""
+    for fmt in ("%Y-%b-%d", "%Y-%m-%d", "%m/%d/%Y"):
+        try:
+            return datetime.strptime(text.strip(), fmt).strftime("%Y-%m-%d")
+        except ValueError:
+            continue
+    return text
+
+
+class ReportCatalog:
+    """Header info of every report in the data folder.
+
+    Files are only reparsed when their mtime or size changed since the last
+    scan, everything else is answered from the database.
+    """
+
+    def __init__(self, db_path: str = 'data//catalog.db', data_dir: str = DATA_DIR):
+        self.db_path = db_path
+        self.data_dir = Path(data_dir)
+        self._lock = threading.Lock()
+        self._last_scan = 0.0
+        self._ready = False
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._ready:
+            Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        if not self._ready:
+            conn.executescript(SCHEMA)
+            self._ready = True
+        return conn
+
+    def _files(self) -> dict:
+        """id -> path, the raw .xls wins over a csv export of the same report"""
+        files = {}
+        if not self.data_dir.exists():
+            return files
+        for suffix in REPORT_SUFFIXES:
+            for path in self.data_dir.iterdir():
+                if path.suffix.lower() == suffix and path.is_file():
+                    files.setdefault(path.stem, path)
+        return files
+
+    def rescan(self, force: bool = False) -> dict:
+        """Bring the catalog up to date with the data folder"""
+        counts = {"added": 0, "updated": 0, "removed": 0, "unchanged": 0, "failed": 0}
+        with self._lock:
+            if not force and time.monotonic() - self._last_scan < RESCAN_INTERVAL:
+                return counts
+            conn = self._connect()
+            try:
+                known = {row[0]: (row[1], row[2], row[3]) for row in
+                         conn.execute("SELECT id, file, mtime_ns, size FROM reports")}
+                files = self._files()
+                rows = []
+                for report_id, path in files.items():
+                    stat = path.stat()
+                    if known.get(report_id) == (path.name, stat.st_mtime_ns, stat.st_size):
+                        counts["unchanged"] += 1
+                        continue
+                    counts["updated" if report_id in known else "added"] += 1
+                    rows.append(self._entry(report_id, path, stat, counts))
+                removed = [(report_id,) for report_id in known if report_id not in files]
+                counts["removed"] = len(removed)
+                with conn:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO reports (id, file, mtime_ns, size, generated, date, duration, samples,"
+                        " title, chemistry, dosage, coagulant, polymer, comments, error)"
+                        " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                    conn.executemany("DELETE FROM reports WHERE id = ?", removed)
+            finally:
+                conn.close()
+            self._last_scan = time.monotonic()
+        return counts
+
+    def _entry(self, report_id: str, path: Path, stat, counts: dict) -> tuple:
+        try:
+            # not through report_cache: a rescan would keep every report's columns around
+            report = parse_report(path, report_id)
+        except Exception as e:
+            # keep the file in the catalog so it isn't reparsed until it changes
+            counts["failed"] += 1
+            return (report_id, path.name, stat.st_mtime_ns, stat.st_size,
+                    None, None, None, None, None, None, None, None, None, None, str(e))
+        info = report.protocol
+        return (report_id, path.name, stat.st_mtime_ns, stat.st_size, report.generated, _iso_date(report.date),
+                report.duration, report.samples, info['title'], info['chemistry'], info['dosage'],
+                info['coagulant'], info['polymer'], info['comments'], None)
+
+    def query(self, chemistry: str = None, min_coagulant: float = None, max_coagulant: float = None,
+              min_polymer: float = None, max_polymer: float = None, date_from: str = None, date_to: str = None,
+              search: str = None, limit: int = 100, offset: int = 0) -> list:
+        """Reports matching every given filter, newest first.
+
+        e.g. query(chemistry="Alum/PolyDADMAC", min_coagulant=20)
+        """
+        clauses = ["error IS NULL"]
+        params = []
+        if chemistry is not None:
+            clauses.append("chemistry = ? COLLATE NOCASE")
+            params.append(chemistry)
+        for column, op, value in (("coagulant", ">=", min_coagulant), ("coagulant", "<=", max_coagulant),
+                                  ("polymer", ">=", min_polymer), ("polymer", "<=", max_polymer),
+                                  ("date", ">=", date_from), ("date", "<=", date_to)):
+            if value is not None:
+                clauses.append(f"{column} {op} ?")
+                params.append(value)
+        if search:
+            clauses.append("(title LIKE ? OR comments LIKE ? OR chemistry LIKE ? OR id LIKE ?)")
+            params.extend([f"%{search}%"] * 4)
+        params.extend([limit, offset])
+
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                f"SELECT {', '.join(FIELDS)} FROM reports WHERE {' AND '.join(clauses)}"
+                " ORDER BY date DESC, id LIMIT ? OFFSET ?", params).fetchall()
+        finally:
+            conn.close()
+        return [dict(zip(FIELDS, row)) for row in rows]
+
+    def failed(self) -> list:
+        """Reports that could not be parsed"""
+        conn = self._connect()
+        try:
+            return [{"id": r, "file": f, "error": e} for r, f, e in
+                    conn.execute("SELECT id, file, error FROM reports WHERE error IS NOT NULL ORDER BY id")]
+        finally:
+            conn.close()
+
+
+catalog = ReportCatalog()
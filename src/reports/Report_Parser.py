@@ -0,0 +1,236 @@
+# Report Parser Module - RoboJar Automation
+# Parses RoboJar reports (.xls or csv) into NumPy columns, once per file version
+
+import csv
+import json
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+DATA_DIR = 'data'
+REPORT_SUFFIXES = ('.xls', '.csv')
+CACHE_SIZE = 16   # parsed reports kept, each holds its full columns
+
+# column key -> start of the header cell in the measurement table
+COLUMNS = {
+    'elapsed_time': 'Elapsed Time',
+    'floc_count': 'Floc Count',
+    'mean_diameter': 'Mean Diameter',
+    'mean_volume': 'Mean Volume',
+    'vol_concentration': 'Vol. Concentration',
+    'rpm': 'RPM',
+    'g_value': 'G value',
+    'samples': 'Number of Samples',
+}
+
+
+def parse_protocol(text: str) -> dict:
+    """Split "Protocol Title: .. | Run Chemistry: .. | Run Dosage: 25.5/0.95 ppm | Comments: .."."""
+    info = {'title': '', 'chemistry': '', 'dosage': '', 'comments': '', 'coagulant': None, 'polymer': None}
+    keys = {'Protocol Title:': 'title', 'Run Chemistry:': 'chemistry', 'Run Dosage:': 'dosage', 'Comments:': 'comments'}
+    for part in text.split('|'):
+        part = part.strip()
+        for prefix, key in keys.items():
+            if part.startswith(prefix):
+                info[key] = part[len(prefix):].strip()
+    dose = info['dosage'].split()[0] if info['dosage'] else ''
+    if '/' in dose:
+        coagulant, polymer = dose.split('/', 1)
+        info['coagulant'] = _float_or_none(coagulant)
+        info['polymer'] = _float_or_none(polymer)
+    elif dose:
+        info['coagulant'] = _float_or_none(dose)
+    return info
+
+
+def _float_or_none(text: str) -> Optional[float]:
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def _to_float(values: list) -> np.ndarray:
+    """Strings to float64 in one pass, blanks and junk become NaN"""
+    arr = np.array(values, dtype=object)
+    blank = (arr == '') | (arr == None)  # noqa: E711 elementwise
+    arr[blank] = 'nan'
+    try:
+        return arr.astype(np.float64)
+    except ValueError:
+        return np.array([_float_or_none(str(v)) if v is not None else None for v in arr], dtype=np.float64)
+
+
+def read_rows(path: Path):
+    """Rows of a report as lists of strings, from the raw .xls or any csv export of it"""
+    if path.suffix.lower() == '.xls':
+        import xlrd
+        book = xlrd.open_workbook(str(path), on_demand=True)
+        try:
+            sheet = book.sheet_by_index(0)
+            for r in range(sheet.nrows):
+                row = []
+                for cell in sheet.row(r):
+                    value = cell.value
+                    if cell.ctype == xlrd.XL_CELL_NUMBER and value.is_integer():
+                        value = int(value)
+                    row.append(str(value) if value != '' else '')
+                yield row
+        finally:
+            book.release_resources()
+    else:
+        with path.open('r', newline='', encoding='utf-8', errors='replace') as f:
+            yield from csv.reader(f)
+
+
+class Report:
+    """Header info and measurement columns of one RoboJar report"""
+
+    def __init__(self, report_id: str, path: Path):
+        self.id = report_id
+        self.path = path
+        self.generated = ''
+        self.protocol = parse_protocol('')
+        self.dates = []
+        self.times = []
+        self.columns = {}
+        self.stamp = None  # (mtime_ns, size) of the file this was parsed from
+        self._json = None
+
+    @property
+    def samples(self) -> int:
+        return len(self.columns.get('elapsed_time', ()))
+
+    @property
+    def duration(self) -> float:
+        elapsed = self.columns.get('elapsed_time')
+        if elapsed is None or not len(elapsed):
+            return 0.0
+        return float(np.nanmax(elapsed) - np.nanmin(elapsed))
+
+    @property
+    def date(self) -> str:
+        return self.dates[0] if self.dates else ''
+
+    def info(self) -> dict:
+        return {
+            'id': self.id,
+            'file': self.path.name,
+            'generated': self.generated,
+            'date': self.date,
+            'duration': self.duration,
+            'samples': self.samples,
+            **self.protocol,
+        }
+
+    def to_dict(self) -> dict:
+        columns = {}
+        for key, values in self.columns.items():
+            # NaN isn't valid JSON
+            columns[key] = np.where(np.isnan(values), None, values).tolist()
+        return {**self.info(), 'dates': self.dates, 'times': self.times, 'columns': columns}
+
+    def json(self) -> bytes:
+        """Serialized to_dict(), built once per parse"""
+        if self._json is None:
+            self._json = json.dumps(self.to_dict(), separators=(',', ':')).encode('utf-8')
+        return self._json
+
+
+def parse_report(path: Path, report_id: str = None) -> Report:
+    report = Report(report_id or path.stem, path)
+    rows = read_rows(path)
+
+    # header section: "RoboJar Report | Generated: ..", the protocol line, then the table header
+    header = None
+    for row in rows:
+        cells = [c.strip() for c in row]
+        for cell in cells:
+            if cell.startswith('RoboJar Report') and 'Generated:' in cell:
+                report.generated = cell.split('Generated:', 1)[1].strip()
+            elif cell.startswith('Protocol Title:'):
+                report.protocol = parse_protocol(cell)
+        if any(cell.startswith('Elapsed Time') for cell in cells):
+            header = cells
+            break
+    if header is None:
+        raise ValueError(f"{path.name} has no measurement table")
+
+    index = {}
+    for key, prefix in COLUMNS.items():
+        for i, cell in enumerate(header):
+            if cell.startswith(prefix):
+                index[key] = i
+                break
+    date_col = header.index('Date') if 'Date' in header else None
+    time_col = header.index('Time') if 'Time' in header else None
+    elapsed_col = index['elapsed_time']
+
+    raw = {key: [] for key in index}
+    for row in rows:
+        if len(row) <= elapsed_col or row[elapsed_col].strip() == '':
+            continue
+        for key, i in index.items():
+            raw[key].append(row[i].strip() if i < len(row) else '')
+        if date_col is not None:
+            report.dates.append(row[date_col])
+        if time_col is not None:
+            report.times.append(row[time_col])
+
+    report.columns = {key: _to_float(values) for key, values in raw.items()}
+    return report
+
+
+class ReportCache:
+    """Parsed reports by path, reparsed only when the file's mtime or size changes, LRU"""
+
+    def __init__(self, data_dir: str = DATA_DIR, size: int = CACHE_SIZE):
+        self.data_dir = Path(data_dir)
+        self.size = size
+        self._reports = OrderedDict()
+        self._lock = threading.Lock()
+
+    def find(self, report_id: str) -> Optional[Path]:
+        """Path of report `report_id` (the file name without extension), raw .xls first"""
+        if not report_id or '/' in report_id or '\\' in report_id or report_id.startswith('.'):
+            return None
+        for suffix in REPORT_SUFFIXES:
+            path = self.data_dir / f"{report_id}{suffix}"
+            if path.is_file():
+                return path
+        return None
+
+    def list_ids(self) -> list:
+        if not self.data_dir.exists():
+            return []
+        return sorted({p.stem for p in self.data_dir.iterdir() if p.suffix.lower() in REPORT_SUFFIXES})
+
+    def get_path(self, path: Path, report_id: str = None) -> Report:
+        stat = path.stat()
+        key = str(path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            cached = self._reports.get(key)
+            if cached is not None and cached[0] == stamp:
+                self._reports.move_to_end(key)
+                return cached[1]
+        report = parse_report(path, report_id)
+        report.stamp = stamp
+        with self._lock:
+            self._reports[key] = (stamp, report)
+            self._reports.move_to_end(key)
+            while len(self._reports) > self.size:
+                self._reports.popitem(last=False)
+        return report
+
+    def get(self, report_id: str) -> Optional[Report]:
+        path = self.find(report_id)
+        if path is None:
+            return None
+        return self.get_path(path, report_id)
+
+
+report_cache = ReportCache()
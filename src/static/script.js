@@ -33,26 +33,46 @@ function updateStatusBox() {
     fetch('/status')
         .then(response => response.json())
         .then(data => {
-            // Update pump status
-            updateStatus('pump', data.pump.state);
-            
-            // Update sensor status
-            updateStatus('sensor', data.sensor.state);
-            
-            // Update valve statuses
-            updateStatus('valve1', data.valves['1'].state);
-            updateStatus('valve2', data.valves['2'].state);
-            updateStatus('valve3', data.valves['3'].state);
-
-            // Update timestamp
-            const now = new Date().toLocaleTimeString();
-            document.getElementById('last-updated-time').textContent = now;
+            applySnapshot(data);
         })
         .catch(error => {
             console.error('Error fetching status:', error);
         });
 }
 
+// Update every status box from a full system status
+function applySnapshot(data) {
+    // Update pump status
+    updateStatus('pump', data.pump.state);
+    
+    // Update sensor status
+    updateStatus('sensor', data.sensor.state);
+    
+    // Update valve statuses
+    for (const [number, valve] of Object.entries(data.valves)) {
+        updateStatus('valve' + number, valve.state);
+    }
+
+    updateTimestamp();
+}
+
+// Update one status box from a pushed change
+function applyDelta(delta) {
+    if (delta.device === 'pump') {
+        updateStatus('pump', delta.status.state);
+    } else if (delta.device === 'sensor') {
+        updateStatus('sensor', delta.status.state);
+    } else if (delta.device === 'valve') {
+        updateStatus('valve' + delta.valve_number, delta.status.state);
+    }
+    updateTimestamp();
+}
+
+function updateTimestamp() {
+    const now = new Date().toLocaleTimeString();
+    document.getElementById('last-updated-time').textContent = now;
+}
+
 function updateStatus(component, state) {
     const element = document.getElementById('status-' + component);
     if (element) {
@@ -67,8 +87,39 @@ function updateStatus(component, state) {
     }
 }
 
-// Update status every 1 second
-setInterval(updateStatusBox, 1000);
+let statusPoll = null;
+
+function startPolling() {
+    if (statusPoll === null) {
+        statusPoll = setInterval(updateStatusBox, 1000);
+    }
+}
+
+function stopPolling() {
+    if (statusPoll !== null) {
+        clearInterval(statusPoll);
+        statusPoll = null;
+    }
+}
+
+// Status is pushed by the server, polling is only the fallback
+function startStatusStream() {
+    if (!window.EventSource) {
+        startPolling();
+        return;
+    }
+    const source = new EventSource('/events');
+    source.addEventListener('snapshot', event => {
+        stopPolling();
+        applySnapshot(JSON.parse(event.data).status);
+    });
+    source.addEventListener('delta', event => {
+        applyDelta(JSON.parse(event.data));
+    });
+    // EventSource reconnects on its own, poll until it does
+    source.onerror = () => startPolling();
+}
 
 // Initial update when page loads
-updateStatusBox();
\ No newline at end of file
+updateStatusBox();
+startStatusStream();
\ No newline at end of file
@@ -2,6 +2,8 @@
 let chart;
 let csvData = [];
 let protocolInfo = {};
+let serverReportId = null;
+let zoomTimer = null;
 
 // Load CSV from file input
 function loadUploadedFile() {
@@ -126,15 +128,55 @@ function extractValue(str, key) {
     return str.substring(index + key.length).trim();
 }
 
-// Update the chart with CSV data
-function updateChart() {
+// Load a report's chart from the server, downsampled to roughly one point per pixel
+async function loadReportChart(reportId, start, end) {
+    serverReportId = reportId;
+    const width = document.getElementById('testChart').clientWidth || 1000;
+    const params = new URLSearchParams({
+        column: 'vol_concentration',
+        points: Math.max(100, Math.round(width)),
+        method: 'lttb'
+    });
+    if (start !== undefined) params.set('start', start);
+    if (end !== undefined) params.set('end', end);
+
+    try {
+        const response = await fetch(`/reports/${encodeURIComponent(reportId)}/chart?${params}`);
+        if (!response.ok) {
+            throw new Error(`HTTP ${response.status}`);
+        }
+        const data = await response.json();
+        updateChart(data.x.map((x, i) => ({x: x, y: data.y[i]})));
+    } catch (error) {
+        console.error('Error loading report chart:', error);
+    }
+}
+
+// Zoom into a time window, fetching a finer slice for just that window
+function zoomChart(start, end) {
+    if (serverReportId) {
+        loadReportChart(serverReportId, start, end);
+    }
+}
+
+// Called by the zoom plugin after a wheel or drag zoom, waits for the wheel to settle
+function onChartZoom({chart}) {
+    clearTimeout(zoomTimer);
+    zoomTimer = setTimeout(() => zoomChart(chart.scales.x.min, chart.scales.x.max), 250);
+}
+
+// Update the chart with CSV data (or points already prepared by the server)
+function updateChart(chartData) {
     const ctx = document.getElementById('testChart').getContext('2d');
     
     // Prepare data for the chart - using Volume Concentration as the Y-axis
-    const chartData = csvData.map(row => ({
-        x: row.elapsedTime,
-        y: row.volConcentration
-    }));
+    if (chartData === undefined) {
+        serverReportId = null;  // local csv, zooming stays in the browser
+        chartData = csvData.map(row => ({
+            x: row.elapsedTime,
+            y: row.volConcentration
+        }));
+    }
     
     console.log('Chart data points:', chartData.length);
     
@@ -170,6 +212,14 @@ function updateChart() {
                             return 'Vol. Conc: ' + context.parsed.y.toFixed(4) + ' mm³/L';
                         }
                     }
+                },
+                zoom: {
+                    zoom: {
+                        wheel: { enabled: true },
+                        drag: { enabled: true },
+                        mode: 'x',
+                        onZoomComplete: onChartZoom
+                    }
                 }
             },
             scales: {
@@ -337,6 +387,21 @@ function loadDemoData() {
 window.addEventListener('DOMContentLoaded', function() {
     // Initialize with empty chart
     initializeEmptyChart();
+
+    // /generalInterface?report=<id> charts a report straight from the server
+    const reportId = new URLSearchParams(window.location.search).get('report');
+    if (reportId) {
+        loadReportChart(reportId);
+    }
+
+    // Double click goes back to the whole run
+    document.getElementById('testChart').addEventListener('dblclick', function() {
+        if (serverReportId) {
+            zoomChart();
+        } else if (chart && chart.resetZoom) {
+            chart.resetZoom();
+        }
+    });
     
     // Don't load anything automatically - wait for user to upload CSV
     // Or uncomment the line below if you want to auto-load from a URL
@@ -0,0 +1,22 @@
+# Test setup - RoboJar Automation
+# The app runs from src/, so tests import controls.* from there and log into a scratch folder
+
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+SRC_DIR = Path(__file__).resolve().parent.parent / "src"
+sys.path.insert(0, str(SRC_DIR))
+
+os.environ.setdefault("ROBOJAR_MODBUS_PORT", "0")   # tests start their own bridge when they need one
+os.environ.setdefault("ROBOJAR_HARDWARE", "sim")
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    """Every test runs in its own directory with an empty Logs/"""
+    (tmp_path / "Logs").mkdir()
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
@@ -0,0 +1,28 @@
+import asyncio
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+
+
+def test_status_etag_answers_304_until_something_changes():
+    import app as app_module   # after the chdir, the app's controller logs into the scratch folder
+
+    async def run():
+        system = app_module.system
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app_module.app), base_url="http://t") as client:
+            first = await client.get("/status")
+            assert first.status_code == 200
+            etag = first.headers["etag"]
+            assert (await client.get("/status", headers={"If-None-Match": etag})).status_code == 304
+            assert (await client.get("/status", headers={"If-None-Match": f'"other", W/{etag}'})).status_code == 304
+
+            system.sensor_active = not system.sensor_active
+            try:
+                changed = await client.get("/status", headers={"If-None-Match": etag})
+                assert changed.status_code == 200
+                assert changed.headers["etag"] != etag
+            finally:
+                system.sensor_active = not system.sensor_active
+
+    asyncio.run(run())
@@ -0,0 +1,35 @@
+import shutil
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("xlrd")
+
+import convert
+
+DATA_DIR = Path(__file__).resolve().parent.parent / "src" / "data"
+
+
+def test_manifest_hash_comes_from_the_converted_bytes(workdir):
+    src = workdir / "real.xls"
+    shutil.copy(DATA_DIR / "real.xls", src)
+    result = convert.convert_file(str(src), str(workdir / "out"), ("csv",))
+    assert result["hash"] == convert.file_hash(src)
+    assert result["rows"] > 0
+
+
+def test_columnar_keeps_cells_under_their_header(workdir):
+    parquet = pytest.importorskip("pyarrow.parquet")
+
+    rows = iter([
+        ["RoboJar Report | Generated: today", "", ""],
+        ["", "Date", "", "Elapsed Time (s)", "RPM"],   # blank cells before and between headers
+        ["", "2024-Jul-29", "", 0, 200],
+        ["", "2024-Jul-29", "", 5, 210],
+    ])
+    target = workdir / "report.parquet"
+    assert convert.write_columnar(rows, target, "parquet") == 2
+    table = parquet.read_table(target)
+    assert table.column_names == ["Date", "Elapsed Time (s)", "RPM"]
+    assert table.column("Elapsed Time (s)").to_pylist() == [0.0, 5.0]
+    assert table.column("RPM").to_pylist() == [200.0, 210.0]
@@ -0,0 +1,28 @@
+import csv
+from datetime import datetime, timedelta
+
+from controls.Log_Segments import PAST_END_ROWS, query_segments
+
+
+START = datetime(2026, 1, 1, 10, 0, 0)
+
+
+def stamp(seconds: int) -> str:
+    return (START + timedelta(seconds=seconds)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def write_log(path, times):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Time", "Name", "Status", "Notes"])
+        for i, time_str in enumerate(times):
+            writer.writerow([time_str, f"Device {i}", "OPEN", ""])
+
+
+def test_rows_after_a_late_row_stay_in_the_window(workdir):
+    path = workdir / "Logs" / "Order_Log.csv"
+    # Device 5 (10:00:06) got written before Device 6 (10:00:05), which is still inside the window
+    seconds = [0, 1, 2, 3, 4, 6, 5] + list(range(7, 7 + PAST_END_ROWS + 5))
+    write_log(path, [stamp(s) for s in seconds])
+    rows = list(query_segments(str(path), stamp(2), stamp(5)))
+    assert [r["Name"] for r in rows] == ["Device 2", "Device 3", "Device 4", "Device 6"]
@@ -0,0 +1,92 @@
+import csv
+import os
+
+import pytest
+
+from controls.Event_Store import SqliteEventStore
+from controls.Log_Segments import RotationPolicy, compress_segment, query_segments, rotate, scan_segment
+from controls.Logging_System import LogWriter, StatusIndex, flush_logs, log_state_change
+
+FIELDS = ["Time", "Name", "Status", "Notes"]
+
+
+def read(path):
+    with open(path, newline="") as f:
+        return list(csv.DictReader(f))
+
+
+def rows(path):
+    flush_logs()
+    return read(path)
+
+
+def write_rows(path, rows):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(FIELDS)
+        for time_str, name, status in rows:
+            writer.writerow([time_str, name, status, ""])
+
+
+def test_status_index_follows_chdir(workdir):
+    path = "Logs//Chdir_Log.csv"
+    assert log_state_change(path, "Valve 1", "OPEN")
+    flush_logs()   # the writer opens relative paths when it writes
+    other = workdir / "other"
+    (other / "Logs").mkdir(parents=True)
+    os.chdir(other)
+    # same relative path, another file: its own index, so the row isn't deduped away
+    assert log_state_change(path, "Valve 1", "OPEN")
+    assert [r["Status"] for r in rows(path)] == ["OPEN"]
+
+
+def test_writer_flush_and_close_write_everything_queued_first(workdir):
+    path = str(workdir / "Logs" / "Writer_Log.csv")
+    writer = LogWriter(flush_interval=60)   # nothing reaches the file on its own
+    for i in range(3):
+        writer.write(path, {"Time": f"2026-01-01 10:00:0{i}", "Name": "Pump", "Status": str(i), "Notes": ""}, FIELDS)
+    assert writer.flush(5)
+    assert [r["Status"] for r in read(path)] == ["0", "1", "2"]
+
+    writer.write(path, {"Time": "2026-01-01 10:00:03", "Name": "Pump", "Status": "3", "Notes": ""}, FIELDS)
+    writer.close()
+    assert [r["Status"] for r in read(path)] == ["0", "1", "2", "3"]
+    # closed: flush answers at once instead of waiting on a thread that is gone
+    assert writer.flush(5)
+    with pytest.raises(RuntimeError):
+        writer.write(path, {"Time": "", "Name": "Pump", "Status": "4", "Notes": ""}, FIELDS)
+
+
+def test_status_index_falls_back_to_rotated_segment(workdir):
+    path = workdir / "Logs" / "Rotated_Log.csv"
+    write_rows(path, [("2026-01-01 10:00:00", "Valve 1", "OPEN"), ("2026-01-01 10:00:01", "Main Pump", "RUNNING")])
+    rotate(str(path), scan_segment(path), RotationPolicy(compress=False))
+    # the new active file only has the pump, the valve's status is in the segment
+    write_rows(path, [("2026-01-01 10:00:02", "Main Pump", "IDLE")])
+    index = StatusIndex(str(path))
+    assert index.get("Main Pump") == "IDLE"
+    assert index.get("Valve 1") == "OPEN"
+    assert index.get("Valve 2") is None
+
+
+def test_query_segments_reads_compressed_segments(workdir):
+    path = workdir / "Logs" / "Gzip_Log.csv"
+    write_rows(path, [(f"2026-01-01 10:00:0{i}", f"Device {i}", "OPEN") for i in range(5)])
+    segment = rotate(str(path), scan_segment(path), RotationPolicy())
+    assert compress_segment(segment).suffix == ".gz"
+    write_rows(path, [(f"2026-01-01 10:00:0{i}", f"Device {i}", "OPEN") for i in range(5, 10)])
+    rows = list(query_segments(str(path), "2026-01-01 10:00:02", "2026-01-01 10:00:07"))
+    assert [r["Name"] for r in rows] == [f"Device {i}" for i in range(2, 8)]
+
+
+def test_sqlite_query_sees_append_many_at_once(workdir):
+    store = SqliteEventStore(str(workdir / "Logs" / "events.db"), flush_interval=60)
+    try:
+        store.append_many([("SystemLog", {"Time": f"2026-01-01 10:00:0{i}", "Name": "Valve 1",
+                                          "Status": status, "Notes": ""})
+                           for i, status in enumerate(("OPENING", "OPEN"))])
+        events = store.query("SystemLog", device="Valve 1")
+        assert [e["Status"] for e in events] == ["OPENING", "OPEN"]
+        assert store.last_status("SystemLog", "Valve 1") == "OPEN"
+    finally:
+        store.close()
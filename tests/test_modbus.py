@@ -0,0 +1,140 @@
+import asyncio
+import socket
+
+import pytest
+
+pytest.importorskip("pymodbus")
+
+from controls.Controller import SystemController
+from controls.Modbus_Bridge import ModbusBridge, PUMP_CODES, VALVE_CODES
+from controls.Modbus_Poller import ModbusPoller, FieldDevice, Point
+from controls.Pump_State_Machine import PumpState
+from controls.Valve_State_Machine import ValveState
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def wait_for(condition, timeout: float = 5.0) -> None:
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not condition():
+        assert loop.time() < deadline, "timed out"
+        await asyncio.sleep(0.02)
+
+
+async def round_trip(points: list, run_for: float):
+    """Bridge in front of one controller, poller feeding a second one"""
+    served = SystemController(num_valves=3)
+    field = SystemController(num_valves=3)
+    port = free_port()
+    bridge = ModbusBridge(served, host="127.0.0.1", port=port)
+    poller = ModbusPoller(field.update_field,
+                          [FieldDevice("rig", "127.0.0.1", points, port=port, period=0.05, timeout=1.0)])
+    assert await bridge.start()
+    try:
+        await asyncio.sleep(0.1)   # let the server bind
+        served.pump.on_event(PumpState.RUNNING)
+        assert await poller.start()
+        await wait_for(lambda: "rig" in field.field)
+        await asyncio.sleep(run_for)
+        return served, field, poller.stats()["rig"]
+    finally:
+        await poller.stop()
+        await bridge.stop()
+        served.shutdown()
+        field.shutdown()
+
+
+def test_poller_reads_bridge():
+    points = [
+        Point("pump_on", "co", 8),
+        Point("valve1_code", "hr", 0),
+        Point("pump_code", "hr", 8),
+        Point("version", "ir", 10, count=2),
+    ]
+    served, field, stats = asyncio.run(round_trip(points, 0.2))
+    values = field.field["rig"]
+    assert values["pump_on"] is True
+    assert values["pump_code"] == PUMP_CODES.index(PumpState.RUNNING)
+    assert values["version"] == served.version
+    assert stats["errors"] == 0 and stats["read_errors"] == 0
+
+
+def test_invalid_address_keeps_good_blocks():
+    points = [
+        Point("pump_code", "hr", 8),
+        Point("missing", "hr", 50),   # past the bridge's tables, answered with an illegal address exception
+    ]
+    served, field, stats = asyncio.run(round_trip(points, 0.5))
+    assert field.field["rig"] == {"pump_code": PUMP_CODES.index(PumpState.RUNNING)}
+    assert stats["read_errors"] >= 2
+    # the connection stays up: no transport errors, no reconnect storm
+    assert stats["errors"] == 0
+    assert stats["reconnects"] == 0
+    assert stats["polls"] >= 5
+
+
+async def against_bridge(check):
+    """check(system, client) with a client connected to a bridge in front of a 3 valve controller"""
+    from pymodbus.client import AsyncModbusTcpClient
+    from controls.Devices import DeviceRegistry, SimBackend
+
+    system = SystemController(num_valves=3)
+    system.motion.registry = DeviceRegistry(SimBackend())
+    system.motion.travel_times = {1: 0.2}
+    port = free_port()
+    bridge = ModbusBridge(system, host="127.0.0.1", port=port)
+    assert await bridge.start()
+    client = AsyncModbusTcpClient("127.0.0.1", port=port)
+    try:
+        await asyncio.sleep(0.1)
+        assert await client.connect()
+        await check(system, client)
+    finally:
+        client.close()
+        await bridge.stop()
+        system.shutdown()
+
+
+async def assert_valve_travels(system):
+    # pymodbus versions without async_setValues answer before the worker ran the move
+    await wait_for(lambda: system.motion.servo(1).moves == 1)
+    # the valve only reports OPEN after its travel time
+    assert system.get_valve(1).state.name == "OPENING"
+    await wait_for(lambda: system.get_valve(1).state.name == "OPEN")
+    assert system.motion.timings[1] >= 0.2
+
+
+def test_coil_write_moves_valve_servo():
+    async def check(system, client):
+        assert not (await client.write_coil(0, True, slave=1)).isError()
+        await assert_valve_travels(system)
+
+    asyncio.run(against_bridge(check))
+
+
+def test_register_write_moves_valve_servo():
+    async def check(system, client):
+        # OPEN written straight away still waits for the servo
+        assert not (await client.write_register(0, VALVE_CODES.index(ValveState.OPEN), slave=1)).isError()
+        await assert_valve_travels(system)
+
+    asyncio.run(against_bridge(check))
+
+
+def test_write_to_missing_valve_is_illegal_address():
+    async def check(system, client):
+        for response in (await client.write_coil(5, True, slave=1),
+                         await client.write_register(5, VALVE_CODES.index(ValveState.OPEN), slave=1),
+                         await client.write_coils(2, [True, True], slave=1)):
+            assert response.isError()
+            assert response.exception_code == 2   # illegal data address
+        assert system.get_valve(3).state.name != "OPENING"
+        # reads of the whole table still work
+        assert not (await client.read_coils(0, count=10, slave=1)).isError()
+
+    asyncio.run(against_bridge(check))
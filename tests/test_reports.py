@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from reports.Downsample import lttb, minmax
+from reports.Report_Catalog import ReportCatalog
+from reports.Report_Parser import ReportCache, report_cache
+
+HEADER = ("Date,Time,Elapsed Time (s),Floc Count(per mL),Mean Diameter(μm),Mean Volume(mm3),"
+          "Vol. Concentration(mm3/L),RPM,G value (sec-1),Number of Samples")
+
+
+def write_report(folder, name: str, rows: int = 20):
+    folder.mkdir(exist_ok=True)
+    lines = ['"RoboJar Report | Generated: Fri Jan 30 14:31:23 MST 2026"',
+             "Protocol Title: Standard | Run Chemistry: Alum/PolyDADMAC | Run Dosage: 25.5/0.95 ppm | Comments: test",
+             HEADER]
+    lines += [f"2024-Jul-29,15:01:{i % 60:02d} MDT,{i},{i * 0.5},190,5e-3,37,200,345,61" for i in range(rows)]
+    path = folder / f"{name}.csv"
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return path
+
+
+def test_report_cache_is_lru(workdir):
+    data = workdir / "data"
+    for name in "abc":
+        write_report(data, name)
+    cache = ReportCache(str(data), size=2)
+    a = cache.get("a")
+    cache.get("b")
+    assert cache.get("a") is a     # a is now the most recent
+    cache.get("c")                 # evicts b
+    assert len(cache._reports) == 2
+    assert cache.get("a") is a
+    assert str(data / "b.csv") not in cache._reports
+
+
+def test_catalog_rescan_keeps_summaries_only(workdir):
+    data = workdir / "data"
+    for name in "abc":
+        write_report(data, name, rows=30)
+    catalog = ReportCatalog(str(workdir / "catalog.db"), str(data))
+    assert catalog.rescan(force=True)["added"] == 3
+    assert not any(key.startswith(str(data)) for key in report_cache._reports)
+    reports = catalog.query(chemistry="Alum/PolyDADMAC", min_coagulant=20)
+    assert sorted(r["id"] for r in reports) == ["a", "b", "c"]
+    assert all(r["samples"] == 30 for r in reports)
+
+
+@pytest.mark.parametrize("method", [lttb, minmax])
+@pytest.mark.parametrize("size,points", [(10, 3), (100, 7), (1000, 100), (5001, 1000)])
+def test_downsample_keeps_ends_within_budget(method, size, points):
+    rng = np.random.default_rng(size)
+    x = np.sort(rng.random(size)) * 100
+    y = rng.normal(size=size).cumsum()
+    dx, dy = method(x, y, points)
+    assert len(dx) == len(dy) <= points
+    assert (dx[0], dy[0]) == (x[0], y[0])
+    assert (dx[-1], dy[-1]) == (x[-1], y[-1])
+    assert np.all(np.diff(dx) >= 0)
@@ -0,0 +1,45 @@
+import asyncio
+import threading
+
+from controls.Controller import SystemController
+from controls.State_Engine import StateMachine
+
+
+def test_ticks_wait_for_the_device_lock(monkeypatch):
+    ticks = {"Valve 1": [], "Main Pump": [], "Level Sensor": []}
+    tick = StateMachine.tick
+
+    def recorded(machine):
+        ticks[machine.name].append(threading.current_thread())
+        tick(machine)
+    monkeypatch.setattr(StateMachine, "tick", recorded)
+
+    async def run():
+        system = SystemController(num_valves=1, tick_period=0.01)
+        held, release = threading.Event(), threading.Event()
+
+        def hold():
+            with system.device_lock("valve1"):
+                held.set()
+                release.wait()
+
+        holder = threading.Thread(target=hold)
+        holder.start()
+        held.wait()
+        await system.start_scheduler()
+        try:
+            await asyncio.sleep(0.1)
+            # the valve's tick waits behind the command holding its device, the pump keeps ticking
+            assert ticks["Valve 1"] == []
+            assert len(ticks["Main Pump"]) >= 3
+            release.set()
+            await asyncio.sleep(0.1)
+            assert ticks["Valve 1"]
+            assert threading.main_thread() not in ticks["Valve 1"] + ticks["Main Pump"]
+        finally:
+            release.set()
+            holder.join()
+            await system.stop_scheduler()
+            system.shutdown()
+
+    asyncio.run(run())
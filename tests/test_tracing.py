@@ -0,0 +1,44 @@
+from controls.State_Engine import StateMachine
+from controls.Tracing import Tracer, machine_specs
+from controls.Valve_State_Machine import CreateValveStateMachine, ValveState, VALVE_SPEC
+
+
+def spans_of(tracer):
+    return [(name, category, device, log_ns) for name, category, device, _, _, _, _, log_ns, _
+            in tracer.buffer.spans()]
+
+
+def test_transition_spans_nest_hooks_and_log_calls():
+    valve = CreateValveStateMachine("Trace Valve")
+    tracer = Tracer()
+    tracer.enable()
+    try:
+        assert valve.on_event(ValveState.OPENING)
+    finally:
+        tracer.disable()
+
+    spans = spans_of(tracer)
+    names = [name for name, *_ in spans]
+    # inner spans finish first: log calls, then their hook, then the transition
+    assert names.index("log_event") < names.index("enter log_enter") < names.index("transition")
+    transition = next(s for s in spans if s[0] == "transition")
+    logs = [s for s in spans if s[1] == "log"]
+    assert transition[2] == "Trace Valve"
+    assert transition[3] == sum(s[3] for s in logs)   # log time is only the log calls
+
+
+def test_disable_restores_originals():
+    transition = StateMachine.__dict__["transition"]
+    hooks = list(VALVE_SPEC.enter_hooks)
+    tracer = Tracer()
+    tracer.enable()
+    assert VALVE_SPEC.enter_hooks != hooks
+    added = lambda machine, state: None
+    VALVE_SPEC.on_enter(added)
+    tracer.disable()
+    try:
+        assert StateMachine.__dict__["transition"] is transition
+        assert VALVE_SPEC.enter_hooks == hooks + [added]
+        assert VALVE_SPEC in machine_specs()
+    finally:
+        VALVE_SPEC.enter_hooks.remove(added)